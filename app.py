@@ -1,22 +1,18 @@
 import dash
 import dash_bootstrap_components as dbc
-from dash import dcc, html, Input, Output
-import plotly.express as px
+from dash import dcc, html, dash_table, Input, Output, State, ClientsideFunction
 import os
-import pandas as pd
 
-from scraper_exploration import (
-    load_data,
-    get_global_values,
-    clean_numeric_column,
-    generate_treemap
-)
-from scraper_facts import fetch_asthma_data
-from data_exploration import (
-    load_data as load_asthma_data,
-    explore_risk_factors,
-    create_allergen_exposure_figure
-)
+from facts_snapshot import FactsStore
+from dataset_store import DatasetStore
+from histograms import histogram_figure
+from box_stats import box_figure
+from figure_cache import figure_cache
+from layout_cache import LayoutCache, serve_prerendered
+from http_caching import (ASSETS_IGNORE, cache_hashed_assets, code_version, compress_responses,
+                          conditional_responses, hashed_assets)
+from metrics import instrument_callbacks, instrument_server, register_collector, timed
+from risk_model import install_scoring_api
 
 # === STYLES GLOBAUX ===
 global_style = {
@@ -37,36 +33,99 @@ graph_style = {
 }
 
 # === APP INITIALIZATION ===
+# Local assets are linked by content hash (cached for a year) instead of modification time
+app_folder = os.path.dirname(os.path.abspath(__file__))
+assets = hashed_assets(os.path.join(app_folder, "assets"))
+
 app = dash.Dash(
     __name__,
-    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    external_stylesheets=[dbc.themes.BOOTSTRAP] + assets["stylesheets"],
+    external_scripts=assets["scripts"],
+    assets_ignore=ASSETS_IGNORE,
     suppress_callback_exceptions=True
 )
 
 server = app.server
-# === DATA LOADING AND PREPARATION ===
-asthma_facts = fetch_asthma_data()
 
-# 1) GBD Data (Global Burden of Disease)
-df = load_data("table_1_asthma_final_two_columns.csv")
-df["Number of deaths (thousands)"] = clean_numeric_column(df["Number of deaths (thousands)"])
-df["Number of prevalent cases (thousands)"] = clean_numeric_column(df["Number of prevalent cases (thousands)"])
-asthma_summary = get_global_values(df)
-df_sdi = df[df["SDI Category"].str.lower() != "global"].reset_index(drop=True)
+# === METRICS ===
+# Request latencies, sizes and Server-Timing headers; GET /metrics (Prometheus format).
+# Registered first so the measurements include the caching hooks below
+instrument_server(server)
+
+# === DATASETS ===
+# Figure artifacts, GBD totals and patients of the current version, reloaded in the
+# background when the CSVs change. Every request is pinned to the version current when
+# it starts, so the hooks below read the state through dataset_store.current()
+dataset_store = DatasetStore()
+dataset_store.install(server)
+
+# === HTTP CACHING ===
+# Registered before the page fast paths: conditional requests are answered first, and
+# ETags are set before compression tags the encoded body (after_request hooks run in
+# reverse order). Pages are tagged with the code, dataset and facts versions
+compress_responses(server)
+conditional_responses(server, lambda: f"{dataset_store.current().version}:{facts_store.version}",
+                      code_version(app_folder, os.path.join(app_folder, "assets")))
+cache_hashed_assets(server, assets["hashes"])
+
+
+# === SCORING API ===
+# POST /api/score: diagnosis probabilities of a batch of patient records (see risk_model.py)
+install_scoring_api(server)
+
+
+# === CACHE STATISTICS ===
+@server.route("/_cache/stats")
+def cache_stats():
+    return figure_cache.stats()
 
-# 2) Kaggle Data (individual patients)
-df_asthma = load_asthma_data()
 
-if df_asthma is None:
-    raise ValueError("Failed to load df_asthma. Check your CSV path in data_exploration.py.")
+register_collector(
+    "asthma_figure_cache",
+    "Figure cache counters of this worker (hits, misses, entries in memory).",
+    lambda: {(("counter", name),): value for name, value in figure_cache.stats().items()
+             if name in ("memory_hits", "disk_hits", "misses", "memory_entries")}
+)
+
+# === DATA LOADING AND PREPARATION ===
+# WHO facts come from the on-disk snapshot; a background thread re-scrapes it when stale
+with timed("startup:facts_snapshot"):
+    facts_store = FactsStore()
+facts_store.start_background_refresh()
 
-# Create risk factor and exposure figures
-fig_smoking, fig_pollution, fig_family = explore_risk_factors(df_asthma)
-fig_allergen = create_allergen_exposure_figure(df_asthma)
+# 1) Static figures and GBD totals, prebuilt by `python figure_artifacts.py build`
+# 2) Kaggle Data (individual patients), loaded on first use only
+with timed("startup:load_artifacts"):
+    dataset_store.load()
+dataset_store.start_watching()
 
-# Map ethnicity labels for other potential graphs
 ethnicity_labels = {0: "Caucasian", 1: "African American", 2: "Asian", 3: "Other"}
-df_asthma["ETHNICITY"] = df_asthma["ETHNICITY"].map(ethnicity_labels)
+gender_labels = {0: "Male", 1: "Female"}
+education_labels = {0: "None", 1: "High School", 2: "Bachelor's", 3: "Higher"}
+yes_no_labels = {0: "No", 1: "Yes"}
+
+
+def get_asthma_data():
+    """
+    Returns the patient dataset of the current version, loaded on first call
+    (importing pandas at that point) with the bitmap index used by the patient filters.
+    """
+    return dataset_store.current().patients()
+
+
+def patients_version():
+    """
+    Version of the patient dataset the figure cache entries are keyed on.
+    """
+    return dataset_store.current().patients_version
+
+
+def asthma_patients_version():
+    """
+    Version of the asthma patients (DIAGNOSIS=1), the only rows the demographic figures
+    read: appending patients without asthma keeps these figures cached.
+    """
+    return dataset_store.current().input_version(1)
 
 # === ICONS ===
 section_icons = {
@@ -78,22 +137,26 @@ section_icons = {
 }
 
 # === FACTS ACCORDION ===
-accordion_items = []
-for title in ["Overview", "Impact", "Symptoms", "Causes", "Treatment"]:
-    accordion_items.append(
-        dbc.AccordionItem(
-            asthma_facts.get(title, "Data not available."),
-            title=html.Div([
-                html.Img(src=section_icons[title], height="30px", style={"marginRight": "10px"}),
-                html.Span(title)
-            ], style={"display": "flex", "alignItems": "center"})
+def build_accordion(asthma_facts):
+    """
+    Builds the WHO facts accordion from the current snapshot sections.
+    """
+    accordion_items = []
+    for title in ["Overview", "Impact", "Symptoms", "Causes", "Treatment"]:
+        accordion_items.append(
+            dbc.AccordionItem(
+                asthma_facts.get(title, "Data not available."),
+                title=html.Div([
+                    html.Img(src=section_icons[title], height="30px", style={"marginRight": "10px"}),
+                    html.Span(title)
+                ], style={"display": "flex", "alignItems": "center"})
+            )
         )
+    return dbc.Accordion(
+        accordion_items,
+        start_collapsed=True,
+        style={"fontSize": "18px", "padding": "15px"}
     )
-accordion = dbc.Accordion(
-    accordion_items,
-    start_collapsed=True,
-    style={"fontSize": "18px", "padding": "15px"}
-)
 
 # === "ABOUT THE DATASET" MODAL ===
 modal = dbc.Modal(
@@ -146,18 +209,13 @@ modal = dbc.Modal(
 )
 
 
-# === CALLBACK: OPEN/CLOSE THE MODAL ===
-@app.callback(
+# === CALLBACK: OPEN/CLOSE THE MODAL (client-side, assets/clientside.js) ===
+app.clientside_callback(
+    ClientsideFunction(namespace="asthma", function_name="toggle_modal"),
     Output("modal", "is_open"),
     [Input("open-modal", "n_clicks"), Input("close-modal", "n_clicks")],
     prevent_initial_call=True
 )
-def toggle_modal(n_open, n_close):
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        return False
-    button_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    return button_id == "open-modal"
 
 
 # =============================================================================
@@ -165,247 +223,539 @@ def toggle_modal(n_open, n_close):
 # =============================================================================
 
 # === HOME LAYOUT ===
-home_layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(
-            html.H1("Exploring the Impact of Asthma on Health",
-                    className="text-primary fw-bold",
-                    style={"fontSize": "45px", "textAlign": "left"})
-        ),
-        dbc.Col(
-            dbc.Button("About Dataset", id="open-modal", color="info", className="mt-3"),
-            style={"textAlign": "right"}
-        ),
-    ], className="mt-4 mb-3"),
-
-    modal,  # The modal component
-
-    dbc.Row([
-        dbc.Col(html.P(
-            "This application provides insights into asthma, analyzing its causes, symptoms, "
-            "and treatments across different populations. Using data from reputable sources, "
-            "we aim to uncover trends and disparities in asthma management.",
-            style={"fontSize": "18px", "maxWidth": "100%"}
-        ))
-    ]),
-    dbc.Row([
-        dbc.Col([
-            html.H3("Asthma Insights", className="text-dark fw-bold", style={"marginBottom": "15px"}),
-            accordion
-        ]),
-
-        dbc.Col([
-            dbc.Card(
-                dbc.CardBody([
-                    html.H5("Global Asthma Cases (2015)", className="card-title text-primary"),
-                    html.H2(f"{asthma_summary['cases']:,}K", className="display-3 text-primary fw-bold"),
-                    html.P("Total number of asthma cases worldwide", className="card-text"),
-                ]),
-                className="mb-4 shadow-sm",
-                style=card_style
+def build_home_layout():
+    """
+    Builds the home page, picking up the latest facts snapshot.
+    """
+    asthma_summary = dataset_store.current().artifacts["asthma_summary"]
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Exploring the Impact of Asthma on Health",
+                        className="text-primary fw-bold",
+                        style={"fontSize": "45px", "textAlign": "left"})
             ),
-            dbc.Card(
-                dbc.CardBody([
-                    html.H5("Global Asthma Deaths (2015)", className="card-title text-danger"),
-                    html.H2(f"{asthma_summary['deaths']:,}K", className="display-3 text-danger fw-bold"),
-                    html.P("Total number of deaths caused by asthma", className="card-text"),
-                ]),
-                className="shadow-sm",
-                style=card_style
+            dbc.Col(
+                dbc.Button("About Dataset", id="open-modal", color="info", className="mt-3"),
+                style={"textAlign": "right"}
             ),
+        ], className="mt-4 mb-3"),
+
+        modal,  # The modal component
+
+        dbc.Row([
+            dbc.Col(html.P(
+                "This application provides insights into asthma, analyzing its causes, symptoms, "
+                "and treatments across different populations. Using data from reputable sources, "
+                "we aim to uncover trends and disparities in asthma management.",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            ))
         ]),
-    ], className="mt-4"),
-], fluid=True)
+        dbc.Row([
+            dbc.Col([
+                html.H3("Asthma Insights", className="text-dark fw-bold", style={"marginBottom": "15px"}),
+                build_accordion(facts_store.get())
+            ]),
+
+            dbc.Col([
+                dbc.Card(
+                    dbc.CardBody([
+                        html.H5("Global Asthma Cases (2015)", className="card-title text-primary"),
+                        html.H2(f"{asthma_summary['cases']:,}K", className="display-3 text-primary fw-bold"),
+                        html.P("Total number of asthma cases worldwide", className="card-text"),
+                    ]),
+                    className="mb-4 shadow-sm",
+                    style=card_style
+                ),
+                dbc.Card(
+                    dbc.CardBody([
+                        html.H5("Global Asthma Deaths (2015)", className="card-title text-danger"),
+                        html.H2(f"{asthma_summary['deaths']:,}K", className="display-3 text-danger fw-bold"),
+                        html.P("Total number of deaths caused by asthma", className="card-text"),
+                    ]),
+                    className="shadow-sm",
+                    style=card_style
+                ),
+            ]),
+        ], className="mt-4"),
+    ], fluid=True)
 
-# === TREEMAP LAYOUT ===
-treemap_layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(
-            html.H1("Asthma Cases and Deaths by SDI Category (2015)",
-                    className="text-primary fw-bold",
-                    style={"marginBottom": "5px"}),
 
-        )
-    ], className="mt-2 mb-2"),
-
-    dbc.Row([
-        dbc.Col(html.P( "The Socio-Demographic Index (SDI) is a composite measure of a country's development, "
-            "combining income per capita, average years of schooling, and total fertility rate. "
-            "It categorizes regions into Low, Low-Middle, Middle, High-Middle, and High SDI categories.",
-            style={"fontSize": "18px", "maxWidth": "100%"}
-        ))
-    ], className="mb-4"),
-
-    dbc.Row([
-        dbc.Col(
-            dcc.Graph(
-                figure=generate_treemap(
-                    df_sdi,
-                    "Number of deaths (thousands)",
-                    "Reds",
-                    "Asthma-related Deaths by SDI Category (2015)"
+# === TREEMAP LAYOUT ===
+def build_treemap_layout():
+    """
+    Builds the treemap page from the prebuilt treemap figures.
+    """
+    artifacts = dataset_store.current().artifacts
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Asthma Cases and Deaths by SDI Category (2015)",
+                        className="text-primary fw-bold",
+                        style={"marginBottom": "5px"}),
+
+            )
+        ], className="mt-2 mb-2"),
+
+        dbc.Row([
+            dbc.Col(html.P( "The Socio-Demographic Index (SDI) is a composite measure of a country's development, "
+                "combining income per capita, average years of schooling, and total fertility rate. "
+                "It categorizes regions into Low, Low-Middle, Middle, High-Middle, and High SDI categories.",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            ))
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col(
+                dcc.Graph(
+                    figure=artifacts["treemap_deaths"],
+                    style={"height": "600px"}
                 ),
-                style={"height": "600px"}
             ),
-        ),
-        dbc.Col(
-            dcc.Graph(
-                figure=generate_treemap(
-                    df_sdi,
-                    "Number of prevalent cases (thousands)",
-                    "Blues",
-                    "Asthma Prevalent Cases by SDI Category (2015)"
+            dbc.Col(
+                dcc.Graph(
+                    figure=artifacts["treemap_cases"],
+                    style={"height": "600px"}
                 ),
-                style={"height": "600px"}
             ),
-        ),
-    ], className="mt-4"),
-], fluid=True)
+        ], className="mt-4"),
+    ], fluid=True)
+
 
 # === DEMOGRAPHICS LAYOUT ===
-demographics_layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(
-            html.H1("Asthma Demographics Analysis", className="text-primary fw-bold"),
-        )
-    ], className="mt-4 mb-3"),
-
-    dbc.Row([
-        dbc.Col(html.P(
-            "This dataset includes both asthmatic and non-asthmatic patients. "
-            "Here, we focus solely on those with asthma to analyze demographic distributions "
-            "and identify possible patterns and risk factors.",
-            style={"fontSize": "18px", "maxWidth": "100%"}
-        )),
-    ], className="mb-4"),
-
-    # Dropdown for demographic grouping
-    dbc.Row([
-        dbc.Col(html.Label("Grouped by:", className="fw-bold")),
-        dbc.Col(dcc.Dropdown(
-            id="demographic-choice",
-            options=[
-                {"label": "AGE", "value": "AGE"},
-                {"label": "GENDER", "value": "GENDER"},
-                {"label": "ETHNICITY", "value": "ETHNICITY"}
-            ],
-            value="AGE",
-            clearable=False,
-            style={"width": "60%"}
-        ), width=9),
-    ], className="mb-3"),
-
-    dbc.Row([
-        dbc.Col(dcc.Graph(id="demographic-graph"))
-    ], className="mt-4"),
-
-    # Internal navigation buttons (optional)
-    dbc.Row([
-        dbc.Col(
-            dbc.Button("⏪ Previous", id="prev-page", color="secondary", outline=True, size="lg"),
+def build_demographics_layout():
+    """
+    Builds the demographics page (its graph is filled by update_demographic_graph).
+    """
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Asthma Demographics Analysis", className="text-primary fw-bold"),
+            )
+        ], className="mt-4 mb-3"),
+
+        dbc.Row([
+            dbc.Col(html.P(
+                "This dataset includes both asthmatic and non-asthmatic patients. "
+                "Here, we focus solely on those with asthma to analyze demographic distributions "
+                "and identify possible patterns and risk factors.",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            )),
+        ], className="mb-4"),
+
+        # Dropdown for demographic grouping
+        dbc.Row([
+            dbc.Col(html.Label("Grouped by:", className="fw-bold")),
+            dbc.Col(dcc.Dropdown(
+                id="demographic-choice",
+                options=[
+                    {"label": "AGE", "value": "AGE"},
+                    {"label": "GENDER", "value": "GENDER"},
+                    {"label": "ETHNICITY", "value": "ETHNICITY"}
+                ],
+                value="AGE",
+                clearable=False,
+                style={"width": "60%"}
+            ), width=9),
+        ], className="mb-3"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="demographic-graph"))
+        ], className="mt-4"),
+
+        # Internal navigation buttons (optional)
+        dbc.Row([
+            dbc.Col(
+                dbc.Button("⏪ Previous", id="prev-page", color="secondary", outline=True, size="lg"),
 
-        ),
-        dbc.Col(
-            dbc.Button("🏠 Home", id="home-page", color="primary", size="lg"),
+            ),
+            dbc.Col(
+                dbc.Button("🏠 Home", id="home-page", color="primary", size="lg"),
+
+            ),
+        ], className="mt-4"),
+    ], fluid=True)
 
-        ),
-    ], className="mt-4"),
-], fluid=True)
 
 # === FACTORS LAYOUT (PAGE 4) ===
-factors_layout = dbc.Container([
-    dbc.Row([
-        dbc.Col(
-            html.H1("Factors Analysis", className="text-primary fw-bold"),
+# Density views of the factors page: x column, y column, label
+DENSITY_VIEWS = {
+    "lung": {"x": "LUNGFUNCTIONFVC", "y": "LUNGFUNCTIONFEV1", "label": "Lung function: FEV1 vs FVC"},
+    "bmi": {"x": "AGE", "y": "BMI", "label": "BMI vs Age"},
+}
 
-        )
-    ], className="mt-4 mb-3"),
+def build_factors_layout():
+    """
+    Builds the risk factors page from the prebuilt figures.
+    """
+    artifacts = dataset_store.current().artifacts
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Factors Analysis", className="text-primary fw-bold"),
+
+            )
+        ], className="mt-4 mb-3"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="fig-smoking", figure=artifacts["fig_smoking"])),
+            dbc.Col(dcc.Graph(id="fig-pollution", figure=artifacts["fig_pollution"])),
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="fig-family", figure=artifacts["fig_family"])),
+            dbc.Col(dcc.Graph(id="fig-allergen", figure=artifacts["fig_allergen"])),
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col(html.Label("Density view:", className="fw-bold"), width=2),
+            dbc.Col(dcc.Dropdown(
+                id="density-choice",
+                options=[{"label": view["label"], "value": key} for key, view in DENSITY_VIEWS.items()],
+                value="lung",
+                clearable=False,
+                style={"width": "60%"}
+            ), width=10),
+        ], className="mb-3"),
+
+        # Rasterized on the server for the current zoom window (filled by update_density_graph)
+        dbc.Row([
+            dbc.Col([
+                dcc.Graph(id="density-graph", style={"height": "550px"}),
+                dcc.Store(id="density-window"),
+            ]),
+        ], className="mb-5"),
+
+        dbc.Row([
+            dbc.Col(html.P(
+                "Here, we provide a closer look at specific risk factors related to asthma, "
+                "such as smoking habits, pollution exposure, family history, and allergen exposure.",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            )),
+        ], className="mb-4"),
+    ], fluid=True)
+
+
+# === RISK RATIOS LAYOUT ===
+def build_risks_layout():
+    """
+    Builds the risk ratios page from the prebuilt forest plot (see risk_measures.py).
+    """
+    artifacts = dataset_store.current().artifacts
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Risk Ratios", className="text-primary fw-bold"),
+            )
+        ], className="mt-4 mb-3"),
+
+        dbc.Row([
+            dbc.Col(html.P(
+                "Odds ratio, relative risk and difference in asthma prevalence between exposed and "
+                "unexposed patients, for every yes/no factor of the dataset. An interval crossing the "
+                "dashed line means the data cannot tell the factor apart from no effect.",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            )),
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="fig-forest", figure=artifacts["fig_forest"])),
+        ], className="mb-5"),
+    ], fluid=True)
+
+
+# === CORRELATIONS LAYOUT ===
+def build_correlations_layout():
+    """
+    Builds the correlations page; every matrix is a prebuilt figure (see correlations.py).
+    """
+    artifacts = dataset_store.current().artifacts
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Correlations", className="text-primary fw-bold"),
+            )
+        ], className="mt-4 mb-3"),
+
+        dbc.Row([
+            dbc.Col(html.P(
+                "Pairwise correlations between the numeric columns of the dataset. Pearson measures "
+                "linear relationships, Spearman any monotonic one (it compares the ranks of the values).",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            )),
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col(html.Label("Method:", className="fw-bold"), width=2),
+            dbc.Col(dcc.Dropdown(
+                id="correlation-method",
+                options=[{"label": "Pearson", "value": "pearson"}, {"label": "Spearman", "value": "spearman"}],
+                value="pearson",
+                clearable=False
+            ), width=4),
+            dbc.Col(html.Label("Patients:", className="fw-bold"), width=2),
+            dbc.Col(dcc.Dropdown(
+                id="correlation-diagnosis",
+                options=[{"label": "All", "value": "all"}, {"label": "Asthma", "value": "1"},
+                         {"label": "No Asthma", "value": "0"}],
+                value="all",
+                clearable=False
+            ), width=4),
+        ], className="mb-3"),
+
+        dbc.Row([
+            dbc.Col(dcc.Graph(id="correlation-graph", figure=artifacts["fig_correlation_pearson_all"])),
+        ], className="mb-5"),
+    ], fluid=True)
+
+
+# === PATIENTS LAYOUT ===
+def build_patients_layout():
+    """
+    Builds the patients page: a table paged and sorted on the server (filled by update_patient_table).
+    """
+    from dash.dash_table.Format import Format, Scheme
+    from patient_table import PAGE_SIZE
+
+    df = get_asthma_data()
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col(
+                html.H1("Patients", className="text-primary fw-bold"),
+            )
+        ], className="mt-4 mb-3"),
+
+        dbc.Row([
+            dbc.Col(html.P(
+                "Browse the patient records. Click a column header to sort on it; the filters above "
+                "restrict the patients shown.",
+                style={"fontSize": "18px", "maxWidth": "100%"}
+            )),
+        ], className="mb-4"),
+
+        dbc.Row([
+            dbc.Col(html.Div(id="patient-count", className="fw-bold mb-2")),
+        ]),
 
-    dbc.Row([
-        dbc.Col(dcc.Graph(figure=fig_smoking)),
-        dbc.Col(dcc.Graph(figure=fig_pollution)),
-    ], className="mb-5"),
+        dbc.Row([
+            dbc.Col(dash_table.DataTable(
+                id="patient-table",
+                # Numbers with 4 significant digits (text columns are shown as is)
+                columns=[{"name": column, "id": column, "type": "numeric",
+                          "format": Format(precision=4, scheme=Scheme.decimal_or_exponent)} for column in df.columns],
+                page_current=0,
+                page_size=PAGE_SIZE,
+                page_action="custom",
+                sort_action="custom",
+                sort_mode="single",
+                sort_by=[],
+                style_table={"overflowX": "auto"},
+                style_cell={"fontSize": "13px", "padding": "4px"},
+                style_header={"fontWeight": "bold"},
+            )),
+        ], className="mb-5"),
+    ], fluid=True)
+
+
+# === PATIENT FILTERS (DEMOGRAPHICS, FACTORS & PATIENTS) ===
+# The Kaggle dataset covers ages 5 to 79
+AGE_MIN, AGE_MAX = 5, 80
+
+FILTER_INPUTS = [
+    Input("filter-age", "value"),
+    Input("filter-gender", "value"),
+    Input("filter-ethnicity", "value"),
+    Input("filter-education", "value"),
+    Input("filter-smoking", "value"),
+    Input("filter-family", "value"),
+]
+
+
+def _filter_dropdown(filter_id, placeholder, labels):
+    return dcc.Dropdown(
+        id=filter_id,
+        options=[{"label": label, "value": value} for value, label in labels.items()],
+        multi=True,
+        placeholder=placeholder
+    )
 
-    dbc.Row([
-        dbc.Col(dcc.Graph(figure=fig_family)),
-        dbc.Col(dcc.Graph(figure=fig_allergen)),
-    ], className="mb-5"),
 
-    dbc.Row([
-        dbc.Col(html.P(
-            "Here, we provide a closer look at specific risk factors related to asthma, "
-            "such as smoking habits, pollution exposure, family history, and allergen exposure.",
-            style={"fontSize": "18px", "maxWidth": "100%"}
-        )),
-    ], className="mb-4"),
-], fluid=True)
+def build_filter_panel():
+    """
+    Builds the patient filters shared by the Demographics, Factors and Patients pages.
+    """
+    return dbc.Card(
+        dbc.CardBody([
+            dbc.Row([
+                dbc.Col(html.Label("Age range:", className="fw-bold"), width=2),
+                dbc.Col(dcc.RangeSlider(
+                    id="filter-age",
+                    min=AGE_MIN,
+                    max=AGE_MAX,
+                    step=1,
+                    value=[AGE_MIN, AGE_MAX],
+                    marks={age: str(age) for age in range(10, AGE_MAX + 1, 10)},
+                    tooltip={"placement": "bottom"}
+                ), width=10),
+            ], className="mb-2"),
+            dbc.Row([
+                dbc.Col(_filter_dropdown("filter-gender", "Gender", gender_labels)),
+                dbc.Col(_filter_dropdown("filter-ethnicity", "Ethnicity", ethnicity_labels)),
+                dbc.Col(_filter_dropdown("filter-education", "Education level", education_labels)),
+                dbc.Col(_filter_dropdown("filter-smoking", "Smoking", yes_no_labels)),
+                dbc.Col(_filter_dropdown("filter-family", "Family history", yes_no_labels)),
+            ]),
+        ]),
+        id="filter-panel",
+        className="mb-4 shadow-sm",
+        style={"display": "none"}
+    )
+
+
+def build_filters(age_range, genders, ethnicities, education, smoking, family):
+    """
+    Turns the filter control values into a filters dict (only the active filters).
+    """
+    filters = {}
+    if age_range and (age_range[0] > AGE_MIN or age_range[1] < AGE_MAX):
+        filters["AGE"] = {"min": age_range[0], "max": age_range[1]}
+    for column, values in [
+        ("GENDER", genders),
+        ("ETHNICITY", ethnicities),
+        ("EDUCATIONLEVEL", education),
+        ("SMOKING", smoking),
+        ("FAMILYHISTORYASTHMA", family),
+    ]:
+        if values:
+            filters[column] = sorted(values)
+    return filters
+
+
+# === PAGE LAYOUT CACHE ===
+# Pages are built on first visit and served as cached JSON afterwards
+PAGES = ["home", "treemap", "demographics", "factors", "risks", "correlations", "patients"]
+LAZY_PAGES = ["treemap", "demographics", "factors", "risks", "correlations", "patients"]
+
+layout_cache = LayoutCache(
+    {
+        "home": build_home_layout,
+        "treemap": build_treemap_layout,
+        "demographics": build_demographics_layout,
+        "factors": build_factors_layout,
+        "risks": build_risks_layout,
+        "correlations": build_correlations_layout,
+        "patients": build_patients_layout,
+    },
+    versions={
+        "home": lambda: f"{facts_store.version}:{dataset_store.current().version}",
+        "treemap": lambda: dataset_store.current().version,
+        "factors": lambda: dataset_store.current().version,
+        "risks": lambda: dataset_store.current().version,
+        "correlations": lambda: dataset_store.current().version,
+        "patients": lambda: dataset_store.current().version,
+    }
+)
 
 
 # =============================================================================
 #                         APP LAYOUT & NAVIGATION
 # =============================================================================
-app.layout = dbc.Container(
-    [
-        dcc.Location(id="url", refresh=False),
-        dbc.Tabs(
-            [
-                dbc.Tab(label="🏠 Home", tab_id="home"),
-                dbc.Tab(label="🌍 Treemap", tab_id="treemap"),
-                dbc.Tab(label="📊 Demographics", tab_id="demographics"),
-                dbc.Tab(label="🔎 Factors", tab_id="factors"),
-            ],
-            id="tabs",
-            active_tab="home"
-        ),
-        html.Div(id="page-content", children=home_layout, style=global_style),
-html.A(
-    html.Img(
-        src="https://cdn-icons-png.flaticon.com/512/25/25231.png",
-        style={"width": "40px", "height": "40px"}
-    ),
-    href="https://github.com/melamyay/asthma_dashboard",
-    target="_blank"
-)
-    ],
-    fluid=True
+def serve_layout():
+    """
+    Builds the app shell on each page load: every tab has its own page container,
+    the home page is filled with the latest facts and the others load on first visit.
+    """
+    return dbc.Container(
+        [
+            dcc.Location(id="url", refresh=False),
+            dbc.Tabs(
+                [
+                    dbc.Tab(label="🏠 Home", tab_id="home"),
+                    dbc.Tab(label="🌍 Treemap", tab_id="treemap"),
+                    dbc.Tab(label="📊 Demographics", tab_id="demographics"),
+                    dbc.Tab(label="🔎 Factors", tab_id="factors"),
+                    dbc.Tab(label="⚖️ Risk ratios", tab_id="risks"),
+                    dbc.Tab(label="🔗 Correlations", tab_id="correlations"),
+                    dbc.Tab(label="🧾 Patients", tab_id="patients"),
+                ],
+                id="tabs",
+                active_tab="home"
+            ),
+            html.Div(
+                [build_filter_panel()]
+                + [html.Div(id="page-home", children=layout_cache.get("home"))]
+                + [html.Div(id=f"page-{page}", style={"display": "none"}) for page in LAZY_PAGES]
+                + [dcc.Store(id=f"load-{page}") for page in LAZY_PAGES],
+                id="page-content",
+                style=global_style
+            ),
+            html.A(
+                html.Img(
+                    src="https://cdn-icons-png.flaticon.com/512/25/25231.png",
+                    style={"width": "40px", "height": "40px"}
+                ),
+                href="https://github.com/melamyay/asthma_dashboard",
+                target="_blank"
+            )
+        ],
+        fluid=True
 
-)
+    )
+
+
+app.layout = serve_layout
 
 # =============================================================================
 #                                CALLBACKS
 # =============================================================================
 
-# --- Callback: Update demographic graph based on dropdown selection ---
+# --- Callback: Update demographic graph based on dropdown selection and filters ---
 @app.callback(
     Output("demographic-graph", "figure"),
-    Input("demographic-choice", "value")
+    [Input("demographic-choice", "value")] + FILTER_INPUTS
 )
-def update_demographic_graph(choice):
+def update_demographic_graph(choice, *filter_values):
+    """
+    Updates the demographic graph based on the selected variable (AGE, GENDER, ETHNICITY)
+    and the patient filters.
+    """
+    return demographic_figure(choice, build_filters(*filter_values))
+
+
+@figure_cache.memoize("demographic_figure", asthma_patients_version, persist=lambda choice, filters: not filters)
+def demographic_figure(choice, filters):
     """
-    Updates the demographic graph based on the selected variable (AGE, GENDER, ETHNICITY).
+    Builds the demographic graph of the asthma patients matching the filters.
+    Figures are memoized per (choice, filters, asthma patients version) in the shared figure cache;
+    only unfiltered figures are written to disk.
     """
-    dff = df_asthma[df_asthma["DIAGNOSIS"] == 1]
+    df_asthma = get_asthma_data()
+    filters = dict(filters, DIAGNOSIS=1)
 
     if choice == "AGE":
-        return px.histogram(
-            dff,
-            x="AGE",
+        return histogram_figure(
+            df_asthma,
+            "AGE",
             nbins=20,
+            filters=filters,
             title="Age Distribution Among Asthma Patients",
-            color_discrete_sequence=["blue"]
+            color="blue"
         )
     elif choice == "GENDER":
-        return px.box(
-            dff,
-            x="GENDER",
-            y="AGE",
+        return box_figure(
+            df_asthma,
+            "AGE",
+            "GENDER",
+            filters=filters,
             title="Age Distribution by Gender (Asthma Patients)",
-            labels={"GENDER": "Gender (0=Male, 1=Female)", "AGE": "Age"},
-            color="GENDER"
+            labels={"GENDER": "Gender (0=Male, 1=Female)", "AGE": "Age"}
         )
     elif choice == "ETHNICITY":
-        count_df = dff["ETHNICITY"].value_counts().reset_index()
-        count_df.columns = ["Ethnicity", "Count"]
+        import plotly.express as px
+        from data_exploration import count_values
+
+        count_df = count_values(df_asthma, "ETHNICITY", filters, "Ethnicity")
+        count_df["Ethnicity"] = count_df["Ethnicity"].map(ethnicity_labels)
 
         fig = px.bar(
             count_df,
@@ -426,39 +776,223 @@ def update_demographic_graph(choice):
         return fig
 
     # Fallback in case of unexpected value
-    return px.histogram(dff, x="AGE")
+    return histogram_figure(df_asthma, "AGE", filters=filters)
 
 
-# --- Callback: Navigation using internal buttons (optional) ---
+def cached_demographic_json(inputs):
+    """
+    Serves a demographic figure already in the figure cache as its stored compact JSON
+    (typed-array encoded), skipping Dash's decode and re-encode. Returns None on a miss
+    so the Dash callback builds the figure.
+    """
+    choice, *filter_values = inputs
+    entry = figure_cache.lookup("demographic_figure", [choice, build_filters(*filter_values)],
+                                 asthma_patients_version())
+    return entry[0] if entry is not None else None
+
+
+demographic_fast_path = serve_prerendered(server, "demographic-graph", "figure", cached_demographic_json)
+
+
+# --- Callback: Update the factors graphs based on the filters ---
 @app.callback(
+    [Output("fig-smoking", "figure"), Output("fig-pollution", "figure"),
+     Output("fig-family", "figure"), Output("fig-allergen", "figure")],
+    FILTER_INPUTS
+)
+def update_factor_graphs(*filter_values):
+    """
+    Rebuilds the factors figures for the selected patients. Without filters the page
+    keeps its prebuilt figures and the server does no work.
+    """
+    filters = build_filters(*filter_values)
+    if not filters:
+        return [dash.no_update] * 4
+    return factor_figures(filters)
+
+
+@figure_cache.memoize("factor_figures", patients_version, persist=lambda filters: False)
+def factor_figures(filters):
+    """
+    Builds the four factors figures for the patients matching the filters
+    (kept in the in-memory figure cache only).
+    """
+    from data_exploration import explore_risk_factors, create_allergen_exposure_figure
+
+    df_asthma = get_asthma_data()
+    fig_smoking, fig_pollution, fig_family = explore_risk_factors(df_asthma, filters)
+    return [fig_smoking, fig_pollution, fig_family, create_allergen_exposure_figure(df_asthma, filters)]
+
+
+# --- Callback: Re-rasterize the density view on zoom ---
+def zoom_window(relayout, window):
+    """
+    Window [x_range, y_range] (None = full extent) after a relayout event.
+
+    Returns:
+        tuple: (window, changed); legend clicks and resizes leave the window unchanged.
+    """
+    window = list(window or [None, None])
+    changed = False
+    for i, axis in enumerate(["xaxis", "yaxis"]):
+        if relayout.get(f"{axis}.autorange"):
+            window[i] = None
+        elif f"{axis}.range[0]" in relayout:
+            window[i] = [relayout[f"{axis}.range[0]"], relayout[f"{axis}.range[1]"]]
+        elif f"{axis}.range" in relayout:
+            window[i] = list(relayout[f"{axis}.range"])
+        else:
+            continue
+        changed = True
+    return window, changed
+
+
+@app.callback(
+    [Output("density-graph", "figure"), Output("density-window", "data")],
+    [Input("density-choice", "value"), Input("density-graph", "relayoutData")] + FILTER_INPUTS,
+    State("density-window", "data")
+)
+def update_density_graph(view, relayout, *args):
+    """
+    Rasterizes the selected density view for the current zoom window. A new view or
+    new filters start from the full extent; zooming re-bins only the visible window,
+    so the response size depends on the pixel grid and not on the number of patients.
+    """
+    *filter_values, window = args
+    if dash.ctx.triggered_id == "density-graph":
+        window, changed = zoom_window(relayout or {}, window)
+        if not changed:
+            return dash.no_update, dash.no_update
+    else:
+        window = None
+    return density_view(view, window, build_filters(*filter_values)), window
+
+
+@figure_cache.memoize("density_figure", patients_version,
+                      persist=lambda view, window, filters: window is None and not filters)
+def density_view(view, window, filters):
+    """
+    Builds a density view; full-extent unfiltered views are kept in the shared cache,
+    zoomed ones in memory only.
+    """
+    from density import density_figure
+
+    spec = DENSITY_VIEWS.get(view, DENSITY_VIEWS["lung"])
+    x_range, y_range = window or [None, None]
+    return density_figure(
+        get_asthma_data(),
+        spec["x"],
+        spec["y"],
+        by="DIAGNOSIS",
+        x_range=x_range,
+        y_range=y_range,
+        filters=filters,
+        title=spec["label"],
+        group_labels={0: "No Asthma", 1: "Asthma"},
+    )
+
+
+# --- Callback: Switch the correlation matrix ---
+@app.callback(
+    Output("correlation-graph", "figure"),
+    [Input("correlation-method", "value"), Input("correlation-diagnosis", "value")],
+    prevent_initial_call=True
+)
+def update_correlation_graph(method, diagnosis):
+    """
+    Shows the prebuilt matrix of the selected method and patients (no computation).
+    """
+    artifacts = dataset_store.current().artifacts
+    return artifacts.get(f"fig_correlation_{method}_{diagnosis}", artifacts["fig_correlation_pearson_all"])
+
+
+# --- Callback: Serve a page of the patient table ---
+@app.callback(
+    [Output("patient-table", "data"), Output("patient-table", "page_count"),
+     Output("patient-table", "page_current"), Output("patient-count", "children")],
+    [Input("patient-table", "page_current"), Input("patient-table", "page_size"),
+     Input("patient-table", "sort_by")] + FILTER_INPUTS
+)
+def update_patient_table(page, page_size, sort_by, *filter_values):
+    """
+    Returns one page of the filtered patients. Pages are slices of per-column sort
+    indexes (see patient_table.py), so they take the same time at any dataset size.
+    A new sort or new filters go back to the first page.
+    """
+    from patient_table import patient_page
+
+    if dash.ctx.triggered_id != "patient-table" or "patient-table.sort_by" in dash.ctx.triggered_prop_ids:
+        page = 0
+    sort = sort_by[0] if sort_by else {}
+    records, total = patient_page(
+        get_asthma_data(),
+        sort.get("column_id"),
+        sort.get("direction", "asc") == "asc",
+        build_filters(*filter_values),
+        page or 0,
+        page_size,
+    )
+    return records, max(1, -(-total // page_size)), page or 0, f"{total:,} patients"
+
+
+# --- Callback: Navigation using internal buttons (client-side) ---
+app.clientside_callback(
+    ClientsideFunction(namespace="asthma", function_name="navigate_buttons"),
     Output("tabs", "active_tab"),
     [Input("prev-page", "n_clicks"), Input("home-page", "n_clicks")],
     prevent_initial_call=True
 )
-def navigate_buttons(prev_click, home_click):
-    ctx = dash.callback_context
-    if not ctx.triggered:
-        return dash.no_update
-    button_id = ctx.triggered[0]["prop_id"].split(".")[0]
-    if button_id == "prev-page":
-        return "treemap"
-    elif button_id == "home-page":
-        return "home"
-    return dash.no_update
-
-# --- Callback: Switch layout based on selected tab ---
-@app.callback(
-    Output("page-content", "children"),
-    Input("tabs", "active_tab")
+
+# --- Callback: Switch page based on selected tab (client-side) ---
+# Toggles page visibility in the browser and requests the content of a page on its first visit
+app.clientside_callback(
+    ClientsideFunction(namespace="asthma", function_name="switch_tab"),
+    [Output(f"page-{page}", "style") for page in PAGES]
+    + [Output("filter-panel", "style")]
+    + [Output(f"load-{page}", "data") for page in LAZY_PAGES],
+    Input("tabs", "active_tab"),
+    [State(f"page-{page}", "children") for page in LAZY_PAGES]
 )
-def switch_tab(active_tab):
-    if active_tab == "treemap":
-        return treemap_layout
-    elif active_tab == "demographics":
-        return demographics_layout
-    elif active_tab == "factors":
-        return factors_layout
-    return home_layout
+
+
+# --- Callback: Load a page's content on its first visit ---
+# Only data-dependent work reaches the server: update_demographic_graph and update_factor_graphs
+# (memoized, bitmap-indexed filters) and these one-time page loads, which are answered with the cached page JSON without going through Dash
+def register_page_loader(page):
+    @app.callback(
+        Output(f"page-{page}", "children"),
+        Input(f"load-{page}", "data"),
+        prevent_initial_call=True
+    )
+    def load_page(_):
+        return layout_cache.get(page)
+
+    return serve_prerendered(server, f"page-{page}", "children", lambda inputs: layout_cache.get_json(page))
+
+
+page_fast_paths = [register_page_loader(page) for page in LAZY_PAGES]
+
+# Record the duration of every server-side callback (figure build + serialization)
+instrument_callbacks(app)
+
+
+# === WARM THE FIGURE CACHE ===
+# Loads the demographic figures from the shared cache, building any that are missing
+def warm_figure_cache():
+    for demographic_choice in ["AGE", "GENDER", "ETHNICITY"]:
+        demographic_figure(demographic_choice, {})
+
+
+with timed("startup:warm_figure_cache"):
+    warm_figure_cache()
+
+
+# A reloaded dataset is published once its figures and the pages already served are ready
+@dataset_store.on_reload
+def warm_reloaded_dataset():
+    warm_figure_cache()
+    for page in layout_cache.built():
+        layout_cache.get_json(page)
 
 
 # === RUN THE APP ===
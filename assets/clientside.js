@@ -0,0 +1,48 @@
+// Client-side callbacks for pure UI state (modal, navigation, tab switching).
+// They run in the browser, so these interactions never reach the server.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    asthma: {
+        // Open the "About the Dataset" modal from its button, close it from "Close"
+        toggle_modal: function (nOpen, nClose) {
+            const triggered = window.dash_clientside.callback_context.triggered;
+            if (!triggered.length) {
+                return false;
+            }
+            return triggered[0].prop_id.split(".")[0] === "open-modal";
+        },
+
+        // Internal navigation buttons of the demographics page
+        navigate_buttons: function (prevClick, homeClick) {
+            const triggered = window.dash_clientside.callback_context.triggered;
+            if (!triggered.length) {
+                return window.dash_clientside.no_update;
+            }
+            const buttonId = triggered[0].prop_id.split(".")[0];
+            if (buttonId === "prev-page") {
+                return "treemap";
+            } else if (buttonId === "home-page") {
+                return "home";
+            }
+            return window.dash_clientside.no_update;
+        },
+
+        // Show the page of the active tab and hide the others, and show the patient filters
+        // on the pages they apply to. A lazy page that has no content yet gets a load
+        // request, which the server answers once per page.
+        switch_tab: function (activeTab, ...lazyChildren) {
+            const pages = ["home", "treemap", "demographics", "factors", "risks", "correlations", "patients"];
+            const lazyPages = ["treemap", "demographics", "factors", "risks", "correlations", "patients"];
+            if (!pages.includes(activeTab)) {
+                activeTab = "home";
+            }
+
+            const filteredPages = ["demographics", "factors", "patients"];
+            const styles = pages.map(page => ({display: page === activeTab ? "block" : "none"}));
+            styles.push({display: filteredPages.includes(activeTab) ? "block" : "none"});
+            const loadRequests = lazyPages.map((page, i) =>
+                page === activeTab && !lazyChildren[i] ? page : window.dash_clientside.no_update
+            );
+            return styles.concat(loadRequests);
+        }
+    }
+});
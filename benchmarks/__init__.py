@@ -0,0 +1,7 @@
+"""
+Performance benchmarks for the asthma dashboard.
+
+Run a benchmark from the repository root, e.g.:
+    python -m benchmarks.bench_loaders --rows 1000000
+    python -m benchmarks.suite --rows 10000 1000000 --compare benchmarks/baseline.json
+"""
@@ -0,0 +1,78 @@
+"""
+Compare the CSV loader with the memory-mapped columnar loader.
+
+Each loader runs in a fresh subprocess so its load time and peak resident memory are
+measured in isolation, the way a newly started gunicorn worker would see them.
+
+    python -m benchmarks.bench_loaders --rows 100000 1000000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import format_table, make_synthetic_frame
+from columnar_store import write_columnar
+
+_CHILD = """
+import json, sys, time
+from benchmarks.common import peak_rss_mb
+start = time.perf_counter()
+if sys.argv[1] == "csv":
+    import pandas as pd
+    df = pd.read_csv(sys.argv[2])
+else:
+    from columnar_store import load_columnar
+    df = load_columnar(sys.argv[2])
+# Touch one flag column, as the dashboard does when filtering on DIAGNOSIS
+n_asthma = int((df["DIAGNOSIS"] == 1).sum())
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "peak_rss_mb": peak_rss_mb(), "rows": len(df), "asthma": n_asthma}))
+"""
+
+
+def _run_loader(kind, path):
+    output = subprocess.run(
+        [sys.executable, "-c", _CHILD, kind, path],
+        check=True, capture_output=True, text=True, cwd=os.getcwd()
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _dir_size_mb(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path) / 1e6
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6
+
+
+def run(row_counts):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in row_counts:
+            df = make_synthetic_frame(n_rows)
+            csv_path = os.path.join(tmp, f"patients_{n_rows}.csv")
+            columnar_path = os.path.join(tmp, f"patients_{n_rows}.columnar")
+            df.to_csv(csv_path, index=False)
+            write_columnar(df, columnar_path, source_path=csv_path)
+            del df
+
+            for kind, path in [("csv", csv_path), ("columnar", columnar_path)]:
+                stats = _run_loader(kind, path)
+                results.append({
+                    "rows": n_rows,
+                    "loader": kind,
+                    "disk_mb": f"{_dir_size_mb(path):.1f}",
+                    "load_s": f"{stats['seconds']:.3f}",
+                    "peak_rss_mb": f"{stats['peak_rss_mb']:.0f}" if stats["peak_rss_mb"] else "n/a",
+                })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(format_table(run(args.rows), ["rows", "loader", "disk_mb", "load_s", "peak_rss_mb"]))
@@ -0,0 +1,73 @@
+"""
+Throughput of the patient scoring model and of the /api/score endpoint, in rows per second.
+
+For each dataset size, synthetic patients in the cleaned schema are scored:
+  - model: LogisticModel.score on an in-memory frame (the matrix product alone)
+  - csv:   POST /api/score with a CSV body, response read to the end
+  - json:  POST /api/score with a JSON array of records
+
+The endpoint runs on a bare Flask server with the model trained on the cleaned CSV,
+through Flask's test client (no network).
+
+    python -m benchmarks.bench_scoring --rows 10000 1000000
+"""
+import argparse
+
+import orjson
+from flask import Flask
+
+from benchmarks.common import format_table, make_synthetic_frame, time_call
+from risk_model import DATA_PATH, install_scoring_api, train_from_csv
+
+MODES = ["model", "csv", "json"]
+
+
+def run(row_counts, repeat=3, modes=MODES, model_path="/tmp/bench_risk_model.json"):
+    model = train_from_csv(DATA_PATH, model_path)
+    server = Flask(__name__)
+    install_scoring_api(server, model=model)
+    client = server.test_client()
+
+    def post(body, content_type):
+        response = client.post("/api/score", data=body, content_type=content_type)
+        assert response.status_code == 200, response.get_data()[:200]
+        return response.get_data()
+
+    results = []
+    for n_rows in row_counts:
+        df = make_synthetic_frame(n_rows, seed=1)
+        bodies = {}
+        if "csv" in modes:
+            bodies["csv"] = df.to_csv(index=False).encode("utf-8")
+        if "json" in modes:
+            bodies["json"] = orjson.dumps(df.to_dict("records"))
+
+        for mode in modes:
+            if mode == "model":
+                seconds, output = time_call(model.score, df, repeat=repeat)
+                size, out_size = df.memory_usage(index=False).sum(), output.nbytes
+            else:
+                content_type = "text/csv" if mode == "csv" else "application/json"
+                seconds, output = time_call(post, bodies[mode], content_type, repeat=repeat)
+                size, out_size = len(bodies[mode]), len(output)
+            results.append({
+                "rows": n_rows,
+                "mode": mode,
+                "seconds": f"{seconds:.3f}",
+                "rows_per_s": f"{n_rows / seconds:,.0f}",
+                "input_mb": f"{size / 1e6:.1f}",
+                "output_mb": f"{out_size / 1e6:.1f}",
+            })
+            print(f" {mode} @ {n_rows} rows: {n_rows / seconds:,.0f} rows/s")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    print(format_table(run(args.rows, args.repeat, args.modes),
+                       ["rows", "mode", "seconds", "rows_per_s", "input_mb", "output_mb"]))
@@ -0,0 +1,84 @@
+"""
+Compare figure serializers on the dashboard figures.
+
+For each dataset size, the figures returned by the app (risk factors, allergen exposure,
+demographic histogram and box plot, deaths treemap) are built once and encoded with:
+  - plotly-text:  Plotly's JSON encoder with arrays written as decimal text
+  - plotly:       plotly.io.json.to_json_plotly with the installed Plotly version
+  - figure_json:  typed-array packing + orjson (figure_json.dumps)
+
+    python -m benchmarks.bench_serialization --rows 10000 1000000 10000000
+"""
+import argparse
+import json
+
+from _plotly_utils.utils import PlotlyJSONEncoder
+from plotly.io.json import to_json_plotly
+
+from benchmarks.common import format_table, make_synthetic_frame, time_call
+from box_stats import box_figure
+from data_exploration import create_allergen_exposure_figure, explore_risk_factors
+from figure_artifacts import _load_gbd
+from figure_json import dumps
+from histograms import histogram_figure
+from scraper_exploration import generate_treemap
+
+# Columns the figures read
+FIGURE_COLUMNS = ["DIAGNOSIS", "AGE", "GENDER", "SMOKING", "FAMILYHISTORYASTHMA", "POLLUTIONEXPOSURE",
+                  "PETALLERGY", "POLLENEXPOSURE", "DUSTEXPOSURE"]
+
+ENCODERS = {
+    "plotly-text": lambda fig: json.dumps(fig.to_plotly_json(), cls=PlotlyJSONEncoder).encode("utf-8"),
+    "plotly": lambda fig: to_json_plotly(fig).encode("utf-8"),
+    "figure_json": dumps,
+}
+
+
+def build_figures(df):
+    """
+    Returns:
+        dict: Figure name -> go.Figure, as built by the dashboard.
+    """
+    fig_smoking, fig_pollution, fig_family = explore_risk_factors(df)
+    figures = {
+        "smoking": fig_smoking,
+        "pollution": fig_pollution,
+        "family": fig_family,
+        "allergen": create_allergen_exposure_figure(df),
+        "age_histogram": histogram_figure(df, "AGE", nbins=20, filters={"DIAGNOSIS": 1}),
+        "age_box": box_figure(df, "AGE", "GENDER", filters={"DIAGNOSIS": 1}),
+    }
+    # The treemaps come from the GBD table and do not depend on the patient count
+    gbd = _load_gbd()
+    gbd = gbd[gbd["SDI Category"].str.lower() != "global"].reset_index(drop=True)
+    figures["treemap_deaths"] = generate_treemap(gbd, "Number of deaths (thousands)", "Reds", "Deaths")
+    return figures
+
+
+def run(row_counts, repeat=5):
+    results = []
+    for n_rows in row_counts:
+        df = make_synthetic_frame(n_rows, columns=FIGURE_COLUMNS)
+        figures = build_figures(df)
+        del df
+
+        for name, fig in figures.items():
+            for encoder, encode in ENCODERS.items():
+                seconds, data = time_call(encode, fig, repeat=repeat)
+                results.append({
+                    "rows": n_rows,
+                    "figure": name,
+                    "encoder": encoder,
+                    "encode_ms": f"{seconds * 1000:.2f}",
+                    "bytes": len(data),
+                })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(format_table(run(args.rows, args.repeat), ["rows", "figure", "encoder", "encode_ms", "bytes"]))
@@ -0,0 +1,72 @@
+"""
+Measure the response size and latency of loading a tab page.
+
+Switching tabs happens in the browser; the server only answers the first visit of a
+page. "before" sends that request through the regular Dash callback, which serializes
+the page's component tree every time; "after" goes through the cached page JSON.
+
+    python -m benchmarks.bench_tab_switch --repeat 50
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import format_table
+
+TABS = ["treemap", "demographics", "factors", "risks", "correlations", "patients"]
+
+
+def _request_body(tab):
+    return {
+        "output": f"page-{tab}.children",
+        "outputs": {"id": f"page-{tab}", "property": "children"},
+        "inputs": [{"id": f"load-{tab}", "property": "data", "value": tab}],
+        "changedPropIds": [f"load-{tab}.data"],
+        "state": [],
+    }
+
+
+def _measure(client, tab, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=_request_body(tab))
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+        size = len(response.data)
+    return size, statistics.median(timings)
+
+
+def run(repeat):
+    import app
+
+    client = app.server.test_client()
+    hooks = app.server.before_request_funcs[None]
+    results = []
+    for tab, fast_path in zip(TABS, app.page_fast_paths):
+        # Warm both paths so first-visit builds are not counted
+        _measure(client, tab, 1)
+
+        hooks.remove(fast_path)
+        before_size, before_s = _measure(client, tab, repeat)
+        hooks.append(fast_path)
+        after_size, after_s = _measure(client, tab, repeat)
+
+        results.append({
+            "tab": tab,
+            "before_bytes": before_size,
+            "after_bytes": after_size,
+            "before_ms": f"{before_s * 1e3:.2f}",
+            "after_ms": f"{after_s * 1e3:.2f}",
+            "speedup": f"{before_s / after_s:.1f}x",
+        })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(format_table(run(args.repeat), ["tab", "before_bytes", "after_bytes", "before_ms", "after_ms", "speedup"]))
@@ -0,0 +1,97 @@
+import sys
+import time
+
+import pandas as pd
+
+from synthetic_data import CHUNK_ROWS, fit_template, generate
+
+# Real datasets used as templates for synthetic data (cleaned and raw schema)
+CLEANED_CSV = "cleaned_asthma_data.csv"
+RAW_CSV = "data/asthma_disease_data.csv"
+
+
+def make_synthetic_frame(n_rows, seed=0, template_path=CLEANED_CSV, columns=None, first_id=None):
+    """
+    Build a dataset of n_rows in the schema of a template with the synthetic patient
+    generator (marginals and correlations learned from the template).
+
+    Args:
+        n_rows (int): Number of rows to generate.
+        seed (int): Random seed.
+        template_path (str): CSV the generator is fitted on (cleaned or raw schema).
+        columns (list): Keep only these columns (the patient id is always kept), to
+                        bound memory at large row counts.
+        first_id (int): First patient id (default: the template's smallest id).
+
+    Returns:
+        pd.DataFrame: Synthetic dataset with unique patient ids.
+    """
+    model, _ = fit_template(template_path)
+    if first_id is None:
+        first_id = next(c["start"] for c in model.columns if c["kind"] == "id")
+    chunks = []
+    for index, start in enumerate(range(0, max(n_rows, 1), CHUNK_ROWS)):
+        size = min(CHUNK_ROWS, n_rows - start)
+        chunks.append(model.sample(size, seed=[seed, index], first_id=first_id + start, columns=columns))
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def write_synthetic_csv(path, n_rows, seed=0, template_path=RAW_CSV, chunk_rows=1_000_000):
+    """
+    Write a synthetic dataset to CSV chunk by chunk, so its size is not bounded by memory.
+
+    Returns:
+        str: path
+    """
+    return generate(path, n_rows, template_path=template_path, chunk_rows=chunk_rows, seed=seed, first_id=0)
+
+
+def time_call(func, *args, repeat=1, **kwargs):
+    """
+    Time a call, keeping the best of `repeat` runs.
+
+    Returns:
+        tuple: (best wall time in seconds, result of the last call)
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_rss_mb():
+    """
+    Returns:
+        float: Peak resident set size of this process in MB (None where unsupported).
+    """
+    # VmHWM is reset on exec, unlike ru_maxrss which a subprocess inherits from its parent
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def format_table(rows, columns):
+    """
+    Format a list of dicts as a fixed-width text table.
+    """
+    widths = [max(len(col), *(len(str(row.get(col, ""))) for row in rows)) for col in columns]
+    lines = ["  ".join(col.ljust(w) for col, w in zip(columns, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    for row in rows:
+        lines.append("  ".join(str(row.get(col, "")).ljust(w) for col, w in zip(columns, widths)))
+    return "\n".join(lines)
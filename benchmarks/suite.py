@@ -0,0 +1,301 @@
+"""
+Benchmark suite for the loaders, figure builders and callbacks.
+
+Every (case, rows) pair runs in a fresh subprocess on a synthetic dataset, which
+isolates its peak memory and keeps caches from leaking between cases. Each case
+reports wall time, peak resident memory during the call and the size of its output
+(JSON payload for figures, in-memory size for DataFrames).
+
+    python -m benchmarks.suite --rows 10000 1000000 10000000
+    python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    python -m benchmarks.suite --compare benchmarks/baseline.json   # exit code 1 on regressions
+
+Cases: load_dataset, clean_data, explore_risk_factors, create_allergen_exposure_figure,
+generate_treemap, update_demographic_graph, process_asthma_data, risk_table.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import RAW_CSV, format_table, make_synthetic_frame, peak_rss_mb, write_synthetic_csv
+
+DEFAULT_ROWS = [10_000, 1_000_000, 10_000_000]
+
+# A result is flagged when it is this much slower / larger than its baseline...
+DEFAULT_THRESHOLD = 0.20
+# ...and the difference is above the noise floor
+MIN_SECONDS_DELTA = 0.005
+MIN_MEMORY_DELTA_MB = 5.0
+
+FIGURE_COLUMNS = ["DIAGNOSIS", "AGE", "GENDER", "ETHNICITY", "SMOKING", "FAMILYHISTORYASTHMA",
+                  "POLLUTIONEXPOSURE", "PETALLERGY", "POLLENEXPOSURE", "DUSTEXPOSURE"]
+RISK_COLUMNS = ["DIAGNOSIS", "GENDER", "SMOKING", "PETALLERGY", "FAMILYHISTORYASTHMA", "HISTORYOFALLERGIES",
+                "ECZEMA", "HAYFEVER", "GASTROESOPHAGEALREFLUX", "WHEEZING", "SHORTNESSOFBREATH",
+                "CHESTTIGHTNESS", "COUGHING", "NIGHTTIMESYMPTOMS", "EXERCISEINDUCED"]
+GBD_CSV = "table_1_asthma_final_two_columns.csv"
+
+
+# === CASES ===
+# Each setup function prepares the inputs (not timed) and returns the call to time.
+
+def _setup_load_dataset(n_rows, paths):
+    from load_data import load_dataset
+
+    return lambda: load_dataset(paths["raw_csv"])
+
+
+def _setup_clean_data(n_rows, paths):
+    from data_cleaning import clean_data
+
+    df = make_synthetic_frame(n_rows, template_path=RAW_CSV)
+    return lambda: clean_data(df)
+
+
+def _setup_explore_risk_factors(n_rows, paths):
+    from data_exploration import explore_risk_factors
+
+    df = make_synthetic_frame(n_rows, columns=FIGURE_COLUMNS)
+    return lambda: list(explore_risk_factors(df))
+
+
+def _setup_create_allergen_exposure_figure(n_rows, paths):
+    from data_exploration import create_allergen_exposure_figure
+
+    df = make_synthetic_frame(n_rows, columns=FIGURE_COLUMNS)
+    return lambda: create_allergen_exposure_figure(df)
+
+
+def _setup_generate_treemap(n_rows, paths):
+    import numpy as np
+    from figure_artifacts import _load_gbd
+    from scraper_exploration import generate_treemap
+
+    gbd = _load_gbd()
+    gbd = gbd[gbd["SDI Category"].str.lower() != "global"].reset_index(drop=True)
+    # One row per (synthetic) region, grouped by the treemap into the SDI categories
+    df = gbd.iloc[np.random.default_rng(0).integers(0, len(gbd), size=n_rows)].reset_index(drop=True)
+    return lambda: generate_treemap(df, "Number of deaths (thousands)", "Reds", "Deaths")
+
+
+def _setup_update_demographic_graph(n_rows, paths):
+    from bitmap_index import index_for
+    from dataset_store import DatasetState
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app
+
+    df = make_synthetic_frame(n_rows, columns=FIGURE_COLUMNS)
+    df.attrs["dataset_version"] = f"bench-{n_rows}"
+    # The dashboard builds the bitmap index when it loads the dataset
+    index_for(df)
+    state = app.dataset_store.current()
+    app.dataset_store.publish(DatasetState(state.artifacts, df.attrs["dataset_version"], state.gbd_version,
+                                           state.files, df))
+    no_filters = [[app.AGE_MIN, app.AGE_MAX], None, None, None, None, None]
+    return lambda: [app.update_demographic_graph(choice, *no_filters) for choice in ["AGE", "GENDER", "ETHNICITY"]]
+
+
+def _setup_process_asthma_data(n_rows, paths):
+    import numpy as np
+    import pandas as pd
+    from scraper_pmc import process_asthma_data
+
+    # Cells in the PMC table format: "value (lower to upper)"
+    rng = np.random.default_rng(0)
+    low = rng.integers(1, 500, size=n_rows)
+    cells = [f"{v} ({v - 5} to {v + 7})" for v in low]
+    df = pd.DataFrame({
+        "Category": [f"Region {i}" for i in range(n_rows)],
+        "Number of deaths (thousands)": cells,
+        "Number of prevalent cases (thousands)": cells,
+    })
+    return lambda: process_asthma_data(df)
+
+
+def _setup_risk_table(n_rows, paths):
+    from risk_measures import risk_table
+
+    # No dataset version: every call recomputes the estimates and the bootstrap
+    df = make_synthetic_frame(n_rows, columns=RISK_COLUMNS)
+    return lambda: risk_table(df)
+
+
+CASES = {
+    "load_dataset": _setup_load_dataset,
+    "clean_data": _setup_clean_data,
+    "explore_risk_factors": _setup_explore_risk_factors,
+    "create_allergen_exposure_figure": _setup_create_allergen_exposure_figure,
+    "generate_treemap": _setup_generate_treemap,
+    "update_demographic_graph": _setup_update_demographic_graph,
+    "process_asthma_data": _setup_process_asthma_data,
+    "risk_table": _setup_risk_table,
+}
+
+
+# === CHILD PROCESS ===
+def _payload_bytes(result):
+    """
+    JSON size of figures, in-memory size of DataFrames.
+    """
+    if isinstance(result, (list, tuple)):
+        return sum(_payload_bytes(item) for item in result)
+    if hasattr(result, "memory_usage"):
+        return int(result.memory_usage(deep=True).sum())
+    from figure_json import dumps
+
+    return len(dumps(result))
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def run_case(case, n_rows, paths):
+    """
+    Run one case in the current process.
+
+    Returns:
+        dict: seconds, peak_mb (during the call when supported, else for the process),
+              payload_bytes
+    """
+    call = CASES[case](n_rows, paths)
+    reset = _reset_peak_rss()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = call()
+    seconds = time.perf_counter() - start
+    return {
+        "seconds": seconds,
+        "peak_mb": peak_rss_mb(),
+        "peak_scope": "call" if reset else "process",
+        "payload_bytes": _payload_bytes(result),
+    }
+
+
+def _run_child(case, n_rows, paths, cache_dir):
+    env = dict(os.environ, ASTHMA_CACHE_DIR=cache_dir)
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--child", case, str(n_rows), json.dumps(paths)],
+        capture_output=True, text=True, cwd=os.getcwd(), env=env
+    )
+    if completed.returncode != 0:
+        error = completed.stderr.strip().splitlines()[-1:] or [f"exit code {completed.returncode}"]
+        return {"error": error[0] if completed.returncode > 0 else f"killed (signal {-completed.returncode})"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+# === SUITE ===
+def run(row_counts, cases=None):
+    """
+    Returns:
+        list: One result dict per (case, rows).
+    """
+    cases = cases or list(CASES)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_rows in row_counts:
+            paths = {}
+            if "load_dataset" in cases:
+                paths["raw_csv"] = write_synthetic_csv(os.path.join(tmp, f"raw_{n_rows}.csv"), n_rows)
+            for case in cases:
+                cache_dir = tempfile.mkdtemp(dir=tmp, prefix="cache-")
+                result = _run_child(case, n_rows, paths, cache_dir)
+                results.append(dict(result, case=case, rows=n_rows))
+                print(f" {case} @ {n_rows} rows: "
+                      f"{result.get('error') or '%.3f s' % result['seconds']}", file=sys.stderr)
+            if "raw_csv" in paths:
+                os.remove(paths["raw_csv"])
+    return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Flag the results slower or larger in memory than their baseline.
+
+    Returns:
+        list: Results with a "status" field ("ok", "new", "error" or "REGRESSION: ...").
+    """
+    previous = {(entry["case"], entry["rows"]): entry for entry in baseline.get("results", [])}
+    for result in results:
+        base = previous.get((result["case"], result["rows"]))
+        if "error" in result:
+            result["status"] = "error"
+        elif base is None or "error" in base:
+            result["status"] = "new"
+        else:
+            problems = []
+            if (result["seconds"] > base["seconds"] * (1 + threshold)
+                    and result["seconds"] - base["seconds"] > MIN_SECONDS_DELTA):
+                problems.append(f"time x{result['seconds'] / base['seconds']:.2f}")
+            if (result["peak_mb"] and base.get("peak_mb")
+                    and result["peak_mb"] > base["peak_mb"] * (1 + threshold)
+                    and result["peak_mb"] - base["peak_mb"] > MIN_MEMORY_DELTA_MB):
+                problems.append(f"memory x{result['peak_mb'] / base['peak_mb']:.2f}")
+            result["status"] = "REGRESSION: " + ", ".join(problems) if problems else "ok"
+    return results
+
+
+def _table(results):
+    rows = []
+    for result in results:
+        row = {"case": result["case"], "rows": result["rows"], "status": result.get("status", "")}
+        if "error" in result:
+            row["status"] = result["error"][:60]
+        else:
+            row.update({
+                "seconds": f"{result['seconds']:.3f}",
+                "peak_mb": f"{result['peak_mb']:.0f}" if result["peak_mb"] else "n/a",
+                "payload_kb": f"{result['payload_bytes'] / 1024:.1f}",
+            })
+        rows.append(row)
+    return format_table(rows, ["case", "rows", "seconds", "peak_mb", "payload_kb", "status"])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        print(json.dumps(run_case(sys.argv[2], int(sys.argv[3]), json.loads(sys.argv[4]))))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), help="Run only these cases")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Flag regressions against a JSON baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown / memory growth flagged as a regression (default 0.2)")
+    args = parser.parse_args()
+
+    results = run(args.rows, args.cases)
+    regressions = []
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            results = compare(results, json.load(f), args.threshold)
+        regressions = [r for r in results if r["status"].startswith("REGRESSION")]
+
+    print(_table(results))
+
+    if args.save_baseline:
+        from file_utils import atomic_write_json
+
+        atomic_write_json(args.save_baseline, {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "results": [{k: v for k, v in r.items() if k != "status"} for r in results],
+        })
+        print(f"\n Baseline saved to {args.save_baseline}")
+
+    if regressions:
+        print(f"\n {len(regressions)} regression(s) above {args.threshold:.0%}.")
+        sys.exit(1)
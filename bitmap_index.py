@@ -0,0 +1,275 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from file_utils import CACHE_DIR, atomic_write_json, read_json, remove_stale_versions, version_kept
+
+# Directory holding one bitmap index per dataset version
+INDEX_DIR = os.path.join(CACHE_DIR, "bitmap_index")
+
+# Integer columns with at most this many distinct values get one bitmap per value
+MAX_EQUALITY_VALUES = 16
+
+# Columns filtered by range get range-encoded bitmaps (rows with value <= v)
+RANGE_COLUMNS = ["AGE"]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def normalize_filters(filters):
+    """
+    Turn a filters dict into a hashable, order-independent key.
+
+    Filter values can be a single value (equality), a list of values (membership) or
+    a {"min": lo, "max": hi} dict (inclusive range).
+    """
+    if not filters:
+        return ()
+    key = []
+    for column, value in sorted(filters.items()):
+        if isinstance(value, dict):
+            value = ("between", value.get("min"), value.get("max"))
+        elif isinstance(value, (list, tuple, set)):
+            value = tuple(sorted(value))
+        key.append((column, value))
+    return tuple(key)
+
+
+def _popcount(packed):
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(packed).sum())
+    return int(np.unpackbits(packed).sum())
+
+
+class BitmapIndex:
+    """
+    Packed bitmaps over the categorical patient columns.
+
+    Each bitmap holds one bit per row (np.packbits), so a filter combination resolves
+    with a few bitwise AND/OR operations over n_rows / 8 bytes instead of a scan of
+    the columns.
+
+    - equality bitmaps: one per (column, value) for low-cardinality integer columns
+    - range bitmaps: for RANGE_COLUMNS, one per distinct value v with the rows <= v,
+      so any inclusive range is a single AND NOT
+    """
+
+    def __init__(self, n_rows, bitmaps, entries):
+        self.n_rows = n_rows
+        self.bitmaps = bitmaps
+        self.entries = entries
+        self._equality = {}
+        self._ranges = {}
+        for row, (kind, column, value) in enumerate(entries):
+            if kind == "eq":
+                self._equality.setdefault(column, {})[value] = row
+            else:
+                self._ranges.setdefault(column, ([], []))
+                self._ranges[column][0].append(value)
+                self._ranges[column][1].append(row)
+        self._empty = np.zeros(bitmaps.shape[1], dtype=np.uint8)
+
+    @classmethod
+    def build(cls, df, range_columns=RANGE_COLUMNS, max_values=MAX_EQUALITY_VALUES):
+        """
+        Build the index from a DataFrame.
+
+        Returns:
+            BitmapIndex
+        """
+        entries = []
+        bitmaps = []
+        for column in df.columns:
+            values = df[column].to_numpy()
+            if values.dtype.kind not in "iub":
+                continue
+            if column in range_columns:
+                distinct = np.unique(values)
+                order = np.argsort(values, kind="stable")
+                sorted_values = values[order]
+                for value in distinct:
+                    bits = np.zeros(len(values), dtype=bool)
+                    bits[order[:np.searchsorted(sorted_values, value, side="right")]] = True
+                    entries.append(("le", column, value.item()))
+                    bitmaps.append(np.packbits(bits))
+                continue
+
+            distinct = np.unique(values)
+            if len(distinct) > max_values:
+                continue
+            for value in distinct:
+                entries.append(("eq", column, value.item()))
+                bitmaps.append(np.packbits(values == value))
+
+        n_bytes = (len(df) + 7) // 8
+        matrix = np.vstack(bitmaps) if bitmaps else np.zeros((0, n_bytes), dtype=np.uint8)
+        return cls(len(df), matrix, entries)
+
+    def covers(self, filters):
+        """
+        Check that every filter can be resolved from the index.
+        """
+        for column, value in normalize_filters(filters):
+            if isinstance(value, tuple) and value[:1] == ("between",):
+                if column not in self._ranges:
+                    return False
+            elif column not in self._equality:
+                return False
+        return True
+
+    def _range(self, column, lo, hi):
+        values, rows = self._ranges[column]
+        i_hi = len(values) - 1 if hi is None else int(np.searchsorted(values, hi, side="right")) - 1
+        if i_hi < 0:
+            return self._empty
+        bits = self.bitmaps[rows[i_hi]]
+        i_lo = -1 if lo is None else int(np.searchsorted(values, lo, side="left")) - 1
+        if i_lo >= 0:
+            bits = bits & ~self.bitmaps[rows[i_lo]]
+        return bits
+
+    def _members(self, column, values):
+        rows = [self._equality[column][v] for v in values if v in self._equality[column]]
+        if not rows:
+            return self._empty
+        return np.bitwise_or.reduce(self.bitmaps[rows], axis=0)
+
+    def select(self, filters):
+        """
+        Resolve a filter combination.
+
+        Returns:
+            np.ndarray: Packed bitmap (uint8) of the matching rows.
+        """
+        result = None
+        for column, value in normalize_filters(filters):
+            if isinstance(value, tuple) and value[:1] == ("between",):
+                bits = self._range(column, value[1], value[2])
+            elif isinstance(value, tuple):
+                bits = self._members(column, value)
+            else:
+                bits = self._members(column, (value,))
+            result = bits.copy() if result is None else np.bitwise_and(result, bits, out=result)
+
+        if result is None:
+            result = np.packbits(np.ones(self.n_rows, dtype=bool))
+        return result
+
+    def mask(self, filters):
+        """
+        Returns:
+            np.ndarray: Boolean row mask of a filter combination.
+        """
+        return np.unpackbits(self.select(filters), count=self.n_rows).view(bool)
+
+    def count(self, filters):
+        """
+        Returns:
+            int: Number of rows matching a filter combination.
+        """
+        return _popcount(self.select(filters))
+
+    def save(self, path):
+        """
+        Write the index as a bitmap matrix (.npy) plus a JSON list of entries.
+        """
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".bitmap-")
+        try:
+            np.save(os.path.join(tmp_dir, "bitmaps.npy"), self.bitmaps, allow_pickle=False)
+            atomic_write_json(os.path.join(tmp_dir, "entries.json"),
+                              {"rows": self.n_rows, "entries": self.entries})
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """
+        Memory-map a saved index.
+
+        Returns:
+            BitmapIndex, or None if there is no index at `path`.
+        """
+        meta = read_json(os.path.join(path, "entries.json"))
+        if meta is None:
+            return None
+        bitmaps = np.load(os.path.join(path, "bitmaps.npy"), mmap_mode="r", allow_pickle=False)
+        return cls(meta["rows"], bitmaps, [tuple(entry) for entry in meta["entries"]])
+
+
+def index_for(df):
+    """
+    Return the bitmap index of a dataset, loading or building it once per dataset version.
+
+    Datasets without a "dataset_version" attribute are not indexed.
+
+    Returns:
+        BitmapIndex, or None.
+    """
+    version = df.attrs.get("dataset_version")
+    if version is None:
+        return None
+
+    with _indexes_lock:
+        index = _indexes.get(version)
+        if index is None:
+            path = os.path.join(INDEX_DIR, version)
+            index = BitmapIndex.load(path)
+            if index is None or index.n_rows != len(df):
+                index = BitmapIndex.build(df)
+                index.save(path)
+            _indexes[version] = index
+    return index
+
+
+def get_index(version):
+    """
+    Returns:
+        BitmapIndex: The index already loaded for a dataset version, or None.
+    """
+    return _indexes.get(version)
+
+
+def evict_versions(keep):
+    """
+    Drop the indexes of dataset versions not in `keep`, from memory and from INDEX_DIR.
+    """
+    with _indexes_lock:
+        for version in [v for v in _indexes if not version_kept(v, keep)]:
+            del _indexes[version]
+        remove_stale_versions(INDEX_DIR, keep)
+
+
+def filter_mask(df, filters):
+    """
+    Boolean mask of the rows matching every filter.
+
+    Uses the dataset's bitmap index when it covers the filters, and a column scan
+    otherwise.
+    """
+    index = get_index(df.attrs.get("dataset_version"))
+    if index is not None and index.n_rows == len(df) and index.covers(filters):
+        return index.mask(filters)
+
+    mask = np.ones(len(df), dtype=bool)
+    for column, value in normalize_filters(filters):
+        values = df[column].to_numpy()
+        if isinstance(value, tuple) and value[:1] == ("between",):
+            if value[1] is not None:
+                mask &= values >= value[1]
+            if value[2] is not None:
+                mask &= values <= value[2]
+        elif isinstance(value, tuple):
+            mask &= np.isin(values, value)
+        else:
+            mask &= values == value
+    return mask
@@ -0,0 +1,221 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from plotly.colors import qualitative
+import plotly.graph_objects as go
+
+from file_utils import CACHE_DIR, atomic_write_json, file_lock, read_json, remove_stale_versions, version_kept
+from bitmap_index import filter_mask, normalize_filters
+
+# Directory holding one JSON file of box statistics (unfiltered or on a slice) per dataset version
+BOX_STATS_DIR = os.path.join(CACHE_DIR, "box_stats")
+STATS_LOCK = os.path.join(BOX_STATS_DIR, ".lock")
+
+# Maximum number of outliers kept per group for display
+MAX_OUTLIERS = 50
+
+# Other filtered statistics kept per worker (filters are open-ended, so they are not persisted)
+FILTERED_ENTRIES = 256
+
+# Columns with a few fixed values that the figures filter on by themselves (the demographic
+# box plots show DIAGNOSIS=1): statistics filtered on these only are persisted
+SLICE_COLUMNS = {"DIAGNOSIS"}
+
+_cache = {}
+_filtered = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def box_stats(values, max_outliers=MAX_OUTLIERS, seed=0):
+    """
+    Summary statistics of one group, matching what Plotly computes for a box trace.
+
+    Quartiles use linear interpolation (Plotly's default quartilemethod) and the
+    whiskers stop at the most extreme values within 1.5 IQR of the box.
+
+    Args:
+        values (np.ndarray): Group values (NaN is ignored).
+        max_outliers (int): Cap on the number of outliers returned.
+        seed (int): Seed for the outlier sample, so the figure is stable across calls.
+
+    Returns:
+        dict: n, mean, sd, q1, median, q3, lowerfence, upperfence and outliers.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    # Sampled in sorted order, so the sample does not depend on the row order (the SQLite
+    # backend reads the outliers sorted)
+    outliers = np.sort(values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)])
+    if len(outliers) > max_outliers:
+        outliers = np.random.default_rng(seed).choice(outliers, size=max_outliers, replace=False)
+
+    return {
+        "n": int(len(values)),
+        "mean": float(values.mean()),
+        "sd": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+        "q1": float(q1),
+        "median": float(median),
+        "q3": float(q3),
+        "lowerfence": float(inside.min()),
+        "upperfence": float(inside.max()),
+        "outliers": sorted(float(v) for v in outliers),
+    }
+
+
+def _stats_key(value_col, group_col, filters):
+    filter_key = ",".join(f"{col}={value}" for col, value in normalize_filters(filters))
+    return f"{value_col}|{group_col}|{filter_key}"
+
+
+def _persisted(filters):
+    return all(column in SLICE_COLUMNS for column, _ in normalize_filters(filters))
+
+
+def _stats_path(version):
+    return os.path.join(BOX_STATS_DIR, f"{version}.json")
+
+
+def grouped_box_stats(df, value_col, group_col, filters=None, max_outliers=MAX_OUTLIERS):
+    """
+    Box statistics of `value_col` for each value of `group_col`.
+
+    When the DataFrame carries a "dataset_version" attribute the result is cached.
+    Statistics that are unfiltered or filtered on SLICE_COLUMNS only go to memory and
+    to a per-version JSON file under BOX_STATS_DIR, so other workers and restarts reuse
+    them; other filtered ones only to a per-worker LRU of FILTERED_ENTRIES entries.
+    On the SQLite backend the statistics are computed by queries (see
+    sql_backend.SqlDataset.grouped_box_stats).
+
+    Returns:
+        dict: {group label (str): stats dict}, in sorted group order.
+    """
+    version = df.attrs.get("dataset_version")
+    key = _stats_key(value_col, group_col, filters)
+    persisted = _persisted(filters)
+
+    if version is not None:
+        with _cache_lock:
+            if not persisted:
+                if (version, key) in _filtered:
+                    _filtered.move_to_end((version, key))
+                    return _filtered[(version, key)]
+            else:
+                stored = _cache.get(version)
+                if stored is None:
+                    stored = read_json(_stats_path(version)) or {}
+                    _cache[version] = stored
+                if key in stored:
+                    return stored[key]
+
+    from sql_backend import SqlDataset
+
+    if isinstance(df, SqlDataset):
+        result = df.grouped_box_stats(value_col, group_col, filters, max_outliers)
+    else:
+        values = df[value_col].to_numpy()
+        groups = df[group_col].to_numpy()
+        if filters:
+            mask = filter_mask(df, filters)
+            values, groups = values[mask], groups[mask]
+
+        result = {}
+        for group in sorted(set(groups.tolist()), key=str):
+            stats = box_stats(values[groups == group], max_outliers=max_outliers)
+            if stats is not None:
+                result[str(group)] = stats
+
+    if version is not None and not persisted:
+        with _cache_lock:
+            _filtered[(version, key)] = result
+            while len(_filtered) > FILTERED_ENTRIES:
+                _filtered.popitem(last=False)
+    elif version is not None:
+        # Merge into the file as it is now, so entries written by other workers are kept
+        with _cache_lock, file_lock(STATS_LOCK):
+            stored = read_json(_stats_path(version)) or {}
+            stored.update(_cache.get(version, {}))
+            stored[key] = result
+            _cache[version] = stored
+            atomic_write_json(_stats_path(version), stored)
+    return result
+
+
+def box_figure(df, value_col, group_col, filters=None, title=None, labels=None, max_outliers=MAX_OUTLIERS):
+    """
+    Build a box plot from precomputed statistics.
+
+    Each group is a single box trace using Plotly's q1/median/q3/fence fields, plus a
+    capped sample of outliers as markers, so the payload does not grow with the
+    number of patients.
+
+    Returns:
+        go.Figure: One colored box per group, styled like px.box(color=group_col).
+    """
+    labels = labels or {}
+    stats = grouped_box_stats(df, value_col, group_col, filters, max_outliers)
+    colors = qualitative.Plotly
+
+    fig = go.Figure()
+    for i, (group, s) in enumerate(stats.items()):
+        color = colors[i % len(colors)]
+        fig.add_trace(go.Box(
+            name=group,
+            legendgroup=group,
+            x=[group],
+            q1=[s["q1"]],
+            median=[s["median"]],
+            q3=[s["q3"]],
+            lowerfence=[s["lowerfence"]],
+            upperfence=[s["upperfence"]],
+            mean=[s["mean"]],
+            sd=[s["sd"]],
+            marker_color=color,
+        ))
+        if s["outliers"]:
+            fig.add_trace(go.Scatter(
+                x=[group] * len(s["outliers"]),
+                y=s["outliers"],
+                mode="markers",
+                marker=dict(color=color, size=5),
+                legendgroup=group,
+                showlegend=False,
+                hovertemplate=f"{group}: %{{y}}<extra>outlier</extra>",
+            ))
+
+    fig.update_layout(
+        title=title,
+        xaxis_title=labels.get(group_col, group_col),
+        yaxis_title=labels.get(value_col, value_col),
+        legend_title_text=labels.get(group_col, group_col),
+        xaxis=dict(type="category", categoryorder="array", categoryarray=list(stats)),
+    )
+    return fig
+
+
+def clear_cache():
+    """
+    Drop the in-memory statistics (the per-version files stay valid for their version).
+    """
+    with _cache_lock:
+        _cache.clear()
+        _filtered.clear()
+
+
+def evict_versions(keep):
+    """
+    Drop the statistics of dataset versions not in `keep`, from memory and from BOX_STATS_DIR.
+    """
+    with _cache_lock:
+        for version in [v for v in _cache if not version_kept(v, keep)]:
+            del _cache[version]
+        for key in [k for k in _filtered if not version_kept(k[0], keep)]:
+            del _filtered[key]
+        remove_stale_versions(BOX_STATS_DIR, keep, suffix=".json")
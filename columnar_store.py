@@ -0,0 +1,439 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from file_utils import atomic_write_json, file_digest, read_json
+
+# Columnar copy of the cleaned dataset (one .npy file per column + manifest.json)
+COLUMNAR_PATH = "cleaned_asthma_data.columnar"
+MANIFEST_NAME = "manifest.json"
+# 2: float columns are float32 only when every value round-trips exactly
+FORMAT_VERSION = 2
+
+_INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def _smallest_int_dtype(values):
+    if len(values) == 0:
+        return np.dtype(np.int8)
+    lo, hi = values.min(), values.max()
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _exact_in(values, dtype):
+    # True if every value comes back unchanged from `dtype` (NaN included)
+    values = np.asarray(values, dtype=np.float64)
+    return np.array_equal(values.astype(dtype).astype(np.float64), values, equal_nan=True)
+
+
+def compact_column(series):
+    """
+    Convert a column to its compact on-disk representation.
+
+    - integer columns (0/1 flags included) -> smallest signed int that fits (int8 for flags)
+    - float columns -> float32 when every value is exactly a float32, float64 otherwise
+      (values read from a CSV with many decimals stay float64)
+    - text columns -> categorical codes (smallest int) + list of categories
+
+    Args:
+        series (pd.Series): Column to convert.
+
+    Returns:
+        tuple: (np.ndarray values, dict column metadata)
+    """
+    meta = {"name": series.name}
+
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        values = series.to_numpy()
+        values = values.astype(_smallest_int_dtype(values))
+        meta["kind"] = "numeric"
+    elif pd.api.types.is_float_dtype(series):
+        values = series.to_numpy(dtype=np.float64)
+        if _exact_in(values, np.float32):
+            values = values.astype(np.float32)
+        meta["kind"] = "numeric"
+    else:
+        categorical = pd.Categorical(series)
+        codes = categorical.codes
+        values = codes.astype(_smallest_int_dtype(np.array([-1, len(categorical.categories)])))
+        meta["kind"] = "categorical"
+        meta["categories"] = [str(c) for c in categorical.categories]
+
+    meta["dtype"] = values.dtype.str
+    return values, meta
+
+
+def _swap_into_place(tmp_dir, out_path):
+    # Swap the new directory in; readers with open memory maps keep the old files
+    parent = os.path.dirname(os.path.abspath(out_path))
+    old_dir = None
+    if os.path.exists(out_path):
+        old_dir = tempfile.mkdtemp(dir=parent, prefix=".columnar-old-")
+        os.rmdir(old_dir)
+        os.replace(out_path, old_dir)
+    os.replace(tmp_dir, out_path)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _manifest(n_rows, columns, source_path):
+    manifest = {"format": FORMAT_VERSION, "rows": int(n_rows), "columns": columns}
+    if source_path is not None:
+        stat = os.stat(source_path)
+        manifest["source"] = {
+            "path": os.path.basename(source_path),
+            "sha256": file_digest(source_path),
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+        }
+    return manifest
+
+
+def write_columnar(df, out_path=COLUMNAR_PATH, source_path=None):
+    """
+    Write a DataFrame as a directory of per-column .npy files plus a manifest.
+
+    The directory is assembled next to the target and moved into place at the end, so
+    a concurrent reader never sees a half-written dataset.
+
+    Args:
+        df (pd.DataFrame): Dataset to write.
+        out_path (str): Target directory.
+        source_path (str): CSV the dataset came from; its digest, size and mtime are
+                           recorded so stale artifacts can be detected.
+
+    Returns:
+        dict: The manifest that was written.
+    """
+    parent = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".columnar-")
+
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            values, meta = compact_column(df[name])
+            meta["file"] = f"{i:03d}.npy"
+            np.save(os.path.join(tmp_dir, meta["file"]), values, allow_pickle=False)
+            columns.append(meta)
+
+        manifest = _manifest(len(df), columns, source_path)
+        atomic_write_json(os.path.join(tmp_dir, MANIFEST_NAME), manifest)
+        _swap_into_place(tmp_dir, out_path)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return manifest
+
+
+def column_schema(template):
+    """
+    Column metadata (kind, dtype, categories) of a DataFrame, as write_columnar would
+    store it. Used to stream datasets with the same layout through ColumnarWriter.
+
+    Returns:
+        list: One metadata dict per column.
+    """
+    schema = []
+    for i, name in enumerate(template.columns):
+        _, meta = compact_column(template[name])
+        meta["file"] = f"{i:03d}.npy"
+        schema.append(meta)
+    return schema
+
+
+def merge_schemas(schema, other):
+    """
+    Schema of the concatenation of two datasets from their column_schema(), e.g. to
+    build the layout of a dataset streamed in chunks. Integer and float widths are
+    widened to fit both sides, category lists are merged.
+
+    Returns:
+        list: The merged schema.
+
+    Raises:
+        ValueError: If a column is numeric on one side and text on the other.
+    """
+    merged = []
+    for meta, meta_other in zip(schema, other):
+        if meta["kind"] != meta_other["kind"]:
+            raise ValueError(f"Column '{meta['name']}' is {meta['kind']} in one chunk and "
+                             f"{meta_other['kind']} in another.")
+        meta = dict(meta)
+        if meta["kind"] == "categorical":
+            meta["categories"] = sorted(set(meta["categories"]) | set(meta_other["categories"]))
+            size = len(meta["categories"])
+            meta["dtype"] = _smallest_int_dtype(np.array([-1, size])).str
+        else:
+            meta["dtype"] = np.promote_types(np.dtype(meta["dtype"]), np.dtype(meta_other["dtype"])).str
+        merged.append(meta)
+    return merged
+
+
+def write_rows(directory, schema, start, df):
+    """
+    Write df into rows [start, start + len(df)) of a dataset being built by a
+    ColumnarWriter. Safe to call from several processes on disjoint row ranges.
+    """
+    for meta in schema:
+        column = np.load(os.path.join(directory, meta["file"]), mmap_mode="r+", allow_pickle=False)
+        series = df[meta["name"]]
+        if meta["kind"] == "categorical":
+            values = pd.Categorical(series.astype(str), categories=meta["categories"]).codes
+        else:
+            values = series.to_numpy()
+        column[start:start + len(df)] = values.astype(column.dtype, copy=False)
+        column.flush()
+        del column
+
+
+class ColumnarWriter:
+    """
+    Streams a dataset of known size into the columnar format, chunk by chunk.
+
+    Every column file is preallocated (np.lib.format.open_memmap) in a temporary
+    directory; chunks are written into their row range with write() or, from other
+    processes, with write_rows(writer.directory, writer.schema, ...). close() writes
+    the manifest and moves the directory into place like write_columnar.
+
+    Args:
+        out_path (str): Target directory.
+        n_rows (int): Total number of rows.
+        schema (list): Column metadata from column_schema().
+    """
+
+    def __init__(self, out_path, n_rows, schema):
+        self.out_path = out_path
+        self.n_rows = n_rows
+        self.schema = schema
+        parent = os.path.dirname(os.path.abspath(out_path))
+        os.makedirs(parent, exist_ok=True)
+        self.directory = tempfile.mkdtemp(dir=parent, prefix=".columnar-")
+        for meta in schema:
+            column = np.lib.format.open_memmap(os.path.join(self.directory, meta["file"]), mode="w+",
+                                               dtype=np.dtype(meta["dtype"]), shape=(n_rows,))
+            del column
+
+    def write(self, start, df):
+        write_rows(self.directory, self.schema, start, df)
+
+    def close(self, source_path=None):
+        """
+        Returns:
+            dict: The manifest that was written.
+        """
+        try:
+            manifest = _manifest(self.n_rows, self.schema, source_path)
+            atomic_write_json(os.path.join(self.directory, MANIFEST_NAME), manifest)
+            _swap_into_place(self.directory, self.out_path)
+        except BaseException:
+            self.abort()
+            raise
+        return manifest
+
+    def abort(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def _appended_values(meta, series):
+    # Values of an appended column in the stored layout, or None if they do not fit it
+    dtype = np.dtype(meta["dtype"])
+    if meta["kind"] == "categorical":
+        text = series.map(str, na_action="ignore")
+        known = set(meta["categories"])
+        # Existing codes must keep their meaning, so new categories go last
+        meta["categories"] = meta["categories"] + [c for c in pd.unique(text.dropna()) if c not in known]
+        if len(meta["categories"]) > np.iinfo(dtype).max:
+            return None
+        return pd.Categorical(text, categories=meta["categories"]).codes.astype(dtype)
+
+    values = series.to_numpy()
+    try:
+        stored = values.astype(dtype)
+    except (TypeError, ValueError):
+        return None
+    if dtype.kind == "f":
+        fits = _exact_in(values, dtype)
+    else:
+        fits = np.array_equal(stored, values)
+    return stored if fits else None
+
+
+def append_columnar(df, path=COLUMNAR_PATH, source_path=None):
+    """
+    Append rows to a columnar dataset in place, in O(len(df)).
+
+    The values are written at the end of every .npy file first, then the row counts in
+    the .npy headers, then the manifest; memory maps opened before keep their length.
+    Readers may see the new rows before the manifest, so call it with the dataset build
+    lock held (see dataset_store.BUILD_LOCK).
+
+    Args:
+        df (pd.DataFrame): Rows to append, with the columns of the dataset.
+        path (str): Columnar dataset directory.
+        source_path (str): CSV the rows were appended to (recorded like write_columnar).
+
+    Returns:
+        dict: The new manifest, or None if nothing was appended because the rows do not
+              fit the stored layout (missing column, value outside a column's dtype, too
+              many categories): rewrite the dataset with write_columnar then.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+
+    columns, appended = [], []
+    for meta in manifest["columns"]:
+        if meta["name"] not in df.columns:
+            return None
+        meta = dict(meta)
+        values = _appended_values(meta, df[meta["name"]])
+        if values is None:
+            return None
+        columns.append(meta)
+        appended.append(values)
+
+    n_rows = manifest["rows"] + len(df)
+    headers = []
+    for meta in columns:
+        with open(os.path.join(path, meta["file"]), "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version != (1, 0):
+                return None
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            header_size = f.tell()
+        if shape != (manifest["rows"],) or fortran_order:
+            return None
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                      "fortran_order": False, "shape": (n_rows,)})
+        # np.save leaves room in the header for longer shapes, so it is rewritten in place
+        if len(header.getvalue()) != header_size:
+            return None
+        headers.append(header.getvalue())
+
+    for meta, values in zip(columns, appended):
+        with open(os.path.join(path, meta["file"]), "ab") as f:
+            f.write(values.tobytes())
+    for meta, header in zip(columns, headers):
+        with open(os.path.join(path, meta["file"]), "r+b") as f:
+            f.write(header)
+
+    manifest = _manifest(n_rows, columns, source_path)
+    atomic_write_json(os.path.join(path, MANIFEST_NAME), manifest)
+    return manifest
+
+
+def read_manifest(path=COLUMNAR_PATH):
+    """
+    Returns:
+        dict: The manifest of a columnar dataset, or None if there is none.
+    """
+    manifest = read_json(os.path.join(path, MANIFEST_NAME))
+    if not isinstance(manifest, dict) or manifest.get("format") != FORMAT_VERSION:
+        return None
+    return manifest
+
+
+def is_fresh(path=COLUMNAR_PATH, source_path=None):
+    """
+    Check that a columnar dataset exists and was built from the current source CSV.
+
+    The check compares the recorded size and mtime, so it costs two stat calls
+    instead of re-hashing the CSV.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        return False
+    if source_path is None or not os.path.exists(source_path):
+        return True
+
+    source = manifest.get("source")
+    if not source:
+        return False
+    stat = os.stat(source_path)
+    return source["size"] == stat.st_size and source["mtime"] == stat.st_mtime
+
+
+def load_columnar(path=COLUMNAR_PATH, mmap=True, columns=None):
+    """
+    Load a columnar dataset into a DataFrame.
+
+    With mmap=True every column is a read-only memory map of its .npy file: loading is
+    near instant, pages are only read when touched, and workers on the same machine
+    share them through the OS page cache.
+
+    Args:
+        path (str): Columnar dataset directory.
+        mmap (bool): Memory-map the columns instead of reading them into memory.
+        columns (list): Subset of columns to load (all by default).
+
+    Returns:
+        pd.DataFrame: The dataset, or None if the directory has no valid manifest.
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+
+    mmap_mode = "r" if mmap else None
+    data = {}
+    for meta in manifest["columns"]:
+        if columns is not None and meta["name"] not in columns:
+            continue
+        values = np.load(os.path.join(path, meta["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+        if meta["kind"] == "categorical":
+            values = pd.Categorical.from_codes(values, categories=meta["categories"])
+        data[meta["name"]] = values
+
+    # copy=False keeps the memory maps instead of consolidating them into new blocks
+    return pd.DataFrame(data, copy=False)
+
+
+def dataset_version(path=COLUMNAR_PATH):
+    """
+    Returns:
+        str: Short digest of the source CSV the columnar dataset was built from, or None.
+    """
+    manifest = read_manifest(path)
+    if manifest is None or "source" not in manifest:
+        return None
+    return manifest["source"]["sha256"][:16]
+
+
+def build_from_csv(csv_path, out_path=COLUMNAR_PATH):
+    """
+    Convert an existing CSV into a columnar dataset.
+
+    Returns:
+        dict: The manifest that was written.
+    """
+    df = pd.read_csv(csv_path)
+    return write_columnar(df, out_path, source_path=csv_path)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        csv_path = sys.argv[2] if len(sys.argv) > 2 else "cleaned_asthma_data.csv"
+        manifest = build_from_csv(csv_path)
+        print(f" Columnar copy of '{csv_path}' saved as '{COLUMNAR_PATH}' ({manifest['rows']} rows).")
+
+    manifest = read_manifest()
+    if manifest is None:
+        print(f" No columnar dataset at '{COLUMNAR_PATH}'. Run 'python columnar_store.py build' first.")
+    else:
+        print(f" Columnar dataset '{COLUMNAR_PATH}': {manifest['rows']} rows, version {dataset_version()}")
+        for meta in manifest["columns"]:
+            print(f"  {meta['name']:<25} {meta['kind']:<12} {np.dtype(meta['dtype']).name}")
+        print(json.dumps(manifest.get("source", {}), indent=2))
@@ -0,0 +1,403 @@
+"""
+Pearson and Spearman correlation matrices of the numeric patient columns.
+
+The data is read in chunks (slices of the memory-mapped columnar copy, or CSV chunks)
+and never held in memory as a whole:
+
+- Pearson: one pass accumulating, per DIAGNOSIS value, the row count, the column means
+  and the matrix of centered cross-products of each chunk, merged into running totals
+  (Chan et al.). The matrix of all patients is the merge of the diagnosis groups.
+- Spearman: Pearson on average ranks. Ranking needs a whole column, so the columns are
+  ranked one at a time by a process pool, each worker writing its ranks into
+  temporary files that a second chunked pass accumulates like the first one. A CSV
+  source is spilled to one raw file per column during the first pass, so it is only
+  parsed once.
+
+Rows with a missing value in any column are left out of both. The matrices are cached
+per dataset version in CORRELATIONS_DIR.
+
+    python correlations.py [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from columnar_store import COLUMNAR_PATH, dataset_version, is_fresh, read_manifest
+from file_utils import CACHE_DIR, atomic_write_json, file_digest, read_json, remove_stale_versions, version_kept
+
+DATA_PATH = "cleaned_asthma_data.csv"
+
+# Directory holding one JSON file of correlation matrices per dataset version
+CORRELATIONS_DIR = os.path.join(CACHE_DIR, "correlations")
+
+GROUP_COLUMN = "DIAGNOSIS"
+METHODS = ["pearson", "spearman"]
+
+# Rows read at once by the accumulating passes (about 10 MB per chunk of 27 float64 columns;
+# larger chunks are no faster and multiply the copies held during a reload)
+CHUNK_ROWS = 50_000
+
+# Processes ranking the columns (1 = in the calling process). In-process by default, as
+# the workers rebuild the tables on their reload thread (see risk_measures.BOOTSTRAP_WORKERS);
+# the command line and `figure_artifacts.py build` use one process per CPU.
+RANK_WORKERS = int(os.environ.get("ASTHMA_RANK_WORKERS", 1))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# === ACCUMULATOR ===
+class CorrelationAccumulator:
+    """
+    Running count, means and centered cross-products of a set of columns, per group.
+
+    Chunks are merged with the pairwise update of Chan et al., which stays accurate
+    where raw sums of squares would cancel out (large means, many rows).
+    """
+
+    def __init__(self, n_columns):
+        self.n_columns = n_columns
+        self.stats = {}
+
+    def _merge(self, group, n, mean, comoment):
+        if group not in self.stats:
+            self.stats[group] = (n, mean, comoment)
+            return
+        n_a, mean_a, comoment_a = self.stats[group]
+        total = n_a + n
+        delta = mean - mean_a
+        self.stats[group] = (
+            total,
+            mean_a + delta * (n / total),
+            comoment_a + comoment + np.outer(delta, delta) * (n_a * n / total),
+        )
+
+    def add(self, values, groups=None):
+        """
+        Add a chunk of rows.
+
+        Args:
+            values (np.ndarray): (rows, columns) float64 chunk without missing values.
+            groups (np.ndarray): Group of each row (None: one group).
+        """
+        if groups is None:
+            parts = [(None, values)]
+        else:
+            parts = [(g.item(), values[groups == g]) for g in np.unique(groups)]
+        for group, part in parts:
+            if len(part) == 0:
+                continue
+            mean = part.mean(axis=0)
+            centered = part - mean
+            self._merge(group, len(part), mean, centered.T @ centered)
+
+    def merge(self, other):
+        """
+        Add the rows accumulated by another accumulator.
+        """
+        for group, (n, mean, comoment) in other.stats.items():
+            self._merge(group, n, mean, comoment)
+
+    def rows(self, group=None):
+        """
+        Returns:
+            int: Rows of a group (None: all groups).
+        """
+        return sum(n for g, (n, _, _) in self.stats.items() if group is None or g == group)
+
+    def correlation(self, group=None):
+        """
+        Correlation matrix of one group, or of all the rows with group=None.
+
+        Returns:
+            np.ndarray: (columns, columns) matrix; NaN for constant columns.
+        """
+        total = CorrelationAccumulator(self.n_columns)
+        for g, stats in self.stats.items():
+            if group is None or g == group:
+                total._merge(None, *stats)
+        if None not in total.stats:
+            return np.full((self.n_columns, self.n_columns), np.nan)
+        comoment = total.stats[None][2]
+        scale = np.sqrt(np.diag(comoment))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = comoment / np.outer(scale, scale)
+        np.fill_diagonal(corr, np.where(scale > 0, 1.0, np.nan))
+        return np.clip(corr, -1.0, 1.0)
+
+
+# === DATA SOURCE ===
+# A source is ("columnar", directory) or ("csv", path)
+
+def _source(csv_path=DATA_PATH, columnar_path=COLUMNAR_PATH):
+    if is_fresh(columnar_path, source_path=csv_path):
+        return ("columnar", columnar_path)
+    return ("csv", csv_path)
+
+
+def _source_version(source):
+    kind, path = source
+    return dataset_version(path) if kind == "columnar" else file_digest(path)[:16]
+
+
+def numeric_columns(source):
+    """
+    Returns:
+        list: Numeric columns of a source (patient ids excluded).
+    """
+    kind, path = source
+    if kind == "columnar":
+        names = [meta["name"] for meta in read_manifest(path)["columns"] if meta["kind"] != "categorical"]
+    else:
+        import pandas as pd
+
+        names = list(pd.read_csv(path, nrows=1000).select_dtypes("number").columns)
+    return [name for name in names if name.upper() != "PATIENTID"]
+
+
+def _read_chunks(source, columns, chunk_rows=CHUNK_ROWS):
+    # Yields (rows, columns) float64 chunks
+    kind, path = source
+    if kind == "columnar":
+        manifest = read_manifest(path)
+        files = {meta["name"]: meta["file"] for meta in manifest["columns"]}
+        arrays = [np.load(os.path.join(path, files[name]), mmap_mode="r") for name in columns]
+        for start in range(0, manifest["rows"], chunk_rows):
+            yield np.column_stack([values[start:start + chunk_rows] for values in arrays]).astype(np.float64)
+    else:
+        import pandas as pd
+
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_rows):
+            yield chunk[columns].to_numpy(dtype=np.float64)
+
+
+def _read_column(path, name):
+    # Memory map of one column of a columnar dataset
+    files = {meta["name"]: meta["file"] for meta in read_manifest(path)["columns"]}
+    return np.load(os.path.join(path, files[name]), mmap_mode="r")
+
+
+# === RANKS ===
+def average_ranks(values):
+    """
+    Ranks starting at 1, ties sharing the average of their ranks (as Spearman requires).
+    """
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    ends = np.cumsum(counts)
+    return (ends - (counts - 1) / 2.0)[inverse.ravel()]
+
+
+# Worker state, set once per process by the pool initializer
+_worker = {}
+
+
+def _init_worker(source, columns, rank_dir, scopes):
+    _worker.update(source=source, columns=columns, rank_dir=rank_dir, scopes=scopes)
+
+
+def _rank_column(j):
+    # Ranks column j among the complete rows of every scope, into row j of the scope's rank file
+    rank_dir = _worker["rank_dir"]
+    groups = np.load(os.path.join(rank_dir, "groups.npy"), mmap_mode="r")
+    if _worker["source"][0] == "columnar":
+        complete = np.load(os.path.join(rank_dir, "complete.npy"))
+        values = np.asarray(_read_column(_worker["source"][1], _worker["columns"][j]))[complete]
+    else:
+        # Complete rows spilled by the first pass: the CSV is parsed once, not once per column
+        values = np.fromfile(os.path.join(rank_dir, f"column-{j}.f8"), dtype=np.float64)
+    for scope in _worker["scopes"]:
+        ranks = average_ranks(values if scope == "all" else values[groups == int(scope)])
+        # Plain writes rather than a memory map: written pages do not stay in the worker's RSS
+        with open(os.path.join(rank_dir, f"ranks-{scope}.f8"), "r+b") as f:
+            f.seek(j * len(ranks) * 8)
+            f.write(ranks.tobytes())
+    return j
+
+
+def _run(columns, task, workers, initargs):
+    # Yields the task results in column order
+    if workers is None:
+        workers = RANK_WORKERS
+    if workers <= 1:
+        _init_worker(*initargs)
+        for j in range(len(columns)):
+            yield task(j)
+        return
+    with multiprocessing.Pool(min(workers, len(columns)), initializer=_init_worker, initargs=initargs) as pool:
+        yield from pool.imap(task, range(len(columns)))
+
+
+# === CORRELATION TABLES ===
+def _matrix(corr):
+    return [[float(v) if np.isfinite(v) else None for v in row] for row in corr]
+
+
+def compute_correlations(source, workers=None, chunk_rows=CHUNK_ROWS):
+    """
+    Pearson and Spearman matrices of all patients and of each diagnosis group.
+
+    Args:
+        source (tuple): ("columnar", directory) or ("csv", path).
+        workers (int): Processes ranking the columns (None: RANK_WORKERS).
+        chunk_rows (int): Rows read at once.
+
+    Returns:
+        dict: columns, rows ({scope: complete rows}) and for each method a
+              {scope: matrix} dict, with scopes "all" and the DIAGNOSIS values.
+    """
+    columns = numeric_columns(source)
+    group_index = columns.index(GROUP_COLUMN)
+
+    rank_dir = tempfile.mkdtemp(prefix="asthma-ranks-")
+    try:
+        # Pass 1: Pearson, and which rows are complete (CSV rows are also spilled per column)
+        pearson = CorrelationAccumulator(len(columns))
+        complete_chunks = []
+        group_chunks = []
+        for chunk in _read_chunks(source, columns, chunk_rows):
+            complete = np.isfinite(chunk).all(axis=1)
+            complete_chunks.append(complete)
+            chunk = chunk[complete]
+            group_chunks.append(chunk[:, group_index].astype(np.int8))
+            pearson.add(chunk, group_chunks[-1])
+            if source[0] == "csv":
+                for j in range(len(columns)):
+                    with open(os.path.join(rank_dir, f"column-{j}.f8"), "ab") as f:
+                        f.write(np.ascontiguousarray(chunk[:, j]).tobytes())
+
+        groups = sorted(pearson.stats)
+        scopes = ["all"] + [str(g) for g in groups]
+        np.save(os.path.join(rank_dir, "complete.npy"), np.concatenate(complete_chunks or [np.zeros(0, bool)]))
+        group_of_rows = np.concatenate(group_chunks or [np.zeros(0, np.int8)])
+        np.save(os.path.join(rank_dir, "groups.npy"), group_of_rows)
+        del complete_chunks, group_chunks
+        # One float64 rank row per column (each worker writes a contiguous block)
+        for scope in scopes:
+            n = pearson.rows() if scope == "all" else pearson.rows(int(scope))
+            with open(os.path.join(rank_dir, f"ranks-{scope}.f8"), "wb") as f:
+                f.truncate(len(columns) * n * 8)
+
+        # Ranks, one column per task
+        for _ in _run(columns, _rank_column, workers, (source, columns, rank_dir, scopes)):
+            pass
+
+        # Pass 2: Spearman, as Pearson on the ranks of each scope
+        spearman = {}
+        for scope in scopes:
+            n = pearson.rows() if scope == "all" else pearson.rows(int(scope))
+            accumulator = CorrelationAccumulator(len(columns))
+            with open(os.path.join(rank_dir, f"ranks-{scope}.f8"), "rb") as f:
+                for start in range(0, n, chunk_rows):
+                    block = np.empty((min(chunk_rows, n - start), len(columns)))
+                    for j in range(len(columns)):
+                        f.seek((j * n + start) * 8)
+                        block[:, j] = np.fromfile(f, dtype=np.float64, count=len(block))
+                    accumulator.add(block)
+            spearman[scope] = accumulator.correlation()
+    finally:
+        shutil.rmtree(rank_dir, ignore_errors=True)
+
+    return {
+        "columns": columns,
+        "rows": {scope: pearson.rows(None if scope == "all" else int(scope)) for scope in scopes},
+        "pearson": {scope: _matrix(pearson.correlation(None if scope == "all" else int(scope))) for scope in scopes},
+        "spearman": {scope: _matrix(spearman[scope]) for scope in scopes},
+    }
+
+
+def _tables_path(version):
+    return os.path.join(CORRELATIONS_DIR, f"{version}.json")
+
+
+def correlation_tables(csv_path=DATA_PATH, columnar_path=COLUMNAR_PATH, workers=None):
+    """
+    Correlation matrices of the current dataset (see compute_correlations), read from
+    the columnar copy when it is up to date and cached per dataset version in memory
+    and in CORRELATIONS_DIR.
+    """
+    source = _source(csv_path, columnar_path)
+    version = _source_version(source)
+    with _cache_lock:
+        tables = _cache.get(version)
+        if tables is None:
+            tables = read_json(_tables_path(version))
+    if tables is None:
+        tables = compute_correlations(source, workers)
+        atomic_write_json(_tables_path(version), tables)
+    with _cache_lock:
+        _cache[version] = tables
+    return tables
+
+
+# === HEATMAP ===
+def correlation_figure(tables, method="pearson", scope="all", title=None):
+    """
+    Heatmap of one correlation matrix (diverging scale centered on 0).
+
+    Args:
+        tables (dict): Result of correlation_tables().
+        method (str): "pearson" or "spearman".
+        scope (str): "all" or a DIAGNOSIS value ("0", "1").
+
+    Returns:
+        go.Figure: Square heatmap with the first column on top.
+    """
+    import plotly.graph_objects as go
+
+    columns = tables["columns"]
+    matrix = np.array([[np.nan if v is None else v for v in row] for row in tables[method][scope]], dtype=np.float64)
+    fig = go.Figure(go.Heatmap(
+        z=matrix,
+        x=columns,
+        y=columns,
+        zmin=-1, zmax=1, zmid=0,
+        colorscale="RdBu_r",
+        colorbar=dict(title=method.capitalize()),
+        hovertemplate="%{y} / %{x}<br>r = %{z:.3f}<extra></extra>",
+    ))
+    fig.update_layout(
+        title=title or f"{method.capitalize()} correlations ({tables['rows'][scope]} patients)",
+        yaxis=dict(autorange="reversed", scaleanchor="x"),
+        xaxis=dict(tickangle=-45),
+        height=800,
+        plot_bgcolor="white",
+    )
+    return fig
+
+
+def clear_cache():
+    """
+    Drop the in-memory tables (the per-version files stay valid for their version).
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def evict_versions(keep):
+    """
+    Drop the tables of dataset versions not in `keep`, from memory and from CORRELATIONS_DIR.
+    """
+    with _cache_lock:
+        for version in [v for v in _cache if not version_kept(v, keep)]:
+            del _cache[version]
+        remove_stale_versions(CORRELATIONS_DIR, keep, suffix=".json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Correlation matrices of the numeric patient columns.")
+    parser.add_argument("--csv", default=DATA_PATH, help="Cleaned dataset CSV")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Ranking processes")
+    args = parser.parse_args()
+
+    tables = correlation_tables(args.csv, workers=args.workers)
+    print(f" {len(tables['columns'])} columns, rows per scope: {tables['rows']}")
+    for method in METHODS:
+        matrix = np.array([[np.nan if v is None else v for v in row] for row in tables[method]["all"]])
+        np.fill_diagonal(matrix, np.nan)
+        i, j = np.unravel_index(np.nanargmax(np.abs(matrix)), matrix.shape)
+        print(f"  strongest {method:<9} {tables['columns'][i]} / {tables['columns'][j]}: {matrix[i, j]:.3f}")
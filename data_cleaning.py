@@ -1,11 +1,34 @@
-from load_data import load_dataset
+import argparse
+import os
+import tempfile
+import time
 
+import numpy as np
+import pandas as pd
 
-def clean_data(df):
+from load_data import DATA_PATH, load_dataset
+from columnar_store import COLUMNAR_PATH, ColumnarWriter, column_schema, merge_schemas, write_columnar
+from near_duplicates import merge_near_duplicates, report_near_duplicates
+
+CLEANED_CSV = "cleaned_asthma_data.csv"
+
+# Default memory budget of the chunks of the streaming pipeline (MB)
+STREAM_MEMORY_MB = 512
+
+# Parsing, hashing and writing a chunk take a few times its in-memory size
+CHUNK_OVERHEAD = 4
+
+
+def clean_data(df, near_duplicates=None):
     """
     Cleans the dataset by removing duplicates and converting column names to uppercase.
     Missing values are kept as they are.
 
+    Args:
+        df (pd.DataFrame): Raw dataset.
+        near_duplicates (str): "report" to list the patients recorded several times with
+                               tiny float differences, "merge" to also keep only their
+                               first record (see near_duplicates.py). None skips the check.
     """
 
     print("Starting data cleaning...")
@@ -15,6 +38,18 @@ def clean_data(df):
     df = df.drop_duplicates()
     print(f" Removed {initial_shape[0] - df.shape[0]} duplicate rows.")
 
+    # Same patient recorded again with tiny float differences
+    if near_duplicates in ("report", "merge"):
+        report = report_near_duplicates(df)
+        groups = report["GROUP"].nunique()
+        print(f" Found {len(report) - groups} near-duplicate rows in {groups} groups.")
+        if len(report):
+            print(report.head(10).to_string(index=False))
+        if near_duplicates == "merge":
+            before = len(df)
+            df = merge_near_duplicates(df)
+            print(f" Merged {before - len(df)} near-duplicate rows into their first record.")
+
     # Keep missing values as they are
     missing_values = df.isnull().sum()
     print(f"\n🔍 Missing values before cleaning:\n{missing_values[missing_values > 0]}")
@@ -29,12 +64,236 @@ def clean_data(df):
     return df
 
 
+# === STREAMING ===
+def _row_hashes(chunk):
+    """
+    64-bit hash of every row, equal for rows that drop_duplicates() considers equal.
+    """
+    normalized = {}
+    for name in chunk.columns:
+        column = chunk[name]
+        if pd.api.types.is_numeric_dtype(column):
+            # An integer column becomes float in chunks with missing values; -0.0 == 0.0
+            column = column.astype(np.float64) + 0.0
+        normalized[name] = column
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy()
+
+
+def _seen_before(runs, hashes):
+    """
+    Which hashes are in the sorted runs of hashes seen so far: one binary search per
+    hash and run.
+    """
+    found = np.zeros(len(hashes), dtype=bool)
+    for run in runs:
+        positions = np.searchsorted(run, hashes)
+        found |= run[np.minimum(positions, len(run) - 1)] == hashes
+    return found
+
+
+def _merge_sorted(first, second):
+    """
+    Merge two sorted arrays without common values in one linear pass: each value of
+    `second` goes to its insertion point in `first`, shifted by the values before it.
+    """
+    merged = np.empty(len(first) + len(second), dtype=first.dtype)
+    slots = np.searchsorted(first, second) + np.arange(len(second))
+    from_second = np.zeros(len(merged), dtype=bool)
+    from_second[slots] = True
+    merged[slots] = second
+    merged[~from_second] = first
+    return merged
+
+
+def _add_run(runs, new):
+    """
+    Add the sorted new hashes of a chunk to the runs, kept in decreasing sizes: the new
+    run absorbs the runs no larger than it. Each hash is copied O(log rows) times in
+    total (instead of once per chunk with a single array), and there are O(log rows)
+    runs to search.
+    """
+    if len(new) == 0:
+        return
+    while runs and len(runs[-1]) <= len(new):
+        new = _merge_sorted(runs.pop(), new)
+    runs.append(new)
+
+
+def _merge_chunk_schema(schema, typed, chunk):
+    """
+    Merge the column types of a chunk into the schema. A column with only missing
+    values in a chunk says nothing about its type (pandas reads it as float), so it
+    keeps the type seen elsewhere; `typed` holds the columns seen with values.
+    """
+    chunk_schema = column_schema(chunk)
+    present = {name for name in chunk.columns if chunk[name].notna().any()}
+    if schema is None:
+        return chunk_schema, present
+    schema = [meta if meta["name"] in present or meta["name"] in typed else chunk_meta
+              for meta, chunk_meta in zip(schema, chunk_schema)]
+    chunk_schema = [chunk_meta if chunk_meta["name"] in present else meta
+                    for meta, chunk_meta in zip(schema, chunk_schema)]
+    return merge_schemas(schema, chunk_schema), typed | present
+
+
+def _chunk_rows_for(csv_path, memory_mb):
+    """
+    Number of rows per chunk whose parsing, hashing and writing fit in half of
+    memory_mb, estimated from the in-memory size of the first rows.
+    """
+    sample = pd.read_csv(csv_path, nrows=1000)
+    row_bytes = max(1, sample.memory_usage(deep=True, index=False).sum() / max(1, len(sample)))
+    return max(1000, int(memory_mb * 1024 * 1024 / 2 / (row_bytes * CHUNK_OVERHEAD)))
+
+
+def _progress(label, done_bytes, total_bytes, rows, start):
+    percent = 100 * done_bytes / total_bytes if total_bytes else 100
+    elapsed = time.perf_counter() - start
+    print(f" {label}: {percent:5.1f}% ({rows} rows, {elapsed:.1f} s)")
+
+
+def clean_data_streaming(csv_path=DATA_PATH, out_path=CLEANED_CSV, columnar_path=None, chunk_rows=None,
+                         memory_mb=STREAM_MEMORY_MB):
+    """
+    Clean a CSV of any size chunk by chunk, with the same result as clean_data().
+
+    The first pass hashes every row to find the duplicates (keeping sorted runs of 8-byte
+    hashes instead of the rows, see _add_run) and accumulates the missing-value counts
+    and the column types. Two different rows with the same 64-bit hash are taken for
+    duplicates, so a collision silently drops a row (probability about rows^2 / 2^65: 3e-8 at a million rows,
+    3e-4 at a hundred million). The second pass re-reads the file and writes the rows
+    kept, so every chunk is written with the final column types (e.g. an integer column
+    that has missing values further down is written as floats, as pandas would).
+
+    Args:
+        csv_path (str): Raw dataset CSV.
+        out_path (str): Cleaned CSV to write (None to skip).
+        columnar_path (str): Columnar dataset to write (None to skip).
+        chunk_rows (int): Rows per chunk (default: derived from memory_mb).
+        memory_mb (int): Memory budget the chunks are sized for. It is not a ceiling:
+                         the row hashes come on top, 8 bytes per distinct row (800 MB
+                         at 100M rows) plus up to as much again while two runs merge,
+                         and one bit per row for the second pass.
+
+    Returns:
+        dict: rows_read, rows_written, duplicates, missing (pd.Series per column),
+              or None if the file does not exist.
+    """
+    if not os.path.exists(csv_path):
+        print(f" Error: The file '{csv_path}' was not found. Make sure the path is correct.")
+        return None
+
+    print("Starting streaming data cleaning...")
+    chunk_rows = chunk_rows or _chunk_rows_for(csv_path, memory_mb)
+    total_bytes = os.path.getsize(csv_path)
+    start = time.perf_counter()
+
+    # Pass 1: duplicates, missing values and column types
+    seen = []
+    keep_masks = []
+    missing = None
+    schema = None
+    typed = set()
+    rows_read = 0
+    with open(csv_path, "rb") as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_rows):
+            hashes = _row_hashes(chunk)
+            keep = ~pd.Series(hashes).duplicated().to_numpy()
+            keep &= ~_seen_before(seen, hashes)
+            _add_run(seen, np.sort(hashes[keep]))
+            keep_masks.append(np.packbits(keep))
+
+            kept = chunk[keep]
+            counts = kept.isnull().sum()
+            missing = counts if missing is None else missing + counts
+            schema, typed = _merge_chunk_schema(schema, typed, kept)
+            rows_read += len(chunk)
+            _progress("Scanning", f.tell(), total_bytes, rows_read, start)
+
+    rows_written = sum(len(run) for run in seen)
+    if schema is None:
+        print(" Error: the file has no rows.")
+        return None
+    print(f" Removed {rows_read - rows_written} duplicate rows.")
+    print(f"\n🔍 Missing values before cleaning:\n{missing[missing > 0]}")
+
+    # Pass 2: write the rows kept, with the final column types
+    float_columns = [meta["name"] for meta in schema if np.dtype(meta["dtype"]).kind == "f"]
+    writer = None
+    if columnar_path is not None:
+        writer = ColumnarWriter(columnar_path, rows_written,
+                                [dict(meta, name=meta["name"].upper()) for meta in schema])
+    csv_tmp = None
+    if out_path is not None:
+        parent = os.path.dirname(os.path.abspath(out_path))
+        fd, csv_tmp = tempfile.mkstemp(dir=parent, prefix=".cleaned-", suffix=".csv")
+        os.close(fd)
+
+    try:
+        row = 0
+        done = 0
+        with open(csv_path, "rb") as f:
+            for index, chunk in enumerate(pd.read_csv(f, chunksize=chunk_rows)):
+                keep = np.unpackbits(keep_masks[index], count=len(chunk)).astype(bool)
+                kept = chunk[keep]
+                kept = kept.astype({name: np.float64 for name in float_columns})
+                kept.columns = kept.columns.str.upper()
+                if csv_tmp is not None:
+                    kept.to_csv(csv_tmp, mode="w" if index == 0 else "a", header=index == 0, index=False)
+                if writer is not None:
+                    writer.write(row, kept)
+                row += len(kept)
+                done += len(chunk)
+                _progress("Writing", f.tell(), total_bytes, done, start)
+
+        if csv_tmp is not None:
+            os.replace(csv_tmp, out_path)
+            csv_tmp = None
+        if writer is not None:
+            writer.close(source_path=out_path)
+            writer = None
+    finally:
+        if csv_tmp is not None and os.path.exists(csv_tmp):
+            os.remove(csv_tmp)
+        if writer is not None:
+            writer.abort()
+
+    missing.index = missing.index.str.upper()
+    print("\n Data cleaning completed!")
+    print(f"Final dataset shape: ({rows_written}, {len(schema)})")
+    return {"rows_read": rows_read, "rows_written": rows_written,
+            "duplicates": rows_read - rows_written, "missing": missing}
+
+
 # Execute cleaning process
 if __name__ == "__main__":
-    df = load_dataset()
-    df_cleaned = clean_data(df)
+    parser = argparse.ArgumentParser(description="Clean the raw asthma dataset.")
+    parser.add_argument("--stream", action="store_true",
+                        help="Process the CSV in chunks (for files larger than memory)")
+    parser.add_argument("--input", default=DATA_PATH)
+    parser.add_argument("--chunk-rows", type=int, help="Rows per chunk (default: derived from --memory-mb)")
+    parser.add_argument("--memory-mb", type=int, default=STREAM_MEMORY_MB,
+                        help="Memory budget the chunks are sized for (the row hashes take 8 bytes per "
+                             "distinct row on top)")
+    parser.add_argument("--near-duplicates", choices=["report", "merge"],
+                        help="Report or merge patients recorded several times with tiny float differences")
+    args = parser.parse_args()
+    if args.stream and args.near_duplicates:
+        parser.error("--near-duplicates needs the whole dataset in memory and cannot be combined with --stream")
+
+    if args.stream:
+        clean_data_streaming(args.input, CLEANED_CSV, COLUMNAR_PATH, chunk_rows=args.chunk_rows,
+                             memory_mb=args.memory_mb)
+        print(f"\n Cleaned data saved as '{CLEANED_CSV}', columnar copy as '{COLUMNAR_PATH}'.")
+    else:
+        df = load_dataset(args.input)
+        df_cleaned = clean_data(df, near_duplicates=args.near_duplicates)
+
+        # Save cleaned dataset
+        df_cleaned.to_csv(CLEANED_CSV, index=False)
+        print(f"\n Cleaned data saved as '{CLEANED_CSV}'.")
 
-    # Save cleaned dataset
-    df_cleaned.to_csv("cleaned_asthma_data.csv", index=False)
-    print("\n Cleaned data saved as 'cleaned_asthma_data.csv'.")
+        # Save the compact columnar copy used by the dashboard
+        write_columnar(df_cleaned, COLUMNAR_PATH, source_path=CLEANED_CSV)
+        print(f" Columnar copy saved as '{COLUMNAR_PATH}'.")
 
@@ -0,0 +1,344 @@
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+from bitmap_index import normalize_filters
+from file_utils import CACHE_DIR, atomic_write_bytes, remove_stale_versions, version_kept
+
+# Directory holding one cube per dataset version
+CUBE_DIR = os.path.join(CACHE_DIR, "data_cube")
+
+# Categorical dimensions of the cube
+DIMENSIONS = [
+    "DIAGNOSIS", "GENDER", "ETHNICITY", "EDUCATIONLEVEL", "SMOKING", "FAMILYHISTORYASTHMA", "PETALLERGY",
+    "WHEEZING", "SHORTNESSOFBREATH", "CHESTTIGHTNESS", "COUGHING", "NIGHTTIMESYMPTOMS", "EXERCISEINDUCED",
+]
+
+# Numeric measures aggregated in every cell (count, mean and sum of squared deviations)
+MEASURES = [
+    "AGE", "BMI", "PHYSICALACTIVITY", "DIETQUALITY", "SLEEPQUALITY", "POLLUTIONEXPOSURE",
+    "POLLENEXPOSURE", "DUSTEXPOSURE", "LUNGFUNCTIONFEV1", "LUNGFUNCTIONFVC",
+]
+
+# Version of the on-disk layout (cubes in another layout are rebuilt)
+FORMAT_VERSION = 2
+
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+
+class DataCube:
+    """
+    Dense pre-aggregated cube over the categorical risk-factor dimensions.
+
+    Every cell (one combination of dimension values) holds the patient count and, for
+    each measure, the Welford statistics of its values: mean and sum of squared
+    deviations from the mean (M2). Counts, proportions, means and variances of any group
+    of patients defined by the dimensions are then answered by combining cells,
+    independently of the number of patients, and a batch of new patients is folded in
+    with merge() without revisiting the others.
+
+    Attributes:
+        dims (list): Dimension names, in axis order.
+        values (dict): Dimension -> sorted array of its values (axis labels).
+        counts (np.ndarray): Patient count per cell.
+        means (dict): Measure -> array of per-cell means (0 in empty cells).
+        m2 (dict): Measure -> array of per-cell sums of squared deviations.
+        measure_counts (dict): Measure -> per-cell count of non-missing values, for
+                               measures that have missing values.
+    """
+
+    def __init__(self, dims, values, counts, means, m2, measure_counts=None):
+        self.dims = dims
+        self.values = values
+        self.counts = counts
+        self.means = means
+        self.m2 = m2
+        self.measure_counts = measure_counts or {}
+
+    @classmethod
+    def build(cls, df, dims=DIMENSIONS, measures=MEASURES):
+        """
+        Aggregate a dataset into a cube in two passes per measure (np.bincount on cell
+        ids): per-cell means, then squared deviations from them.
+
+        Returns:
+            DataCube
+        """
+        dims = [d for d in dims if d in df.columns]
+        measures = [m for m in measures if m in df.columns]
+
+        values = {}
+        codes = []
+        for dim in dims:
+            column = df[dim].to_numpy()
+            values[dim] = np.unique(column)
+            codes.append(np.searchsorted(values[dim], column))
+        shape = tuple(len(values[d]) for d in dims)
+        cells = np.ravel_multi_index(codes, shape) if dims else np.zeros(len(df), dtype=np.intp)
+        n_cells = int(np.prod(shape))
+
+        counts = np.bincount(cells, minlength=n_cells)
+        means, m2, measure_counts = {}, {}, {}
+        for measure in measures:
+            column = df[measure].to_numpy(dtype=np.float64)
+            present = np.isfinite(column)
+            n = counts
+            if not present.all():
+                n = np.bincount(cells, weights=present, minlength=n_cells)
+                measure_counts[measure] = n.reshape(shape)
+                column = np.where(present, column, 0.0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                mean = np.nan_to_num(np.bincount(cells, weights=column, minlength=n_cells) / n)
+            deviations = np.where(present, column - mean[cells], 0.0)
+            means[measure] = mean.reshape(shape)
+            m2[measure] = np.bincount(cells, weights=deviations * deviations, minlength=n_cells).reshape(shape)
+
+        return cls(dims, values, counts.reshape(shape), means, m2, measure_counts)
+
+    def merge(self, other):
+        """
+        Cube of the patients of both cubes (e.g. the dataset and a batch appended to it).
+
+        Counts add up; means and M2 are combined cell by cell with the parallel form of
+        Welford's algorithm (Chan et al.), which stays exact without the sums of squares.
+        Dimension values missing on one side are added to the axes.
+
+        Returns:
+            DataCube
+        """
+        values = {dim: np.union1d(self.values[dim], other.values[dim]) for dim in self.dims}
+        a, b = self._expanded(values), other._expanded(values)
+        n_a, n_b = a.counts, b.counts
+        counts = n_a + n_b
+
+        means, m2, measure_counts = {}, {}, {}
+        for measure in self.means:
+            n_a, n_b = a._measure_n(measure), b._measure_n(measure)
+            n = n_a + n_b
+            if measure in a.measure_counts or measure in b.measure_counts:
+                measure_counts[measure] = n
+            delta = b.means[measure] - a.means[measure]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                means[measure] = np.nan_to_num(a.means[measure] + delta * n_b / n)
+                m2[measure] = np.nan_to_num(a.m2[measure] + b.m2[measure] + delta * delta * n_a * n_b / n)
+        return DataCube(self.dims, values, counts, means, m2, measure_counts)
+
+    def _expanded(self, values):
+        # Copy of the cube on larger axes (new dimension values get empty cells)
+        if all(len(values[dim]) == len(self.values[dim]) for dim in self.dims):
+            return self
+        positions = np.ix_(*[np.searchsorted(values[dim], self.values[dim]) for dim in self.dims])
+        shape = tuple(len(values[dim]) for dim in self.dims)
+
+        def expand(array):
+            expanded = np.zeros(shape, dtype=array.dtype)
+            expanded[positions] = array
+            return expanded
+
+        return DataCube(self.dims, values, expand(self.counts),
+                        {m: expand(v) for m, v in self.means.items()}, {m: expand(v) for m, v in self.m2.items()},
+                        {m: expand(v) for m, v in self.measure_counts.items()})
+
+    def _measure_n(self, measure):
+        return self.measure_counts.get(measure, self.counts)
+
+    # === QUERIES ===
+    def covers(self, filters, group_by=()):
+        """
+        Check that the filters and grouping only use cube dimensions (no ranges).
+        """
+        for column, value in normalize_filters(filters):
+            if column not in self.values:
+                return False
+            if isinstance(value, tuple) and value[:1] == ("between",):
+                return False
+        return all(dim in self.values for dim in group_by)
+
+    def _selection(self, filters):
+        # Per-axis positions kept by the filters
+        selection = [np.arange(len(self.values[dim])) for dim in self.dims]
+        for column, value in normalize_filters(filters):
+            wanted = value if isinstance(value, tuple) else (value,)
+            axis = self.dims.index(column)
+            selection[axis] = np.flatnonzero(np.isin(self.values[column], wanted))
+        return np.ix_(*selection)
+
+    def _reduce(self, array, filters, group_by):
+        sliced = array[self._selection(filters)]
+        axes = tuple(i for i, dim in enumerate(self.dims) if dim not in group_by)
+        reduced = sliced.sum(axis=axes)
+        # Reorder the remaining axes to follow group_by
+        remaining = [dim for dim in self.dims if dim in group_by]
+        return np.transpose(reduced, [remaining.index(dim) for dim in group_by])
+
+    def labels(self, dim, filters=None):
+        """
+        Returns:
+            np.ndarray: Values of a dimension kept by the filters.
+        """
+        value = dict(normalize_filters(filters)).get(dim)
+        if value is None:
+            return self.values[dim]
+        wanted = value if isinstance(value, tuple) else (value,)
+        return self.values[dim][np.isin(self.values[dim], wanted)]
+
+    def count(self, group_by=(), filters=None):
+        """
+        Patient counts grouped by some dimensions.
+
+        Args:
+            group_by (list): Dimensions kept as axes of the result (in this order).
+            filters (dict): {dimension: value or list of values}.
+
+        Returns:
+            np.ndarray: Counts with one axis per group_by dimension (a scalar without).
+        """
+        return self._reduce(self.counts, filters, group_by)
+
+    def value_counts(self, dim, filters=None):
+        """
+        Counterpart of df[dim].value_counts() on the filtered patients.
+
+        Returns:
+            tuple: (values, counts) arrays, without zero counts, by decreasing count.
+        """
+        counts = self.count([dim], filters)
+        values = self.labels(dim, filters)
+        keep = counts > 0
+        values, counts = values[keep], counts[keep]
+        order = np.argsort(-counts, kind="stable")
+        return values[order], counts[order]
+
+    def proportion(self, dim, value, group_by=(), filters=None):
+        """
+        Share of patients with dim == value (e.g. the asthma rate when dim is DIAGNOSIS).
+        """
+        total = self.count(group_by, filters)
+        hits = self.count(group_by, dict(filters or {}, **{dim: value}))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return hits / total
+
+    def _n(self, measure, group_by, filters):
+        if measure in self.measure_counts:
+            return self._reduce(self.measure_counts[measure], filters, group_by)
+        return self.count(group_by, filters)
+
+    def mean(self, measure, group_by=(), filters=None):
+        """
+        Mean of a measure, or of a dimension (the share of 1s for a 0/1 flag).
+        """
+        if measure in self.values and measure not in self.means:
+            return self._dimension_mean(measure, group_by, filters)
+        n = self._n(measure, group_by, filters)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._reduce(self._measure_n(measure) * self.means[measure], filters, group_by) / n
+
+    def _dimension_mean(self, dim, group_by, filters):
+        counts = self.count(list(group_by) + [dim], filters)
+        labels = self.values[dim][np.isin(self.values[dim], self.labels(dim, filters))]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (counts * labels).sum(axis=-1) / counts.sum(axis=-1)
+
+    def variance(self, measure, group_by=(), filters=None, ddof=1):
+        """
+        Variance of a measure: within-cell M2 plus the spread of the cell means.
+        """
+        n = self._n(measure, group_by, filters)
+        cell_n = self._measure_n(measure)
+        mean = self.mean(measure, group_by, filters)
+        within = self._reduce(self.m2[measure], filters, group_by)
+        between = self._reduce(cell_n * self.means[measure] ** 2, filters, group_by) - n * mean ** 2
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (within + np.maximum(between, 0.0)) / (n - ddof)
+
+    # === PERSISTENCE ===
+    def save(self, path):
+        """
+        Write the cube as a single .npz file (dimension values stored as JSON).
+        """
+        arrays = {"counts": self.counts}
+        for measure in self.means:
+            arrays[f"mean:{measure}"] = self.means[measure]
+            arrays[f"m2:{measure}"] = self.m2[measure]
+        for measure, counts in self.measure_counts.items():
+            arrays[f"n:{measure}"] = counts
+        meta = {"format": FORMAT_VERSION, "dims": self.dims,
+                "values": {dim: self.values[dim].tolist() for dim in self.dims}}
+        arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        atomic_write_bytes(path, buffer.getvalue())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns:
+            DataCube, or None if there is no cube (in the current layout) at `path`.
+        """
+        try:
+            data = np.load(path, allow_pickle=False)
+        except (OSError, ValueError):
+            return None
+        with data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            if meta.get("format") != FORMAT_VERSION:
+                return None
+            means, m2, measure_counts = {}, {}, {}
+            for key in data.files:
+                kind, _, measure = key.partition(":")
+                if kind == "mean":
+                    means[measure] = data[key]
+                elif kind == "m2":
+                    m2[measure] = data[key]
+                elif kind == "n":
+                    measure_counts[measure] = data[key]
+            values = {dim: np.array(meta["values"][dim]) for dim in meta["dims"]}
+            return cls(meta["dims"], values, data["counts"], means, m2, measure_counts)
+
+
+def cube_path(version):
+    """
+    Returns:
+        str: Where the cube of a dataset version is saved.
+    """
+    return os.path.join(CUBE_DIR, f"{version}.npz")
+
+
+def cube_for(df):
+    """
+    Return the cube of a dataset, loading or building it once per dataset version.
+
+    Datasets without a "dataset_version" attribute are not cached.
+
+    Returns:
+        DataCube, or None.
+    """
+    version = df.attrs.get("dataset_version")
+    if version is None:
+        return None
+
+    with _cubes_lock:
+        cube = _cubes.get(version)
+        if cube is None:
+            path = cube_path(version)
+            cube = DataCube.load(path)
+            if cube is None or int(cube.counts.sum()) != len(df):
+                cube = DataCube.build(df)
+                cube.save(path)
+            _cubes[version] = cube
+    return cube
+
+
+def evict_versions(keep):
+    """
+    Drop the cubes of dataset versions not in `keep`, from memory and from CUBE_DIR.
+    """
+    with _cubes_lock:
+        for version in [v for v in _cubes if not version_kept(v, keep)]:
+            del _cubes[version]
+        remove_stale_versions(CUBE_DIR, keep, suffix=".npz")
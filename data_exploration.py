@@ -1,18 +1,37 @@
 import pandas as pd
 import plotly.express as px
 
+from columnar_store import COLUMNAR_PATH, dataset_version, is_fresh, load_columnar
+from file_utils import file_digest
+from bitmap_index import filter_mask
+from data_cube import cube_for
+from histograms import histogram_figure
+from metrics import profiled
+from sql_backend import SqlDataset
+
 # Constants
 DATA_PATH = "cleaned_asthma_data.csv"
 
 
+@profiled("load_data")
 def load_data():
     """
     Load the cleaned dataset for exploration.
+    Uses the memory-mapped columnar copy when it is up to date with the CSV.
+    The digest of the CSV is stored in df.attrs["dataset_version"] so derived results
+    can be cached per dataset version.
     Returns:
         pd.DataFrame: Cleaned dataset
     """
     try:
+        if is_fresh(COLUMNAR_PATH, source_path=DATA_PATH):
+            df = load_columnar(COLUMNAR_PATH)
+            df.attrs["dataset_version"] = dataset_version(COLUMNAR_PATH)
+            print(f"Dataset loaded successfully (columnar). Shape: {df.shape}")
+            return df
+
         df = pd.read_csv(DATA_PATH)
+        df.attrs["dataset_version"] = file_digest(DATA_PATH)[:16]
         print(f"Dataset loaded successfully. Shape: {df.shape}")
         return df
     except Exception as e:
@@ -88,18 +107,43 @@ def explore_demographics(df):
     fig.show()
 
 
+def count_values(df, column, filters, label):
+    """
+    Patient counts per value of a column (value_counts order) for the filtered patients.
+    Answered by a GROUP BY query on the SQLite backend, from the dataset's data cube
+    when it covers the column and filters, from a scan of the rows otherwise.
+    Returns:
+        pd.DataFrame: Columns [label, "Count"]
+    """
+    if isinstance(df, SqlDataset):
+        values, counts = df.value_counts(column, filters)
+        return pd.DataFrame({label: values, "Count": counts})
+
+    cube = cube_for(df)
+    if cube is not None and cube.covers(filters, [column]):
+        values, counts = cube.value_counts(column, filters)
+        return pd.DataFrame({label: values, "Count": counts})
+
+    counts = df.loc[filter_mask(df, filters), column].value_counts().reset_index()
+    counts.columns = [label, "Count"]
+    return counts
+
+
 #  RISK FACTORS & ASTHMA
-def explore_risk_factors(df):
+@profiled("explore_risk_factors")
+def explore_risk_factors(df, filters=None):
     """
     Investigate risk factors: Smoking, Pollution, Family History.
+    Args:
+        df (pd.DataFrame or SqlDataset): Cleaned dataset
+        filters (dict): Optional patient filters (see bitmap_index.normalize_filters)
     Returns:
         tuple: (fig_smoking, fig_pollution, fig_family)
     """
-    asthma_patients = df[df["DIAGNOSIS"] == 1]
+    asthma_filters = dict(filters or {}, DIAGNOSIS=1)
 
     # Smoking & Asthma
-    smoking_counts = asthma_patients["SMOKING"].value_counts().reset_index()
-    smoking_counts.columns = ["Smoking", "Count"]
+    smoking_counts = count_values(df, "SMOKING", asthma_filters, "Smoking")
     fig_smoking = px.bar(
         smoking_counts,
         x="Smoking", y="Count", text="Count",
@@ -110,17 +154,17 @@ def explore_risk_factors(df):
     fig_smoking.update_layout(coloraxis_showscale=False)
 
     # Pollution & Asthma
-    fig_pollution = px.histogram(
-        asthma_patients,
-        x="POLLUTIONEXPOSURE",
+    fig_pollution = histogram_figure(
+        df,
+        "POLLUTIONEXPOSURE",
         nbins=30,
+        filters=asthma_filters,
         title="Pollution Exposure Among Asthma Patients",
-        color_discrete_sequence=["purple"]
+        color="purple"
     )
 
     # Family History
-    family_history_counts = asthma_patients["FAMILYHISTORYASTHMA"].value_counts().reset_index()
-    family_history_counts.columns = ["Family History", "Count"]
+    family_history_counts = count_values(df, "FAMILYHISTORYASTHMA", asthma_filters, "Family History")
     fig_family = px.bar(
         family_history_counts,
         x="Family History", y="Count", text="Count",
@@ -133,15 +177,37 @@ def explore_risk_factors(df):
     return fig_smoking, fig_pollution, fig_family
 
 # ALLERGEN EXPOSURE COMPARISON
-def create_allergen_exposure_figure(df):
+@profiled("create_allergen_exposure_figure")
+def create_allergen_exposure_figure(df, filters=None):
     """
-
+    Compare mean allergen exposure between asthma and non-asthma patients.
+    Args:
+        df (pd.DataFrame or SqlDataset): Cleaned dataset
+        filters (dict): Optional patient filters (see bitmap_index.normalize_filters)
+    Returns:
+        plotly Figure: Grouped bar chart of mean exposures
     """
     allergens = ["PETALLERGY", "POLLENEXPOSURE", "DUSTEXPOSURE"]
 
-    asthma_means = df[df["DIAGNOSIS"] == 1][allergens].mean()
-    non_asthma_means = df[df["DIAGNOSIS"] == 0][allergens].mean()
-
+    if isinstance(df, SqlDataset):
+        means = df.group_means(allergens, "DIAGNOSIS", filters)
+        missing = dict.fromkeys(allergens, float("nan"))
+        asthma_means, non_asthma_means = means.get(1, missing), means.get(0, missing)
+        return _allergen_figure(allergens, asthma_means, non_asthma_means)
+
+    cube = cube_for(df)
+    if cube is not None and cube.covers(filters, ["DIAGNOSIS"]):
+        asthma_means = {a: float(cube.mean(a, filters=dict(filters or {}, DIAGNOSIS=1))) for a in allergens}
+        non_asthma_means = {a: float(cube.mean(a, filters=dict(filters or {}, DIAGNOSIS=0))) for a in allergens}
+    else:
+        if filters:
+            df = df[filter_mask(df, filters)]
+        asthma_means = df[df["DIAGNOSIS"] == 1][allergens].mean()
+        non_asthma_means = df[df["DIAGNOSIS"] == 0][allergens].mean()
+    return _allergen_figure(allergens, asthma_means, non_asthma_means)
+
+
+def _allergen_figure(allergens, asthma_means, non_asthma_means):
     data = []
     for allergen in allergens:
         data.append({"Allergen": allergen, "Mean Exposure": asthma_means[allergen], "Group": "Asthma Patients"})
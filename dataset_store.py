@@ -0,0 +1,513 @@
+"""
+Hot reload of the patient and GBD datasets, without restarting the workers.
+
+Each worker holds its datasets in a DatasetState (figure artifacts, patient frame,
+versions), published by a DatasetStore. A background thread watches the CSV files;
+once a changed file has stopped changing, the next state is prepared off the request
+path:
+
+1. the changed files are loaded and validated (a bad file keeps the current state),
+2. the derived data shared by the workers is rebuilt once, under a file lock:
+   columnar copy, figure artifacts, bitmap index, data cube. With ASTHMA_BACKEND=sqlite
+   the patient CSV is validated in chunks and only the SQLite copy and the artifacts
+   are rebuilt, from the database, so no worker loads the whole frame,
+3. the warm-up hooks (figure cache, page JSON) run against the new state,
+4. the new state replaces the current one with a single reference assignment,
+5. the caches of versions older than the previous one are dropped, in memory and on disk.
+
+Requests pin the state current when they start, so a request in flight finishes on
+the version it started with.
+"""
+import contextlib
+import os
+import threading
+import time
+
+from figure_artifacts import GBD_CSV, PATIENTS_CSV, gbd_version, load_artifacts, patients_version
+from file_utils import CACHE_DIR, file_lock
+from sql_backend import PATIENT_BACKEND, open_database
+
+# Seconds between two checks of the dataset files (0 disables the watcher)
+RELOAD_INTERVAL = int(os.environ.get("ASTHMA_RELOAD_INTERVAL", 10))
+
+# A changed file must keep the same size and mtime this long before it is loaded
+SETTLE_SECONDS = 2
+
+# Clients allowed to ask for an immediate check of the files (POST /_dataset/version)
+LOCAL_ADDRESSES = {"127.0.0.1", "::1"}
+
+# Serializes the rebuilds of the shared derived data across workers
+BUILD_LOCK = os.path.join(CACHE_DIR, "dataset_build.lock")
+
+# Dataset versions whose derived caches are kept: the published one, and the previous
+# one for the requests still pinned to it (like layout_cache.VERSIONS_KEPT)
+VERSIONS_KEPT = 2
+
+WATCHED_FILES = [PATIENTS_CSV, GBD_CSV]
+
+# Columns the dashboard reads from each dataset
+PATIENT_COLUMNS = ["AGE", "GENDER", "ETHNICITY", "EDUCATIONLEVEL", "SMOKING", "FAMILYHISTORYASTHMA",
+                   "PETALLERGY", "POLLUTIONEXPOSURE", "POLLENEXPOSURE", "DUSTEXPOSURE", "DIAGNOSIS"]
+GBD_COLUMNS = ["SDI Category", "Number of deaths (thousands)", "Number of prevalent cases (thousands)"]
+
+
+def file_states(paths=WATCHED_FILES):
+    """
+    Returns:
+        dict: Path -> (size, mtime in ns), or None for a missing file.
+    """
+    states = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            states[path] = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            states[path] = None
+    return states
+
+
+# Rows read at once when a patient CSV is validated without loading it (SQLite backend)
+VALIDATION_CHUNK_ROWS = 100_000
+
+
+# === VALIDATION ===
+def _patient_problems(columns, rows, diagnosis_values, age_values):
+    problems = [f"missing patient column {column}" for column in PATIENT_COLUMNS if column not in columns]
+    if rows == 0:
+        problems.append("the patient dataset has no rows")
+    if not problems:
+        if not set(diagnosis_values) <= {0, 1}:
+            problems.append("DIAGNOSIS has values other than 0 and 1")
+        if age_values == 0:
+            problems.append("AGE has no values")
+    return problems
+
+
+def validate_patients(df):
+    """
+    Returns:
+        list: Problems that make a patient dataset unusable (empty if it is valid).
+    """
+    if df is None:
+        return ["the patient dataset could not be loaded"]
+    if not set(PATIENT_COLUMNS) <= set(df.columns):
+        return _patient_problems(df.columns, len(df), (), 0)
+    return _patient_problems(df.columns, len(df), df["DIAGNOSIS"].dropna().unique().tolist(),
+                             int(df["AGE"].notna().sum()))
+
+
+def validate_patients_csv(path, chunk_rows=VALIDATION_CHUNK_ROWS):
+    """
+    validate_patients() on a CSV read in chunks, without holding the dataset in memory.
+
+    Returns:
+        list: Problems that make the patient CSV unusable (empty if it is valid).
+    """
+    import pandas as pd
+
+    try:
+        columns = list(pd.read_csv(path, nrows=0).columns)
+        if not set(PATIENT_COLUMNS) <= set(columns):
+            return _patient_problems(columns, None, (), 0)
+        rows, diagnosis_values, age_values = 0, set(), 0
+        for chunk in pd.read_csv(path, usecols=["DIAGNOSIS", "AGE"], chunksize=chunk_rows):
+            rows += len(chunk)
+            diagnosis_values.update(chunk["DIAGNOSIS"].dropna().unique().tolist())
+            age_values += int(chunk["AGE"].notna().sum())
+    except Exception as e:
+        print(f" Error reading the patient dataset: {e}")
+        return ["the patient dataset could not be loaded"]
+    return _patient_problems(columns, rows, diagnosis_values, age_values)
+
+
+def validate_gbd(df):
+    """
+    Returns:
+        list: Problems that make a GBD table unusable (empty if it is valid).
+    """
+    if df is None:
+        return ["the GBD table could not be loaded"]
+    problems = [f"missing GBD column '{column}'" for column in GBD_COLUMNS if column not in df.columns]
+    if not problems:
+        if not (df["SDI Category"].str.lower() == "global").any():
+            problems.append("the GBD table has no Global row")
+        for column in GBD_COLUMNS[1:]:
+            if df[column].isna().all():
+                problems.append(f"'{column}' has no numeric values")
+    return problems
+
+
+# === STATE ===
+class DatasetState:
+    """
+    One version of the datasets. Nothing changes once it is published, except the
+    patient frame of the startup state, loaded on first use.
+
+    Attributes:
+        artifacts (dict): Prebuilt figures and GBD totals (see figure_artifacts.py).
+        patients_version (str): Digest of the patient CSV (figure cache key).
+        gbd_version (str): Digest of the GBD CSV.
+        version (str): Version of everything the pages show (HTTP cache key).
+        files (dict): State of the watched files this version was built from.
+        slice_versions (dict): Version of the patients of each DIAGNOSIS value, when the
+                               aggregates maintained by incremental_aggregates.py match
+                               the patient CSV, else None.
+    """
+
+    def __init__(self, artifacts, patients_version, gbd_version, files, df=None, slice_versions=None):
+        self.artifacts = artifacts
+        self.patients_version = patients_version
+        self.gbd_version = gbd_version
+        self.version = f"{patients_version}:{gbd_version}"
+        self.files = files
+        self.slice_versions = slice_versions
+        self._df = df
+        self._lock = threading.Lock()
+
+    def input_version(self, *slices):
+        """
+        Version of the patients with the given DIAGNOSIS values, for figures that only
+        read those: it changes when a batch appends patients to one of them, or when the
+        dataset is replaced.
+
+        Returns:
+            str: Figure cache key (the patients version when no slice versions are known).
+        """
+        if not self.slice_versions or any(str(s) not in self.slice_versions for s in slices):
+            return self.patients_version
+        return ":".join(self.slice_versions[str(s)] for s in slices)
+
+    def patients(self):
+        """
+        Returns:
+            pd.DataFrame: The patient dataset, with its bitmap index built, or a
+                          sql_backend.SqlDataset with ASTHMA_BACKEND=sqlite.
+        """
+        with self._lock:
+            if self._df is None and PATIENT_BACKEND == "sqlite":
+                with file_lock(BUILD_LOCK):
+                    self._df = open_database()
+            elif self._df is None:
+                from bitmap_index import index_for
+                from data_exploration import load_data
+
+                df = load_data()
+                if df is None:
+                    raise ValueError("Failed to load df_asthma. Check your CSV path in data_exploration.py.")
+                index_for(df)
+                self._df = df
+        return self._df
+
+    def loaded_patients(self):
+        """
+        Returns:
+            pd.DataFrame: The patient dataset if it was loaded, else None.
+        """
+        return self._df
+
+    def cache_versions(self):
+        """
+        Returns:
+            set: Versions the caches derived from this state are keyed on (patients
+                 version and DIAGNOSIS slice versions).
+        """
+        versions = {self.patients_version, *(self.slice_versions or {}).values()}
+        if self._df is not None:
+            versions.add(self._df.attrs.get("dataset_version"))
+        return versions - {None}
+
+
+def _load_patients():
+    from data_exploration import load_data
+
+    return load_data()
+
+
+def _load_gbd():
+    from figure_artifacts import _load_gbd
+
+    try:
+        return _load_gbd()
+    except Exception as e:
+        print(f" Error loading the GBD table: {e}")
+        return None
+
+
+def prepare_state(previous):
+    """
+    Load, validate and derive everything a new version of the datasets needs.
+    Call it with BUILD_LOCK held.
+
+    Args:
+        previous (DatasetState): The current state (files unchanged since it are reused).
+
+    Returns:
+        DatasetState: The next state, not yet published.
+
+    Raises:
+        ValueError: If a changed file fails validation.
+    """
+    from bitmap_index import index_for
+    from columnar_store import COLUMNAR_PATH, is_fresh, write_columnar
+    from data_cube import cube_for
+    from incremental_aggregates import slice_versions
+
+    files = file_states()
+    patients_changed = files[PATIENTS_CSV] != previous.files[PATIENTS_CSV]
+    gbd_changed = files[GBD_CSV] != previous.files[GBD_CSV]
+
+    sqlite = PATIENT_BACKEND == "sqlite"
+    problems = []
+    df = previous.loaded_patients()
+    if patients_changed and sqlite:
+        # Checked chunk by chunk: with SQLite the workers never hold the whole frame
+        problems += validate_patients_csv(PATIENTS_CSV)
+    elif patients_changed:
+        df = _load_patients()
+        problems += validate_patients(df)
+    if gbd_changed:
+        problems += validate_gbd(_load_gbd())
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    if sqlite:
+        # The workers query the SQLite copy (built from CSV chunks), and so do the
+        # artifact builders. It is opened even when the patients were never queried:
+        # patients() would otherwise take BUILD_LOCK, which the warmers run under
+        df = open_database()
+        return DatasetState(load_artifacts(), patients_version(), gbd_version(), files, df,
+                            slice_versions(PATIENTS_CSV))
+
+    if patients_changed and not is_fresh(COLUMNAR_PATH, source_path=PATIENTS_CSV):
+        # Memory-mapped copy shared by the workers through the page cache
+        write_columnar(df, COLUMNAR_PATH, source_path=PATIENTS_CSV)
+        df = _load_patients()
+
+    artifacts = load_artifacts()
+    if df is not None:
+        index_for(df)
+        cube_for(df)
+    return DatasetState(artifacts, patients_version(), gbd_version(), files, df, slice_versions(PATIENTS_CSV))
+
+
+def evict_stale_versions(keep):
+    """
+    Drop the caches derived from dataset versions not in `keep`, in this worker's memory
+    and in the per-version cache directories. Call it with BUILD_LOCK held.
+
+    Args:
+        keep (set): Versions still in use (see DatasetState.cache_versions).
+    """
+    import bitmap_index
+    import box_stats
+    import correlations
+    import data_cube
+    import histograms
+    import incremental_aggregates
+    import patient_table
+    import risk_measures
+    import sql_backend
+    from figure_cache import figure_cache
+
+    for module in (bitmap_index, box_stats, correlations, data_cube, histograms, incremental_aggregates,
+                   patient_table, risk_measures, sql_backend):
+        module.evict_versions(keep)
+    figure_cache.evict_versions(keep)
+
+
+# === STORE ===
+class DatasetStore:
+    """
+    The current DatasetState of this worker, kept up to date by a background thread.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._recent = []
+        self._pinned = threading.local()
+        self._reload_lock = threading.Lock()
+        self._warmers = []
+        self._rejected = None
+        self._thread = None
+        self._wake = threading.Event()
+        self.reloads = 0
+        self.last_error = None
+
+    def load(self):
+        """
+        Load the startup state: artifacts (built if stale), patients on first use.
+        """
+        from incremental_aggregates import slice_versions
+
+        with file_lock(BUILD_LOCK):
+            files = file_states()
+            artifacts = load_artifacts()
+            self.publish(DatasetState(artifacts, patients_version(), gbd_version(), files,
+                                      slice_versions=slice_versions(PATIENTS_CSV)))
+        return self._state
+
+    def current(self):
+        """
+        Returns:
+            DatasetState: The state pinned by the running request (or warm-up), else
+                          the latest published state.
+        """
+        state = getattr(self._pinned, "state", None)
+        return state if state is not None else self._state
+
+    @contextlib.contextmanager
+    def pinned(self, state):
+        """
+        Make current() return `state` in this thread for the duration of a block.
+        """
+        previous = getattr(self._pinned, "state", None)
+        self._pinned.state = state
+        try:
+            yield state
+        finally:
+            self._pinned.state = previous
+
+    def publish(self, state):
+        """
+        Make `state` the current state of the requests that start from now on.
+        """
+        self._state = state
+        self._recent = (self._recent + [state])[-VERSIONS_KEPT:]
+
+    def on_reload(self, warm):
+        """
+        Register a function called with the new state pinned, before it is published
+        (e.g. to fill the figure cache and the page JSON of the new version).
+        """
+        self._warmers.append(warm)
+        return warm
+
+    def check(self):
+        """
+        Reload the datasets if a watched file changed and has settled.
+
+        Returns:
+            bool: True if a new state was published.
+        """
+        files = file_states()
+        if files == self._state.files or files == self._rejected:
+            return False
+        # A file still being copied keeps changing: wait for the next check
+        time.sleep(SETTLE_SECONDS)
+        if file_states() != files:
+            return False
+        return self.reload()
+
+    def reload(self):
+        """
+        Prepare, warm and publish the state of the files on disk.
+
+        Returns:
+            bool: True if a new state was published.
+        """
+        with self._reload_lock:
+            files = file_states()
+            try:
+                with file_lock(BUILD_LOCK):
+                    state = prepare_state(self._state)
+                    if file_states() != state.files:
+                        print(" The datasets changed during the reload; retrying on the next check.")
+                        return False
+                    with self.pinned(state):
+                        for warm in self._warmers:
+                            warm()
+            except Exception as e:
+                self._rejected = files
+                self.last_error = str(e)
+                print(f" Dataset reload rejected, keeping version {self._state.version}: {e}")
+                return False
+
+            self.publish(state)
+            # Free the bitmaps, cubes, tables and memory maps of the versions no longer served
+            keep = set().union(*(recent.cache_versions() for recent in self._recent))
+            with file_lock(BUILD_LOCK):
+                evict_stale_versions(keep)
+            self.reloads += 1
+            self._rejected = None
+            self.last_error = None
+            print(f" Datasets reloaded: version {state.version}")
+            return True
+
+    def _run(self, interval):
+        while True:
+            # A check is due every `interval` seconds, or sooner when wake() is called
+            self._wake.wait(interval)
+            self._wake.clear()
+            try:
+                self.check()
+            except Exception as e:
+                print(f" Dataset watcher error: {e}")
+
+    def start_watching(self, interval=RELOAD_INTERVAL):
+        """
+        Start a daemon thread that reloads the datasets when their files change.
+        Safe to call more than once; interval 0 disables it.
+        """
+        if interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        """
+        Ask the watcher thread to check the files now instead of at its next interval.
+
+        Returns:
+            bool: False if no watcher thread is running.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return False
+        self._wake.set()
+        return True
+
+    def status(self):
+        """
+        Returns:
+            dict: Current versions and reload counters of this worker.
+        """
+        state = self._state
+        return {
+            "version": state.version,
+            "patients_version": state.patients_version,
+            "gbd_version": state.gbd_version,
+            "slice_versions": state.slice_versions,
+            "patients_loaded": state.loaded_patients() is not None,
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+            "pid": os.getpid(),
+        }
+
+    def install(self, server):
+        """
+        Pin the current state for each request and serve GET /_dataset/version.
+        POST, from the local host only, wakes the watcher thread so it checks the files
+        now: the reload still runs on that thread, after the settle delay, never on the
+        request thread. Register it before the hooks that read the state (conditional
+        responses, fast paths).
+        """
+        from flask import abort, request
+
+        @server.before_request
+        def _pin_state():
+            self._pinned.state = self._state
+
+        @server.teardown_request
+        def _unpin_state(_exc):
+            self._pinned.state = None
+
+        @server.route("/_dataset/version", methods=["GET", "POST"])
+        def dataset_version():
+            if request.method == "POST":
+                if request.remote_addr not in LOCAL_ADDRESSES:
+                    abort(403)
+                if not self.wake():
+                    abort(409, "The dataset watcher is disabled (ASTHMA_RELOAD_INTERVAL=0).")
+                return self.status(), 202
+            return self.status()
+
+        return dataset_version
@@ -0,0 +1,140 @@
+"""
+Server-side rasterized scatter plots.
+
+A scatter trace ships every point to the browser and stops being usable past about
+100k points. density_figure() bins the points of a zoom window into a fixed pixel grid
+instead (one count grid per color group) and draws each grid as a heatmap, so the
+payload and the browser work depend on the grid size, not on the number of patients.
+The dashboard re-rasterizes the window on every zoom.
+"""
+import math
+
+import numpy as np
+import plotly.graph_objects as go
+
+from bitmap_index import filter_mask
+
+# Pixel grid of a density view
+DENSITY_WIDTH = 300
+DENSITY_HEIGHT = 200
+
+# Colors of the groups, like the diagnosis charts (other groups cycle through the rest)
+GROUP_COLORS = {0: (0, 0, 255), 1: (255, 0, 0)}
+OTHER_COLORS = [(0, 128, 0), (255, 165, 0), (128, 0, 128)]
+
+
+def data_range(lo, hi):
+    """
+    Default window of points spanning [lo, hi] (None when there are no points).
+    """
+    if lo is None:
+        return 0.0, 1.0
+    lo, hi = float(lo), float(hi)
+    if lo == hi:
+        return lo - 0.5, hi + 0.5
+    return lo, hi
+
+
+def _full_range(values):
+    return data_range(values.min(), values.max()) if len(values) else data_range(None, None)
+
+
+def density_counts(df, x_col, y_col, by, x_range=None, y_range=None, filters=None,
+                   width=DENSITY_WIDTH, height=DENSITY_HEIGHT):
+    """
+    Count the points of each group in every pixel of a window.
+
+    Args:
+        df (pd.DataFrame or sql_backend.SqlDataset): Dataset.
+        x_col, y_col (str): Columns on the axes.
+        by (str): Column splitting the points into groups (one grid per value).
+        x_range, y_range (tuple): Window (min, max); the full extent of the filtered
+                                  points when None.
+        filters (dict): Row filters (see bitmap_index.normalize_filters).
+        width, height (int): Pixel grid size.
+
+    Returns:
+        tuple: (x_range, y_range, np.ndarray groups, np.ndarray counts of shape
+               (len(groups), height, width)). Points on the upper edges of the window
+               fall in the last pixel.
+    """
+    from sql_backend import SqlDataset
+
+    if isinstance(df, SqlDataset):
+        return df.density_counts(x_col, y_col, by, x_range, y_range, filters, width, height)
+
+    x = df[x_col].to_numpy(dtype=np.float64)
+    y = df[y_col].to_numpy(dtype=np.float64)
+    groups = df[by].to_numpy()
+    keep = np.isfinite(x) & np.isfinite(y)
+    if filters:
+        keep &= filter_mask(df, filters)
+    x, y, groups = x[keep], y[keep], groups[keep]
+
+    x_range = tuple(x_range) if x_range is not None else _full_range(x)
+    y_range = tuple(y_range) if y_range is not None else _full_range(y)
+    inside = (x >= x_range[0]) & (x <= x_range[1]) & (y >= y_range[0]) & (y <= y_range[1])
+    x, y, groups = x[inside], y[inside], groups[inside]
+
+    columns = np.minimum(((x - x_range[0]) * (width / (x_range[1] - x_range[0]))).astype(np.int64), width - 1)
+    rows = np.minimum(((y - y_range[0]) * (height / (y_range[1] - y_range[0]))).astype(np.int64), height - 1)
+    values, codes = np.unique(groups, return_inverse=True)
+    counts = np.bincount((codes * height + rows) * width + columns, minlength=len(values) * height * width)
+    return x_range, y_range, values, counts.reshape(len(values), height, width)
+
+
+def _colorscale(rgb, zmax):
+    # Transparent at 0, then opacity growing with log(count): dense areas stand out
+    # without hiding the sparse ones
+    r, g, b = rgb
+    stops = [[0.0, f"rgba({r},{g},{b},0)"]]
+    levels = max(1, math.ceil(math.log10(max(zmax, 1))))
+    for i in range(levels + 1):
+        position = min(1.0, 10 ** i / zmax) if zmax > 0 else 1.0
+        if position > stops[-1][0]:
+            stops.append([position, f"rgba({r},{g},{b},{0.25 + 0.75 * i / levels:.3f})"])
+    if stops[-1][0] < 1.0:
+        stops.append([1.0, f"rgba({r},{g},{b},1)"])
+    return stops
+
+
+def density_figure(df, x_col, y_col, by="DIAGNOSIS", x_range=None, y_range=None, filters=None,
+                   width=DENSITY_WIDTH, height=DENSITY_HEIGHT, title=None, labels=None, group_labels=None):
+    """
+    Build a rasterized scatter plot of a window: one heatmap per group, colored like
+    the diagnosis charts, empty pixels transparent.
+
+    Returns:
+        go.Figure: Heatmaps positioned with x0/dx and y0/dy (no coordinate arrays).
+    """
+    labels = labels or {}
+    group_labels = group_labels or {}
+    x_range, y_range, groups, counts = density_counts(df, x_col, y_col, by, x_range, y_range, filters, width, height)
+    dx = (x_range[1] - x_range[0]) / width
+    dy = (y_range[1] - y_range[0]) / height
+
+    fig = go.Figure()
+    for i, group in enumerate(groups):
+        z = counts[i]
+        rgb = GROUP_COLORS.get(group, OTHER_COLORS[i % len(OTHER_COLORS)])
+        name = group_labels.get(group, f"{by}={group}")
+        fig.add_trace(go.Heatmap(
+            z=z,
+            x0=x_range[0] + dx / 2, dx=dx,
+            y0=y_range[0] + dy / 2, dy=dy,
+            zmin=0, zmax=max(int(z.max()), 1),
+            colorscale=_colorscale(rgb, int(z.max())),
+            showscale=False,
+            showlegend=True,
+            name=name,
+            hovertemplate=f"{x_col}=%{{x:.3g}}<br>{y_col}=%{{y:.3g}}<br>{name}: %{{z}} patients<extra></extra>",
+        ))
+
+    fig.update_layout(
+        title=title,
+        xaxis=dict(title=labels.get(x_col, x_col), range=list(x_range)),
+        yaxis=dict(title=labels.get(y_col, y_col), range=list(y_range)),
+        legend_title_text=labels.get(by, by),
+        plot_bgcolor="white",
+    )
+    return fig
@@ -0,0 +1,202 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from file_utils import CACHE_DIR, atomic_write_json, read_json
+from metrics import profiled
+from scraper_facts import fetch_asthma_page, parse_asthma_sections
+
+# On-disk snapshot of the scraped WHO sections
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, "who_asthma_facts.json")
+
+# Age (seconds) after which the snapshot is re-scraped. Override with ASTHMA_FACTS_TTL.
+SNAPSHOT_TTL = int(os.environ.get("ASTHMA_FACTS_TTL", 24 * 3600))
+
+# How often (seconds) the background refresher wakes up to check the snapshot
+CHECK_INTERVAL = 300
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Load the facts snapshot from disk.
+
+    Returns:
+        dict: Snapshot with keys "sections", "etag", "last_modified", "fetched_at"
+              and "content_hash", or None if there is no usable snapshot.
+    """
+    snapshot = read_json(path)
+    if not isinstance(snapshot, dict) or not isinstance(snapshot.get("sections"), dict):
+        return None
+    return snapshot
+
+
+def is_stale(snapshot, ttl=SNAPSHOT_TTL):
+    """
+    Check whether a snapshot is missing or older than the TTL.
+    """
+    if snapshot is None:
+        return True
+    return time.time() - snapshot.get("fetched_at", 0) > ttl
+
+
+def _content_hash(sections):
+    payload = json.dumps(sections, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()[:16]
+
+
+@profiled("fetch_asthma_data")
+def refresh_snapshot(path=SNAPSHOT_PATH, force=False):
+    """
+    Re-scrape the WHO fact sheet and update the snapshot on disk.
+
+    Uses a conditional GET with the stored ETag / Last-Modified so an unchanged page
+    costs a 304 and no parsing. The previous snapshot is kept whenever the request
+    fails or the page yields no sections.
+
+    Args:
+        path (str): Snapshot file path.
+        force (bool): Ignore the stored validators and always download the full page.
+
+    Returns:
+        dict: The current snapshot, or None if none could be obtained.
+    """
+    snapshot = load_snapshot(path)
+    validators = {} if (force or snapshot is None) else snapshot
+
+    try:
+        response = fetch_asthma_page(
+            etag=validators.get("etag"),
+            last_modified=validators.get("last_modified")
+        )
+    except requests.RequestException as e:
+        print(f" Facts refresh failed: {e}")
+        return snapshot
+
+    if response.status_code == 304 and snapshot is not None:
+        snapshot = dict(snapshot, fetched_at=time.time())
+        atomic_write_json(path, snapshot)
+        return snapshot
+
+    if response.status_code != 200:
+        print(f" Facts refresh failed. HTTP Status Code: {response.status_code}")
+        return snapshot
+
+    sections = parse_asthma_sections(response.content)
+    if not sections:
+        print(" Facts refresh returned no sections, keeping the previous snapshot.")
+        return snapshot
+
+    snapshot = {
+        "sections": sections,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "fetched_at": time.time(),
+        "content_hash": _content_hash(sections),
+    }
+    atomic_write_json(path, snapshot)
+    return snapshot
+
+
+class FactsStore:
+    """
+    In-memory view of the facts snapshot, kept up to date by a background thread.
+
+    Readers always get a complete sections dict: refreshed content replaces the
+    current snapshot with a single reference assignment.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, ttl=SNAPSHOT_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._snapshot = load_snapshot(path)
+        self._mtime = self._file_mtime()
+        self._thread = None
+
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def get(self):
+        """
+        Returns:
+            dict: Section title -> content (empty until a snapshot exists).
+        """
+        snapshot = self._snapshot
+        return snapshot["sections"] if snapshot else {}
+
+    @property
+    def version(self):
+        """Hash of the current sections, or None without a snapshot."""
+        snapshot = self._snapshot
+        return snapshot.get("content_hash") if snapshot else None
+
+    def check(self):
+        """
+        Pick up a snapshot written by another process, or re-scrape if it is stale.
+        """
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            snapshot = load_snapshot(self.path)
+            if snapshot is not None:
+                self._snapshot = snapshot
+            self._mtime = mtime
+
+        if is_stale(self._snapshot, self.ttl):
+            snapshot = refresh_snapshot(self.path)
+            if snapshot is not None:
+                self._snapshot = snapshot
+            self._mtime = self._file_mtime()
+
+    def _run(self, interval):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                print(f" Facts refresher error: {e}")
+            time.sleep(interval)
+
+    def start_background_refresh(self, interval=CHECK_INTERVAL):
+        """
+        Start a daemon thread that keeps the snapshot fresh. Safe to call more than once.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="facts-refresher", daemon=True)
+        self._thread.start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the WHO asthma facts snapshot.")
+    parser.add_argument("command", choices=["prewarm", "show"],
+                        help="prewarm: scrape and write the snapshot; show: print the stored snapshot")
+    parser.add_argument("--force", action="store_true", help="Ignore ETag/Last-Modified and download the full page")
+    parser.add_argument("--path", default=SNAPSHOT_PATH, help="Snapshot file path")
+    args = parser.parse_args()
+
+    if args.command == "prewarm":
+        snapshot = refresh_snapshot(args.path, force=args.force)
+        if snapshot is None:
+            print(" No snapshot could be created.")
+            raise SystemExit(1)
+        print(f" Snapshot ready at '{args.path}' ({len(snapshot['sections'])} sections).")
+    else:
+        snapshot = load_snapshot(args.path)
+        if snapshot is None:
+            print(f" No snapshot at '{args.path}'.")
+            raise SystemExit(1)
+        age = time.time() - snapshot.get("fetched_at", 0)
+        print(f" Snapshot '{args.path}': {len(snapshot['sections'])} sections, {age / 3600:.1f}h old, "
+              f"stale={is_stale(snapshot)}")
+        for section, content in snapshot["sections"].items():
+            print(f"\n**{section}**\n{content}\n")
+
+
+if __name__ == "__main__":
+    main()
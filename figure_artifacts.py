@@ -0,0 +1,317 @@
+"""
+Build step for the static dashboard figures.
+
+The figures of the Treemap, Factors, Risk ratios and Correlations tabs (and the global GBD totals) depend only on
+the CSV files, so they are built once, written as JSON artifacts keyed by the hashes of
+their inputs, and loaded by app.py without importing pandas or Plotly Express.
+
+    python figure_artifacts.py build [--force] [--workers 4]
+"""
+import argparse
+import hashlib
+import json
+import os
+
+from file_utils import CACHE_DIR, atomic_write_bytes, atomic_write_json, file_digest, read_json
+
+ARTIFACT_DIR = os.path.join(CACHE_DIR, "artifacts")
+MANIFEST_PATH = os.path.join(ARTIFACT_DIR, "manifest.json")
+
+PATIENTS_CSV = "cleaned_asthma_data.csv"
+GBD_CSV = "table_1_asthma_final_two_columns.csv"
+
+# Processes of the bootstrap and ranking pools (None: the in-process defaults of the
+# server; `build` from the command line uses one per CPU)
+BUILD_WORKERS = None
+
+
+# === BUILDERS ===
+# Each builder returns {artifact name: JSON-serializable value}. pandas and Plotly
+# Express are imported here only, so loading artifacts never pulls them in.
+
+def _load_gbd():
+    from scraper_exploration import load_data, clean_numeric_column
+
+    df = load_data(GBD_CSV)
+    df["Number of deaths (thousands)"] = clean_numeric_column(df["Number of deaths (thousands)"])
+    df["Number of prevalent cases (thousands)"] = clean_numeric_column(df["Number of prevalent cases (thousands)"])
+    return df
+
+
+def _figure_dict(fig):
+    from figure_json import dumps
+
+    # Numeric arrays are kept as typed base64 blocks in the artifact and the pages
+    return json.loads(dumps(fig))
+
+
+def _patients():
+    # With ASTHMA_BACKEND=sqlite the builders query the SQLite copy instead of loading
+    # the whole frame (the caller holds dataset_store.BUILD_LOCK)
+    from sql_backend import PATIENT_BACKEND, open_database
+
+    if PATIENT_BACKEND == "sqlite":
+        return open_database(PATIENTS_CSV)
+    from data_exploration import load_data
+
+    return load_data()
+
+
+def build_risk_factors():
+    from data_exploration import explore_risk_factors
+
+    fig_smoking, fig_pollution, fig_family = explore_risk_factors(_patients())
+    return {
+        "fig_smoking": _figure_dict(fig_smoking),
+        "fig_pollution": _figure_dict(fig_pollution),
+        "fig_family": _figure_dict(fig_family),
+    }
+
+
+def build_allergen():
+    from data_exploration import create_allergen_exposure_figure
+
+    return {"fig_allergen": _figure_dict(create_allergen_exposure_figure(_patients()))}
+
+
+def build_risk_measures():
+    from risk_measures import forest_figure, risk_table
+
+    table = risk_table(_patients(), workers=BUILD_WORKERS)
+    return {"risk_table": table, "fig_forest": _figure_dict(forest_figure(table))}
+
+
+def build_correlations():
+    from correlations import METHODS, correlation_figure, correlation_tables
+
+    tables = correlation_tables(PATIENTS_CSV, workers=BUILD_WORKERS)
+    return {f"fig_correlation_{method}_{scope}": _figure_dict(correlation_figure(tables, method, scope))
+            for method in METHODS for scope in tables["rows"]}
+
+
+def build_treemaps():
+    from scraper_exploration import generate_treemap
+
+    df = _load_gbd()
+    df_sdi = df[df["SDI Category"].str.lower() != "global"].reset_index(drop=True)
+    return {
+        "treemap_deaths": _figure_dict(generate_treemap(
+            df_sdi,
+            "Number of deaths (thousands)",
+            "Reds",
+            "Asthma-related Deaths by SDI Category (2015)"
+        )),
+        "treemap_cases": _figure_dict(generate_treemap(
+            df_sdi,
+            "Number of prevalent cases (thousands)",
+            "Blues",
+            "Asthma Prevalent Cases by SDI Category (2015)"
+        )),
+    }
+
+
+def build_gbd_summary():
+    from scraper_exploration import get_global_values
+
+    summary = get_global_values(_load_gbd())
+    return {"asthma_summary": {key: value.item() if hasattr(value, "item") else value
+                               for key, value in summary.items()}}
+
+
+# Artifact groups: builder + every file whose change requires a rebuild (data and code).
+# "slices" narrows the patient CSV to the DIAGNOSIS values a group reads: it is then
+# keyed on their slice versions (see incremental_aggregates.py), so appending patients
+# to another slice keeps the group. The other patient groups show every patient and
+# are rebuilt in full on any change.
+GROUPS = {
+    "risk_factors": {
+        "build": build_risk_factors,
+        "inputs": [PATIENTS_CSV, "data_exploration.py", "histograms.py", "bitmap_index.py", "data_cube.py",
+                   "sql_backend.py", "figure_json.py"],
+        "slices": {PATIENTS_CSV: ["1"]},
+    },
+    "allergen": {
+        "build": build_allergen,
+        "inputs": [PATIENTS_CSV, "data_exploration.py", "bitmap_index.py", "data_cube.py", "sql_backend.py",
+                   "figure_json.py"],
+    },
+    "risk_measures": {
+        "build": build_risk_measures,
+        "inputs": [PATIENTS_CSV, "risk_measures.py", "sql_backend.py", "figure_json.py"],
+    },
+    "correlations": {
+        "build": build_correlations,
+        "inputs": [PATIENTS_CSV, "correlations.py", "columnar_store.py", "figure_json.py"],
+    },
+    "treemaps": {
+        "build": build_treemaps,
+        "inputs": [GBD_CSV, "scraper_exploration.py", "figure_json.py"],
+    },
+    "gbd_summary": {
+        "build": build_gbd_summary,
+        "inputs": [GBD_CSV, "scraper_exploration.py"],
+    },
+}
+
+
+# === INPUT HASHING ===
+def _input_state(path, previous=None):
+    """
+    Digest of an input file. The previous digest is reused when size and mtime are
+    unchanged, so an up-to-date check costs one stat call per input.
+    """
+    stat = os.stat(path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime:
+        return previous
+    return {"sha256": file_digest(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def _slice_state(path, slices):
+    """
+    Versions of some DIAGNOSIS slices of the patient CSV, or None when the maintained
+    aggregates do not describe the CSV (the file digest is used then).
+    """
+    from incremental_aggregates import slice_versions
+
+    versions = slice_versions(path)
+    if versions is None or any(s not in versions for s in slices):
+        return None
+    return {"sha256": ":".join(versions[s] for s in slices), "slices": slices}
+
+
+def _group_inputs(group, previous):
+    # Current state of every input of a group
+    inputs = {}
+    for path in group["inputs"]:
+        slices = group.get("slices", {}).get(path)
+        state = _slice_state(path, slices) if slices else None
+        inputs[path] = state or _input_state(path, previous.get(path))
+    return inputs
+
+
+def _group_key(inputs):
+    payload = json.dumps({path: state["sha256"] for path, state in inputs.items()}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _read_manifest():
+    manifest = read_json(MANIFEST_PATH)
+    return manifest if isinstance(manifest, dict) else {}
+
+
+def stale_groups(manifest=None):
+    """
+    Returns:
+        list: Names of the artifact groups whose inputs changed or whose file is missing.
+    """
+    manifest = _read_manifest() if manifest is None else manifest
+    stale = []
+    for name, group in GROUPS.items():
+        entry = manifest.get(name)
+        if entry is None or not os.path.exists(os.path.join(ARTIFACT_DIR, entry["file"])):
+            stale.append(name)
+            continue
+        if _group_key(_group_inputs(group, entry["inputs"])) != entry["key"]:
+            stale.append(name)
+    return stale
+
+
+def build_artifacts(force=False, groups=None):
+    """
+    Rebuild the artifact groups whose inputs changed (or all of them with force=True).
+
+    Args:
+        force (bool): Rebuild every group.
+        groups (list): Restrict the build to these groups.
+
+    Returns:
+        list: Names of the groups that were rebuilt.
+    """
+    manifest = _read_manifest()
+    to_build = list(GROUPS) if force else stale_groups(manifest)
+    if groups is not None:
+        to_build = [name for name in to_build if name in groups]
+
+    for name in to_build:
+        group = GROUPS[name]
+        inputs = _group_inputs(group, manifest.get(name, {}).get("inputs", {}))
+        key = _group_key(inputs)
+        file_name = f"{name}-{key}.json"
+
+        atomic_write_bytes(os.path.join(ARTIFACT_DIR, file_name), json.dumps(group["build"]()).encode("utf-8"))
+
+        old_file = manifest.get(name, {}).get("file")
+        manifest[name] = {"key": key, "file": file_name, "inputs": inputs}
+        atomic_write_json(MANIFEST_PATH, manifest)
+        if old_file and old_file != file_name:
+            try:
+                os.remove(os.path.join(ARTIFACT_DIR, old_file))
+            except OSError:
+                pass
+        print(f" Built artifact group '{name}' ({file_name}).")
+
+    return to_build
+
+
+def load_artifacts(build_missing=True):
+    """
+    Load every artifact into a single {name: value} dict.
+
+    Args:
+        build_missing (bool): Build stale or missing groups first (imports pandas and
+                              Plotly Express only in that case).
+
+    Returns:
+        dict: Artifact name -> decoded JSON (figure dicts, GBD summary).
+    """
+    if build_missing and stale_groups():
+        build_artifacts()
+
+    manifest = _read_manifest()
+    artifacts = {}
+    for name in GROUPS:
+        with open(os.path.join(ARTIFACT_DIR, manifest[name]["file"]), "r", encoding="utf-8") as f:
+            artifacts.update(json.load(f))
+    return artifacts
+
+
+def _input_version(group, path):
+    entry = _read_manifest().get(group)
+    if entry is None:
+        return None
+    return entry["inputs"][path]["sha256"][:16]
+
+
+def patients_version():
+    """
+    Returns:
+        str: Short digest of the patient CSV recorded by the last build, or None.
+    """
+    return _input_version("allergen", PATIENTS_CSV)
+
+
+def gbd_version():
+    """
+    Returns:
+        str: Short digest of the GBD CSV recorded by the last build, or None.
+    """
+    return _input_version("treemaps", GBD_CSV)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the static dashboard figure artifacts.")
+    parser.add_argument("command", choices=["build", "status"])
+    parser.add_argument("--force", action="store_true", help="Rebuild every artifact")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes of the bootstrap and ranking pools")
+    args = parser.parse_args()
+    BUILD_WORKERS = args.workers
+
+    if args.command == "build":
+        built = build_artifacts(force=args.force)
+        if not built:
+            print(" All artifacts are up to date.")
+    else:
+        stale = stale_groups()
+        for name in GROUPS:
+            print(f"  {name:<15} {'stale' if name in stale else 'up to date'}")
@@ -0,0 +1,158 @@
+import functools
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from file_utils import CACHE_DIR, atomic_write_bytes, remove_stale_versions, version_kept
+from figure_json import dumps
+
+# Directory of pre-serialized figures: <version>/<callback>/<inputs digest>.json
+FIGURE_CACHE_DIR = os.path.join(CACHE_DIR, "figures")
+
+# Maximum number of figures kept in memory per worker
+MEMORY_ENTRIES = 512
+
+
+class FigureCache:
+    """
+    Two-level cache of pre-serialized figure JSON keyed on (callback, inputs, dataset version).
+
+    Figures are stored as JSON files under `directory`, so every gunicorn worker (and
+    every restart) reuses a figure built once by any of them. Each worker also keeps
+    the most recent figures in memory, both as JSON bytes and decoded.
+    """
+
+    def __init__(self, directory=FIGURE_CACHE_DIR, memory_entries=MEMORY_ENTRIES):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    @staticmethod
+    def inputs_key(inputs):
+        """
+        Stable digest of the callback inputs.
+        """
+        payload = json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")
+        return hashlib.sha1(payload).hexdigest()[:20]
+
+    def _path(self, name, inputs_key, version):
+        return os.path.join(self.directory, str(version), name, f"{inputs_key}.json")
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def lookup(self, name, inputs, version):
+        """
+        Returns:
+            tuple: (JSON bytes, decoded figure dict), or None on a miss.
+        """
+        key = (name, self.inputs_key(inputs), version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return entry
+
+        try:
+            with open(self._path(name, key[1], version), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        entry = (data, json.loads(data))
+        self._remember(key, entry)
+        self._count("disk_hits")
+        return entry
+
+    def store(self, name, inputs, version, figure, persist=True):
+        """
+        Serialize a figure (or a list of figures), write it to the shared store and keep
+        it in memory.
+
+        Args:
+            persist (bool): Also write it to the shared on-disk store.
+
+        Returns:
+            tuple: (JSON bytes, decoded figure dict)
+        """
+        data = dumps(figure)
+        key = (name, self.inputs_key(inputs), version)
+        if persist:
+            atomic_write_bytes(self._path(name, key[1], version), data)
+
+        entry = (data, json.loads(data))
+        self._remember(key, entry)
+        return entry
+
+    def get_or_build(self, name, inputs, version, build, persist=True):
+        """
+        Return the cached figure dict, calling `build()` and storing its result on a miss.
+        """
+        entry = self.lookup(name, inputs, version)
+        if entry is None:
+            self._count("misses")
+            entry = self.store(name, inputs, version, build(), persist=persist)
+        return entry[1]
+
+    def memoize(self, name, version, persist=None):
+        """
+        Decorator caching a figure callback on its positional inputs.
+
+        Args:
+            name (str): Callback name used in the cache key.
+            version (callable): Returns the current dataset version.
+            persist (callable): Given the inputs, decides whether a result goes to the
+                                shared on-disk store (default: always). Use it to keep
+                                open-ended input combinations in memory only.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                keep = persist(*args) if persist else True
+                return self.get_or_build(name, list(args), version(), lambda: func(*args), persist=keep)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters of this worker, plus hit ratio and memory size.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._memory)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        counters["hit_ratio"] = (counters["memory_hits"] + counters["disk_hits"]) / lookups if lookups else None
+        counters["pid"] = os.getpid()
+        return counters
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def evict_versions(self, keep):
+        """
+        Drop the figures of dataset versions not in `keep`, from memory and from the
+        shared on-disk store.
+        """
+        with self._lock:
+            for key in [k for k in self._memory if not version_kept(k[2], keep)]:
+                del self._memory[key]
+        remove_stale_versions(self.directory, keep)
+
+
+# Shared cache used by the dashboard callbacks
+figure_cache = FigureCache()
@@ -0,0 +1,154 @@
+"""
+Compact JSON serialization for figures and layouts.
+
+Numeric arrays inside figure traces are written as typed base64 blocks
+({"dtype": "f8", "bdata": "..."}, the encoding plotly.js decodes natively) instead of
+decimal text, whatever the installed Plotly version does with NumPy arrays. The rest
+is encoded with orjson when it is installed, and with Plotly's encoder otherwise.
+"""
+import base64
+
+import numpy as np
+from plotly.io.json import to_json_plotly
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Shorter arrays stay as JSON lists (the base64 block would not be smaller)
+MIN_PACK_LENGTH = 8
+
+# Integer dtypes understood by plotly.js, smallest first
+_INT_DTYPES = [("i1", np.int8), ("u1", np.uint8), ("i2", np.int16), ("u2", np.uint16),
+               ("i4", np.int32), ("u4", np.uint32)]
+
+# Integers beyond this magnitude would lose precision as float64
+_MAX_EXACT_FLOAT = 2 ** 53
+
+
+def _typed_array(values):
+    """
+    Encode a numeric array as a plotly.js typed array spec, or return None when its
+    dtype has no typed array equivalent.
+    """
+    values = np.asarray(values)
+    if values.size < MIN_PACK_LENGTH:
+        return None
+
+    if values.dtype.kind in "iu":
+        lo, hi = (values.min(), values.max())
+        for code, dtype in _INT_DTYPES:
+            info = np.iinfo(dtype)
+            if info.min <= lo and hi <= info.max:
+                break
+        else:
+            if max(abs(int(lo)), abs(int(hi))) > _MAX_EXACT_FLOAT:
+                return None
+            code, dtype = "f8", np.float64
+    elif values.dtype.kind == "f":
+        code, dtype = ("f4", np.float32) if values.dtype == np.float32 else ("f8", np.float64)
+    else:
+        return None
+
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder("<"))
+    spec = {"dtype": code, "bdata": base64.b64encode(data.tobytes()).decode("ascii")}
+    if values.ndim > 1:
+        spec["shape"] = ", ".join(str(n) for n in values.shape)
+    return spec
+
+
+def _numeric_list(values):
+    # Flat lists of plain numbers only (no bools, None or strings)
+    if len(values) < MIN_PACK_LENGTH:
+        return None
+    first = type(values[0])
+    if first not in (int, float) or any(type(v) is not first for v in values):
+        return None
+    return np.array(values, dtype=np.int64 if first is int else np.float64)
+
+
+def _pack_trace(value):
+    if isinstance(value, dict):
+        return {key: _pack_trace(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        spec = _typed_array(value)
+        return spec if spec is not None else value.tolist()
+    if isinstance(value, (list, tuple)):
+        array = _numeric_list(value)
+        spec = _typed_array(array) if array is not None else None
+        if spec is not None:
+            return spec
+        return [_pack_trace(item) for item in value]
+    return value
+
+
+def _is_figure(value):
+    return isinstance(value, dict) and isinstance(value.get("data"), (list, tuple)) \
+        and set(value) <= {"data", "layout", "frames"}
+
+
+def pack(obj):
+    """
+    Convert figures (go.Figure or figure dicts), lists of figures and Dash component
+    trees to plain JSON values, with the numeric arrays of every trace as typed arrays.
+    """
+    if hasattr(obj, "to_plotly_json"):
+        obj = obj.to_plotly_json()
+    if _is_figure(obj):
+        # The layout (mostly the template) has no data arrays and is left to the encoder
+        return dict(obj, data=[_pack_trace(trace) for trace in obj["data"]])
+    if isinstance(obj, dict):
+        return {key: pack(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [pack(item) for item in obj]
+    return obj
+
+
+def _default(obj):
+    # orjson fallback for values it does not serialize natively
+    if hasattr(obj, "to_plotly_json"):
+        return pack(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(obj):
+    """
+    Serialize a figure, a list of figures or a layout to compact JSON.
+
+    Returns:
+        bytes: UTF-8 JSON.
+    """
+    packed = pack(obj)
+    if orjson is not None:
+        try:
+            return orjson.dumps(packed, default=_default,
+                                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return to_json_plotly(packed).encode("utf-8")
+
+
+def unpack(obj):
+    """
+    Decode the typed arrays of a packed value back to NumPy arrays (for tests and tools
+    reading cached figures in Python).
+    """
+    if isinstance(obj, dict):
+        if "bdata" in obj and "dtype" in obj:
+            dtype = {"f4": "<f4", "f8": "<f8", "i1": "i1", "u1": "u1", "i2": "<i2", "u2": "<u2",
+                     "i4": "<i4", "u4": "<u4"}[obj["dtype"]]
+            array = np.frombuffer(base64.b64decode(obj["bdata"]), dtype=dtype)
+            if "shape" in obj:
+                array = array.reshape([int(n) for n in obj["shape"].split(",")])
+            return array
+        return {key: unpack(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [unpack(item) for item in obj]
+    return obj
@@ -0,0 +1,166 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Directory for generated artifacts (snapshots, caches). Override with ASTHMA_CACHE_DIR.
+CACHE_DIR = os.environ.get("ASTHMA_CACHE_DIR", "cache")
+
+
+def atomic_write_bytes(path, data):
+    """
+    Write bytes to a file atomically.
+
+    The data is written to a temporary file in the same directory and then moved
+    over the target with os.replace, so readers see either the old or the new file,
+    never a partial one.
+
+    Args:
+        path (str): Destination file path.
+        data (bytes): Content to write.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path, obj):
+    """
+    Serialize an object to JSON and write it atomically.
+
+    Args:
+        path (str): Destination file path.
+        obj: JSON-serializable object.
+    """
+    atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8"))
+
+
+def read_json(path):
+    """
+    Read a JSON file.
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        The decoded object, or None if the file is missing or unreadable.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 digest of a file without loading it into memory.
+
+    Args:
+        path (str): File path.
+        chunk_size (int): Bytes read per iteration.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def version_kept(version, keep):
+    """
+    Args:
+        version (str): Version a cache entry is keyed on. Entries keyed on several
+                       versions joined by ":" (e.g. figures of some DIAGNOSIS slices)
+                       depend on each of them.
+        keep (set): Versions still in use.
+
+    Returns:
+        bool: True if every version the entry depends on is in `keep`.
+    """
+    return version is not None and set(str(version).split(":")) <= keep
+
+
+def remove_stale_versions(directory, keep, suffix=""):
+    """
+    Delete the entries of a per-version cache directory whose version is not in use.
+
+    Args:
+        directory (str): Directory holding one "<version><suffix>" file or directory
+                         per version. Hidden entries (temporary files) are left alone.
+        keep (set): Versions still in use (see version_kept).
+        suffix (str): Extension of the entries (e.g. ".json"); other names are skipped.
+
+    Returns:
+        list: Names of the entries removed.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+
+    removed = []
+    for name in names:
+        if name.startswith(".") or not name.endswith(suffix):
+            continue
+        if version_kept(name[:len(name) - len(suffix)], keep):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            continue
+        removed.append(name)
+    return removed
+
+
+_thread_locks = {}
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """
+    Hold an exclusive lock shared by the processes of this machine (e.g. the gunicorn
+    workers) for the duration of a block. Without fcntl (Windows), only the threads of
+    the current process are serialized.
+
+    Args:
+        path (str): Lock file path (created if needed).
+    """
+    thread_lock = _thread_locks.setdefault(path, threading.Lock())
+    with thread_lock:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
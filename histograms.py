@@ -0,0 +1,338 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import plotly.graph_objects as go
+
+from bitmap_index import filter_mask, normalize_filters
+from file_utils import version_kept
+
+# Maximum number of cached (dataset, column, filters, nbins) entries
+CACHE_SIZE = 256
+
+# Largest number of bins a GridHistogram can answer (its grid divides the smaller bin sizes)
+GRID_MAX_BINS = 100
+
+# Upper bound on the cells of a GridHistogram (beyond it the column is not maintained)
+GRID_MAX_CELLS = 1_000_000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _nice_bin_size(span, nbins):
+    # Round span / nbins up to 1, 2, 2.5 or 5 times a power of ten, like Plotly's autobin
+    raw = span / max(nbins, 1)
+    if raw <= 0:
+        return 1.0
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for step in (1, 2, 2.5, 5, 10):
+        if raw <= step * magnitude:
+            return step * magnitude
+    return 10 * magnitude
+
+
+def bin_edges(values, nbins):
+    """
+    Compute at most `nbins` equal-width bins with a round bin size covering `values`.
+
+    Integer data gets integer bin sizes with edges on half-integers, so no value sits on
+    a bin boundary. `values` must not contain NaN.
+
+    Returns:
+        np.ndarray: Bin edges (len = number of bins + 1).
+    """
+    if len(values) == 0:
+        return np.array([0.0, 1.0])
+    return range_bin_edges(float(values.min()), float(values.max()), values.dtype.kind in "iub", nbins)
+
+
+def range_bin_edges(lo, hi, is_integer, nbins):
+    """
+    bin_edges() of any values spanning [lo, hi], from the range alone.
+
+    Returns:
+        np.ndarray: Bin edges (len = number of bins + 1).
+    """
+    size = _nice_bin_size(hi - lo, nbins)
+
+    if is_integer:
+        size = max(1.0, math.ceil(size))
+        start = math.floor(lo) - 0.5
+    else:
+        start = math.floor(lo / size) * size
+
+    n = max(1, math.ceil((hi - start) / size))
+    if start + n * size <= hi:
+        n += 1
+    return start + size * np.arange(n + 1)
+
+
+def histogram_counts(df, column, nbins=20, filters=None):
+    """
+    Bin a column on the server.
+
+    Results are cached per (dataset version, column, filters, nbins) when the DataFrame
+    carries a "dataset_version" attribute (set by data_exploration.load_data).
+
+    Args:
+        df (pd.DataFrame or sql_backend.SqlDataset): Dataset.
+        column (str): Column to bin.
+        nbins (int): Maximum number of bins.
+        filters (dict): Row filters (see bitmap_index.normalize_filters).
+
+    Returns:
+        tuple: (np.ndarray edges, np.ndarray counts)
+    """
+    version = df.attrs.get("dataset_version")
+    key = (version, column, normalize_filters(filters), nbins)
+
+    if version is not None:
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+
+    from sql_backend import SqlDataset
+
+    result = df.histogram_counts(column, nbins, filters) if isinstance(df, SqlDataset) \
+        else _maintained_histogram(df, column, nbins, filters)
+    if result is None:
+        values = df[column].to_numpy()
+        if filters:
+            values = values[filter_mask(df, filters)]
+        if values.dtype.kind == "f":
+            values = values[np.isfinite(values)]
+        edges = bin_edges(values, nbins)
+        counts, _ = np.histogram(values, bins=edges)
+        result = (edges, counts)
+
+    if version is not None:
+        with _cache_lock:
+            _cache[key] = result
+            if len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+    return result
+
+
+def _maintained_histogram(df, column, nbins, filters):
+    # Re-bin the GridHistogram kept by incremental_aggregates when it matches df and the
+    # filters only select slices (e.g. DIAGNOSIS=1); None means "scan the rows"
+    from incremental_aggregates import SLICE_COLUMN, aggregates_for
+
+    slices = None
+    for name, value in normalize_filters(filters):
+        if name != SLICE_COLUMN or isinstance(value, tuple) and value[:1] == ("between",):
+            return None
+        slices = list(value) if isinstance(value, tuple) else [value]
+
+    aggregates = aggregates_for(df)
+    histogram = aggregates.histograms.get(column) if aggregates is not None else None
+    if histogram is None:
+        return None
+    return histogram.histogram(nbins, slices)
+
+
+class GridHistogram:
+    """
+    Counts of a column on a fixed fine grid, per value of a slicing column.
+
+    New rows are added in O(rows) with add(), and histogram() re-bins the grid into
+    exactly the bins bin_edges() would choose for the rows, for up to GRID_MAX_BINS
+    bins: every round bin size (1, 2, 2.5 or 5 times a power of ten) at least as large
+    as the grid step is a whole number of steps, and bins start on a multiple of their
+    size. Integer columns are counted per value; float columns on a grid of half a
+    power of ten, so a value within rounding error of a bin edge may land in the
+    neighbouring bin.
+
+    Attributes:
+        is_integer (bool): The column holds integers.
+        step (float): Width of a grid cell.
+        offset (int): Grid index of the first cell.
+        counts (np.ndarray): Row count per (slice, cell).
+        slices (np.ndarray): Slice values, in row order of `counts`.
+        lo, hi (np.ndarray): Smallest and largest value per slice (NaN when empty).
+    """
+
+    def __init__(self, is_integer, step, offset, counts, slices, lo, hi):
+        self.is_integer = is_integer
+        self.step = step
+        self.offset = offset
+        self.counts = counts
+        self.slices = slices
+        self.lo = lo
+        self.hi = hi
+
+    @classmethod
+    def build(cls, values, slice_values):
+        """
+        Args:
+            values (np.ndarray): Column values (NaN are skipped).
+            slice_values (np.ndarray): Value of the slicing column for every row.
+
+        Returns:
+            GridHistogram, or None if the column does not fit on a grid.
+        """
+        is_integer = values.dtype.kind in "iub"
+        present = np.isfinite(values) if values.dtype.kind == "f" else np.ones(len(values), dtype=bool)
+        slices = np.unique(slice_values)
+        step = 1.0
+        if not is_integer:
+            spans = []
+            for s in slices:
+                selected = values[present & (slice_values == s)]
+                if len(selected) and selected.max() > selected.min():
+                    spans.append(float(selected.max()) - float(selected.min()))
+            if spans:
+                size = _nice_bin_size(min(spans), GRID_MAX_BINS)
+                step = 0.5 * 10 ** math.floor(math.log10(size))
+        empty = np.full(len(slices), np.nan)
+        histogram = cls(is_integer, step, 0, np.zeros((len(slices), 0), dtype=np.int64), slices, empty, empty.copy())
+        return histogram if histogram.add(values, slice_values) else None
+
+    def add(self, values, slice_values):
+        """
+        Count new rows.
+
+        Returns:
+            bool: False if the rows do not fit the grid (non-integer values in an integer
+                  column, or a range too wide); the histogram must then be rebuilt.
+        """
+        present = np.isfinite(values) if values.dtype.kind == "f" else np.ones(len(values), dtype=bool)
+        values, slice_values = values[present].astype(np.float64), slice_values[present]
+        if not len(values):
+            return True
+        if self.is_integer and not np.all(values == np.round(values)):
+            return False
+
+        new_slices = np.setdiff1d(slice_values, self.slices)
+        if len(new_slices):
+            self.slices = np.concatenate([self.slices, new_slices])
+            self.counts = np.vstack([self.counts, np.zeros((len(new_slices), self.counts.shape[1]), dtype=np.int64)])
+            self.lo = np.concatenate([self.lo, np.full(len(new_slices), np.nan)])
+            self.hi = np.concatenate([self.hi, np.full(len(new_slices), np.nan)])
+
+        cells = np.floor(values / self.step).astype(np.int64)
+        first, last = cells.min(), cells.max()
+        if self.counts.shape[1] == 0:
+            self.offset = first
+        low, high = min(first, self.offset), max(last + 1, self.offset + self.counts.shape[1])
+        if high - low > GRID_MAX_CELLS:
+            return False
+        if (low, high) != (self.offset, self.offset + self.counts.shape[1]):
+            counts = np.zeros((len(self.slices), high - low), dtype=np.int64)
+            counts[:, self.offset - low:self.offset - low + self.counts.shape[1]] = self.counts
+            self.counts, self.offset = counts, low
+
+        order = np.argsort(self.slices)
+        rows = order[np.searchsorted(self.slices, slice_values, sorter=order)]
+        np.add.at(self.counts, (rows, cells - self.offset), 1)
+        lo = np.full(len(self.slices), np.inf)
+        hi = np.full(len(self.slices), -np.inf)
+        np.minimum.at(lo, rows, values)
+        np.maximum.at(hi, rows, values)
+        self.lo = np.fmin(self.lo, np.where(np.isinf(lo), np.nan, lo))
+        self.hi = np.fmax(self.hi, np.where(np.isinf(hi), np.nan, hi))
+        return True
+
+    def histogram(self, nbins, slices=None):
+        """
+        Args:
+            nbins (int): Maximum number of bins.
+            slices (list): Slice values to count (all by default).
+
+        Returns:
+            tuple: (np.ndarray edges, np.ndarray counts) as histogram_counts() returns
+                   them, or None if the grid cannot produce these bins.
+        """
+        if nbins > GRID_MAX_BINS:
+            return None
+        rows = np.isin(self.slices, slices) if slices is not None else np.ones(len(self.slices), dtype=bool)
+        if not rows.any() or np.isnan(self.lo[rows]).all():
+            return np.array([0.0, 1.0]), np.zeros(1, dtype=np.int64)
+
+        lo, hi = np.nanmin(self.lo[rows]), np.nanmax(self.hi[rows])
+        edges = range_bin_edges(lo, hi, self.is_integer, nbins)
+        size = edges[1] - edges[0]
+        if self.is_integer:
+            start_cell, size_cells = math.floor(lo), int(round(size))
+        else:
+            size_cells = size / self.step
+            start_cell = edges[0] / self.step
+            if size_cells < 1 or not (np.isclose(size_cells, round(size_cells))
+                                      and np.isclose(start_cell, round(start_cell))):
+                return None
+            start_cell, size_cells = int(round(start_cell)), int(round(size_cells))
+
+        cells = np.arange(self.offset, self.offset + self.counts.shape[1])
+        bins = (cells - start_cell) // size_cells
+        counts = np.bincount(bins, weights=self.counts[rows].sum(axis=0), minlength=len(edges) - 1)
+        return edges, counts[:len(edges) - 1].astype(np.int64)
+
+    def to_arrays(self, prefix):
+        """
+        Returns:
+            dict: The histogram as named arrays (for np.savez), keys starting with prefix.
+        """
+        return {
+            f"{prefix}counts": self.counts,
+            f"{prefix}slices": self.slices,
+            f"{prefix}range": np.vstack([self.lo, self.hi]),
+            f"{prefix}grid": np.array([float(self.is_integer), self.step, float(self.offset)]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        is_integer, step, offset = arrays[f"{prefix}grid"]
+        lo, hi = arrays[f"{prefix}range"]
+        return cls(bool(is_integer), float(step), int(offset), arrays[f"{prefix}counts"],
+                   arrays[f"{prefix}slices"], lo, hi)
+
+
+def histogram_figure(df, column, nbins=20, filters=None, title=None, color=None):
+    """
+    Build a histogram figure from server-side bin counts.
+
+    The figure holds one bar per bin, so its size depends on `nbins` and not on the
+    number of rows, unlike px.histogram which ships every raw value to the browser.
+
+    Returns:
+        go.Figure: Bar chart styled like px.histogram.
+    """
+    edges, counts = histogram_counts(df, column, nbins, filters)
+    centers = (edges[:-1] + edges[1:]) / 2
+    widths = np.diff(edges)
+
+    fig = go.Figure(go.Bar(
+        x=centers,
+        y=counts,
+        width=widths,
+        marker_color=color,
+        customdata=np.column_stack([edges[:-1], edges[1:]]),
+        hovertemplate=f"{column}=%{{customdata[0]:g}} - %{{customdata[1]:g}}<br>count=%{{y}}<extra></extra>",
+    ))
+    fig.update_layout(
+        title=title,
+        bargap=0,
+        xaxis_title=column,
+        yaxis_title="count",
+    )
+    return fig
+
+
+def clear_cache():
+    """
+    Drop every cached histogram (e.g. after the dataset changes).
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def evict_versions(keep):
+    """
+    Drop the histograms of dataset versions not in `keep`.
+    """
+    with _cache_lock:
+        for key in [k for k in _cache if not version_kept(k[0], keep)]:
+            del _cache[key]
@@ -0,0 +1,266 @@
+import gzip
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Responses smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+# Compressed bodies of ETag-tagged responses kept per worker (they are identical across requests)
+COMPRESSED_ENTRIES = 256
+
+COMPRESSIBLE_TYPES = ("application/json", "application/javascript", "text/javascript", "text/css",
+                      "text/html", "text/plain", "image/svg+xml")
+
+# Dash GET endpoints whose response only depends on the code, the URL and the content versions.
+# Callbacks are fetch POSTs, for which browsers never send If-None-Match
+CONDITIONAL_PATHS = ("/", "/_dash-layout", "/_dash-dependencies")
+
+# Files under this path only depend on the code version
+ASSETS_PATH = "/assets/"
+
+ONE_YEAR = 31536000
+
+
+# === COMPRESSION ===
+def _accepted_encoding(header):
+    """
+    Pick the encoding of a response from an Accept-Encoding header (brotli first).
+    """
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            quality = float(match.group(1))
+        accepted[name.strip().lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def compress_responses(server, min_size=MIN_COMPRESS_SIZE):
+    """
+    Compress text responses (callbacks, layouts, JS/CSS bundles) with brotli or gzip.
+
+    Responses carrying an ETag always have the same body, so their compressed form is
+    kept in memory and reused.
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        min_size (int): Responses smaller than this many bytes are sent as is.
+
+    Returns:
+        The registered Flask hook.
+    """
+    compressed = OrderedDict()
+    lock = threading.Lock()
+
+    @server.after_request
+    def _compress_response(response):
+        if response.status_code != 200 or "Content-Encoding" in response.headers:
+            return response
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+        # Bodies generated while they are sent (e.g. /api/score) are not buffered
+        if response.is_streamed and not response.direct_passthrough:
+            return response
+        encoding = _accepted_encoding(request.headers.get("Accept-Encoding", ""))
+        response.vary.add("Accept-Encoding")
+        if encoding is None:
+            return response
+
+        # Static files are streamed from disk; read them so they can be compressed
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (request.path, etag, encoding)
+        body = compressed.get(key) if etag else None
+        if body is None:
+            body = _compress(data, encoding)
+            if etag:
+                with lock:
+                    compressed[key] = body
+                    while len(compressed) > COMPRESSED_ENTRIES:
+                        compressed.popitem(last=False)
+
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            # A strong ETag identifies one representation: tag the encoded one separately
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        return response
+
+    return _compress_response
+
+
+# === CONDITIONAL REQUESTS ===
+def _matches(if_none_match, etag):
+    # Accept the tag of any encoding of the same content
+    for candidate in if_none_match:
+        if candidate == etag or candidate.rsplit("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def code_version(app_folder, assets_folder="assets"):
+    """
+    Digest of what the pages are built from besides the data: the app's modules, its
+    assets and the Dash version. Computed once at startup; identical on every worker of
+    a deploy.
+
+    Args:
+        app_folder (str): Directory of the app's .py modules (not walked recursively).
+        assets_folder (str): Directory of the static assets.
+
+    Returns:
+        str: Short hex digest.
+    """
+    import dash
+
+    digest = hashlib.sha1(dash.__version__.encode("utf-8"))
+    paths = [os.path.join(app_folder, name) for name in sorted(os.listdir(app_folder)) if name.endswith(".py")]
+    for root, dirs, names in os.walk(assets_folder):
+        dirs.sort()
+        paths += [os.path.join(root, name) for name in sorted(names)]
+    for path in paths:
+        digest.update(path.encode("utf-8"))
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def conditional_responses(server, version, code, paths=CONDITIONAL_PATHS, assets_path=ASSETS_PATH):
+    """
+    Tag GET responses of the Dash pages and assets with strong ETags and answer
+    unchanged ones with 304.
+
+    The ETag is derived from the versions the response depends on (code, plus the
+    content version for the pages) and the URL, so it is known before the response is
+    built, is the same on every worker, and no body is hashed. A request carrying the
+    current tag is answered with 304 before Dash builds anything; a new version
+    invalidates every tag. Register this hook before any before_request fast path
+    (e.g. serve_prerendered) so it runs first.
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        version (callable): Returns the current content version (dataset and facts).
+        code (str): Code version, from code_version().
+        paths (tuple): Page endpoints to tag, relative to the app's path prefix.
+        assets_path (str): Path of the static assets (tagged with the code version only).
+
+    Returns:
+        tuple: The registered (before_request, after_request) hooks.
+    """
+    def _etag():
+        if request.method != "GET":
+            return None
+        path = request.path
+        if assets_path in path:
+            key = f"{code}|{path}|{request.query_string.decode('latin-1')}"
+        elif any(path == p or (p != "/" and path.endswith(p)) for p in paths):
+            key = f"{code}|{version()}|{path}|{request.query_string.decode('latin-1')}"
+        else:
+            return None
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:32]
+
+    @server.before_request
+    def _not_modified():
+        if not request.if_none_match:
+            return None
+        etag = _etag()
+        if etag is None or not _matches(request.if_none_match, etag):
+            return None
+        response = server.response_class(status=304)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    @server.after_request
+    def _tag_response(response):
+        if response.status_code != 200:
+            return response
+        etag = _etag()
+        if etag is None:
+            return response
+        response.set_etag(etag)
+        if response.cache_control.max_age is None:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    return _not_modified, _tag_response
+
+
+# === STATIC ASSETS ===
+def hashed_assets(assets_folder="assets", url_path="/assets/"):
+    """
+    Content-hashed URLs of the app's JS and CSS assets.
+
+    Dash links assets with their modification time (?m=...), which changes on every
+    deploy. Pass these lists to dash.Dash(external_scripts=..., external_stylesheets=...)
+    with assets_ignore=ASSETS_IGNORE, so the URL only changes with the content.
+
+    Returns:
+        dict: {"scripts": [...], "stylesheets": [...], "hashes": {url path: digest}}
+    """
+    assets = {"scripts": [], "stylesheets": [], "hashes": {}}
+    if not os.path.isdir(assets_folder):
+        return assets
+    for name in sorted(os.listdir(assets_folder)):
+        kind = {".js": "scripts", ".css": "stylesheets"}.get(os.path.splitext(name)[1])
+        if kind is None:
+            continue
+        with open(os.path.join(assets_folder, name), "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        assets[kind].append(f"{url_path}{name}?v={digest}")
+        assets["hashes"][f"{url_path}{name}"] = digest
+    return assets
+
+
+# Keeps Dash from also linking the assets by modification time
+ASSETS_IGNORE = r".*\.(js|css)$"
+
+
+def cache_hashed_assets(server, hashes):
+    """
+    Serve content-hashed asset URLs with a one-year immutable Cache-Control.
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        hashes (dict): URL path -> content digest, from hashed_assets().
+
+    Returns:
+        The registered Flask hook.
+    """
+    @server.after_request
+    def _cache_asset(response):
+        digest = hashes.get(request.path)
+        if digest is not None and request.args.get("v") == digest and response.status_code == 200:
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = ONE_YEAR
+            response.cache_control.immutable = True
+        return response
+
+    return _cache_asset
@@ -0,0 +1,381 @@
+"""
+Incremental maintenance of the dashboard aggregates for appended patient batches.
+
+append_batch() appends a batch of new patients to the cleaned CSV and its columnar
+copy, and folds the batch into the aggregates the figures read without revisiting the
+existing rows (O(batch) work):
+
+- the data cube (counts, per-cell Welford means and M2), merged with the cube of the
+  batch (see DataCube.merge),
+- one GridHistogram per measure and DIAGNOSIS value, counted on a fixed grid,
+- one version per DIAGNOSIS value ("slice"), chained with a digest of the rows it
+  received.
+
+The aggregates are saved next to the dataset (AGGREGATES_PATH) with the dataset
+version they describe. The dashboard keys the asthma-only figures on the DIAGNOSIS=1
+slice version, so a batch of patients without asthma leaves them cached.
+
+    python incremental_aggregates.py append new_patients.csv
+    python incremental_aggregates.py build     # from the full dataset
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from data_cube import MEASURES, DataCube, cube_path
+from file_utils import atomic_write_json, file_lock, read_json, version_kept
+from histograms import GridHistogram
+
+# Aggregates of the cleaned dataset (cube.npz, histograms.npz, meta.json)
+AGGREGATES_PATH = "cleaned_asthma_data.aggregates"
+META_NAME = "meta.json"
+FORMAT_VERSION = 1
+
+# Column whose values split the patients into independently versioned slices
+SLICE_COLUMN = "DIAGNOSIS"
+
+# Columns with a maintained histogram
+HISTOGRAM_COLUMNS = MEASURES
+
+_aggregates = {}
+_aggregates_lock = threading.Lock()
+
+
+def _chain(version, *parts):
+    return hashlib.sha256(":".join([version, *map(str, parts)]).encode("utf-8")).hexdigest()[:16]
+
+
+def _rows_digest(df):
+    import pandas as pd
+
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+
+def _source_state(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class MaintainedAggregates:
+    """
+    Aggregates of one version of the patient dataset, updated in place by append().
+
+    Attributes:
+        version (str): Dataset version the aggregates describe (df.attrs["dataset_version"]).
+        rows (int): Number of patients.
+        cube (DataCube): Counts, means and variances over the categorical dimensions.
+        histograms (dict): Column -> GridHistogram sliced by SLICE_COLUMN.
+        slice_versions (dict): str(slice value) -> version of the patients in that slice.
+        source (dict): Size and mtime of the CSV the aggregates match.
+    """
+
+    def __init__(self, version, rows, cube, histograms, slice_versions, source=None):
+        self.version = version
+        self.rows = rows
+        self.cube = cube
+        self.histograms = histograms
+        self.slice_versions = slice_versions
+        self.source = source
+
+    @classmethod
+    def build(cls, df):
+        """
+        Aggregate a full dataset (O(rows)).
+
+        Returns:
+            MaintainedAggregates
+        """
+        version = df.attrs.get("dataset_version") or _rows_digest(df)[:16]
+        slices = df[SLICE_COLUMN].to_numpy()
+        histograms = {}
+        for column in HISTOGRAM_COLUMNS:
+            if column in df.columns:
+                histogram = GridHistogram.build(df[column].to_numpy(), slices)
+                if histogram is not None:
+                    histograms[column] = histogram
+        slice_versions = {str(s): _chain(version, s) for s in np.unique(slices)}
+        return cls(version, len(df), DataCube.build(df), histograms, slice_versions)
+
+    def append(self, batch, version):
+        """
+        Fold a batch of new patients into the aggregates (O(batch)).
+
+        Args:
+            batch (pd.DataFrame): The new rows.
+            version (str): Dataset version once the batch is appended.
+
+        Returns:
+            list: Slice values whose patients changed, or None if a histogram no longer
+                  fits its grid (rebuild the aggregates from the dataset then).
+        """
+        slices = batch[SLICE_COLUMN].to_numpy()
+        for column, histogram in self.histograms.items():
+            if not histogram.add(batch[column].to_numpy(), slices):
+                return None
+
+        self.cube = self.cube.merge(DataCube.build(batch))
+        changed = [str(s) for s in np.unique(slices)]
+        for s in changed:
+            rows = batch[batch[SLICE_COLUMN].astype(str) == s]
+            self.slice_versions[s] = _chain(self.slice_versions.get(s, self.version), _rows_digest(rows))
+        self.version = version
+        self.rows += len(batch)
+        return changed
+
+    def save(self, path=AGGREGATES_PATH, csv_path=None):
+        """
+        Write the aggregates to a directory (replaced atomically), and the cube to the
+        cube cache of its version so cube_for() finds it.
+
+        Args:
+            path (str): Target directory.
+            csv_path (str): CSV the aggregates match; its size and mtime are recorded.
+        """
+        from columnar_store import _swap_into_place
+
+        if csv_path is not None:
+            self.source = _source_state(csv_path)
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".aggregates-")
+        try:
+            self.cube.save(os.path.join(tmp_dir, "cube.npz"))
+            arrays = {}
+            for i, histogram in enumerate(self.histograms.values()):
+                arrays.update(histogram.to_arrays(f"{i}:"))
+            np.savez(os.path.join(tmp_dir, "histograms.npz"), **arrays)
+            atomic_write_json(os.path.join(tmp_dir, META_NAME), {
+                "format": FORMAT_VERSION,
+                "version": self.version,
+                "rows": int(self.rows),
+                "histograms": list(self.histograms),
+                "slice_versions": self.slice_versions,
+                "source": self.source,
+            })
+            _swap_into_place(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.cube.save(cube_path(self.version))
+
+    @classmethod
+    def load(cls, path=AGGREGATES_PATH):
+        """
+        Returns:
+            MaintainedAggregates, or None if there are no (readable) aggregates at `path`.
+        """
+        meta = read_meta(path)
+        if meta is None:
+            return None
+        cube = DataCube.load(os.path.join(path, "cube.npz"))
+        if cube is None:
+            return None
+        try:
+            with np.load(os.path.join(path, "histograms.npz"), allow_pickle=False) as arrays:
+                histograms = {column: GridHistogram.from_arrays(arrays, f"{i}:")
+                              for i, column in enumerate(meta["histograms"])}
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(meta["version"], meta["rows"], cube, histograms, meta["slice_versions"], meta["source"])
+
+    def matches(self, csv_path):
+        """
+        Returns:
+            bool: The CSV is the one the aggregates were saved for (size and mtime).
+        """
+        return self.source is not None and os.path.exists(csv_path) and self.source == _source_state(csv_path)
+
+
+def read_meta(path=AGGREGATES_PATH):
+    """
+    Returns:
+        dict: The metadata of saved aggregates, or None if there are none.
+    """
+    meta = read_json(os.path.join(path, META_NAME))
+    if not isinstance(meta, dict) or meta.get("format") != FORMAT_VERSION:
+        return None
+    return meta
+
+
+def slice_versions(csv_path, path=AGGREGATES_PATH):
+    """
+    Slice versions of the saved aggregates, if they match the CSV (two stat calls and a
+    small JSON read, without loading the dataset).
+
+    Returns:
+        dict: str(slice value) -> version, or None.
+    """
+    meta = read_meta(path)
+    if meta is None or not os.path.exists(csv_path) or meta.get("source") != _source_state(csv_path):
+        return None
+    return meta["slice_versions"]
+
+
+def aggregates_for(df, path=AGGREGATES_PATH):
+    """
+    Return the saved aggregates if they describe this dataset version, loading them once
+    per version.
+
+    Returns:
+        MaintainedAggregates, or None.
+    """
+    version = df.attrs.get("dataset_version")
+    if version is None:
+        return None
+
+    with _aggregates_lock:
+        if version not in _aggregates:
+            aggregates = None
+            meta = read_meta(path)
+            if meta is not None and meta["version"] == version and meta["rows"] == len(df):
+                aggregates = MaintainedAggregates.load(path)
+            _aggregates[version] = aggregates
+        return _aggregates[version]
+
+
+def evict_versions(keep):
+    """
+    Drop the aggregates loaded for dataset versions not in `keep`.
+    """
+    with _aggregates_lock:
+        for version in [v for v in _aggregates if not version_kept(v, keep)]:
+            del _aggregates[version]
+
+
+def _rebuild(path):
+    from data_exploration import DATA_PATH, load_data
+
+    df = load_data()
+    if df is None:
+        raise ValueError(f"Failed to load '{DATA_PATH}'.")
+    aggregates = MaintainedAggregates.build(df)
+    aggregates.save(path, csv_path=DATA_PATH)
+    return aggregates
+
+
+def build(path=AGGREGATES_PATH):
+    """
+    Aggregate the full dataset and save the result (one O(rows) pass).
+
+    Returns:
+        MaintainedAggregates
+    """
+    from dataset_store import BUILD_LOCK
+
+    with file_lock(BUILD_LOCK):
+        return _rebuild(path)
+
+
+def append_batch(batch, path=AGGREGATES_PATH):
+    """
+    Append new patients to the dataset and update its aggregates.
+
+    The batch is appended to the cleaned CSV and, when it is up to date, to the
+    columnar copy in place; the saved aggregates are updated with the batch alone.
+    Only when the aggregates are missing or stale (the CSV was replaced) is the full
+    dataset read, once, to rebuild them. Runs under the dataset build lock, so the
+    dashboard workers reload the appended dataset only once it is complete.
+
+    Args:
+        batch (pd.DataFrame): New cleaned patient rows (raw or uppercase column names).
+        path (str): Aggregates directory.
+
+    Returns:
+        dict: version (new dataset version), rows (total), appended, changed_slices,
+              slice_versions.
+
+    Raises:
+        ValueError: If the batch does not have the columns of the dataset or fails
+                    validation.
+    """
+    import pandas as pd
+
+    from columnar_store import COLUMNAR_PATH, append_columnar, is_fresh, write_columnar
+    from data_exploration import DATA_PATH, load_data
+    from dataset_store import BUILD_LOCK, validate_patients
+    from file_utils import file_digest
+
+    batch = batch.rename(columns=str.upper)
+    columns = list(pd.read_csv(DATA_PATH, nrows=0).columns)
+    if set(batch.columns) != set(columns):
+        missing = sorted(set(columns) - set(batch.columns))
+        extra = sorted(set(batch.columns) - set(columns))
+        raise ValueError(f"The batch columns do not match the dataset (missing {missing}, unexpected {extra}).")
+    batch = batch[columns].reset_index(drop=True)
+    problems = validate_patients(batch)
+    if problems:
+        raise ValueError("; ".join(problems))
+
+    with file_lock(BUILD_LOCK):
+        aggregates = MaintainedAggregates.load(path)
+        if aggregates is None or not aggregates.matches(DATA_PATH):
+            print(" No aggregates for the current dataset: building them from the full dataset.")
+            aggregates = _rebuild(path)
+        columnar_fresh = is_fresh(COLUMNAR_PATH, source_path=DATA_PATH)
+
+        with open(DATA_PATH, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+            f.write(batch.to_csv(header=False, index=False).encode("utf-8"))
+
+        manifest = append_columnar(batch, COLUMNAR_PATH, source_path=DATA_PATH) if columnar_fresh else None
+        if columnar_fresh and manifest is None:
+            print(" The batch does not fit the columnar layout: rewriting the columnar copy.")
+            df = pd.read_csv(DATA_PATH)
+            manifest = write_columnar(df, COLUMNAR_PATH, source_path=DATA_PATH)
+        # Same version load_data() gives the appended dataset
+        version = manifest["source"]["sha256"][:16] if manifest is not None else file_digest(DATA_PATH)[:16]
+
+        changed = aggregates.append(batch, version)
+        if changed is None:
+            print(" A histogram outgrew its grid: rebuilding the aggregates from the full dataset.")
+            aggregates = _rebuild(path)
+            changed = list(aggregates.slice_versions)
+        else:
+            aggregates.save(path, csv_path=DATA_PATH)
+
+    return {
+        "version": aggregates.version,
+        "rows": aggregates.rows,
+        "appended": len(batch),
+        "changed_slices": changed,
+        "slice_versions": dict(aggregates.slice_versions),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the dataset aggregates as patient batches are appended.")
+    parser.add_argument("command", choices=["append", "build", "status"])
+    parser.add_argument("batch", nargs="?", help="CSV of new cleaned patient rows (append)")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    if args.command == "append":
+        if not args.batch:
+            parser.error("append needs the CSV of the batch")
+        try:
+            summary = append_batch(pd.read_csv(args.batch))
+        except ValueError as e:
+            print(f" Batch rejected: {e}")
+            raise SystemExit(1)
+        print(f" Appended {summary['appended']} patients ({summary['rows']} in total), "
+              f"version {summary['version']}, changed slices: {', '.join(summary['changed_slices'])}")
+    elif args.command == "build":
+        aggregates = build()
+        print(f" Aggregates of {aggregates.rows} patients saved as '{AGGREGATES_PATH}' (version {aggregates.version}).")
+
+    meta = read_meta()
+    if meta is None:
+        print(f" No aggregates at '{AGGREGATES_PATH}'. Run 'python incremental_aggregates.py build' first.")
+    else:
+        print(json.dumps({k: meta[k] for k in ["version", "rows", "slice_versions"]}, indent=2))
@@ -0,0 +1,118 @@
+import json
+import threading
+
+from flask import Response, request
+
+from figure_json import dumps
+
+# Versions of each page kept: the new one, and the previous one for the requests still
+# pinned to it while a reloaded dataset is published
+VERSIONS_KEPT = 2
+
+
+def _keep_recent(entries, key):
+    # Entries are in insertion order: drop the oldest versions of the page of `key`
+    same_page = [k for k in entries if k[0] == key[0] and k != key]
+    stale = set(same_page[:max(0, len(same_page) - (VERSIONS_KEPT - 1))])
+    return {k: v for k, v in entries.items() if k not in stale}
+
+
+class LayoutCache:
+    """
+    Builds page layouts lazily and keeps their serialized JSON.
+
+    Each layout is built the first time it is requested and serialized once per
+    version, so later requests for the same page are a byte copy instead of a walk
+    over the component tree and its embedded figures.
+
+    Args:
+        builders (dict): Page name -> function returning the layout component.
+        versions (dict): Page name -> function returning the version of the content the
+                         page depends on (e.g. the facts snapshot). Pages without an
+                         entry are static.
+    """
+
+    def __init__(self, builders, versions=None):
+        self.builders = builders
+        self.versions = versions or {}
+        self._layouts = {}
+        self._json = {}
+        self._lock = threading.Lock()
+
+    def _version(self, name):
+        version = self.versions.get(name)
+        return version() if version else None
+
+    def get(self, name):
+        """
+        Returns:
+            The layout component of a page, built on first access.
+        """
+        key = (name, self._version(name))
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is None:
+                layout = self.builders[name]()
+                # Drop layouts of older versions of this page
+                self._layouts = _keep_recent(self._layouts, key)
+                self._layouts[key] = layout
+        return layout
+
+    def get_json(self, name):
+        """
+        Returns:
+            bytes: Serialized layout of a page, serialized once per version.
+        """
+        key = (name, self._version(name))
+        data = self._json.get(key)
+        if data is None:
+            data = dumps(self.get(name))
+            with self._lock:
+                self._json = _keep_recent(self._json, key)
+                self._json[key] = data
+        return data
+
+    def built(self):
+        """
+        Returns:
+            list: Names of the pages built so far.
+        """
+        return sorted({name for name, _ in self._layouts})
+
+
+def serve_prerendered(server, output_id, output_prop, resolver):
+    """
+    Answer a Dash callback with pre-serialized JSON, bypassing the callback machinery.
+
+    Registers a Flask hook on /_dash-update-component: when the request targets
+    `output_id.output_prop`, `resolver(input_values)` is called and the bytes it returns
+    are wrapped in Dash's response envelope as-is. Returning None falls back to the
+    regular Dash callback, which must still be registered so the front end knows about it.
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        output_id (str): Component id of the callback output.
+        output_prop (str): Property of the callback output.
+        resolver (callable): list of input values -> bytes or None.
+
+    Returns:
+        The registered Flask hook (remove it from server.before_request_funcs to disable).
+    """
+    target = f"{output_id}.{output_prop}"
+    prefix = ('{"multi":true,"response":{%s:{%s:' % (json.dumps(output_id), json.dumps(output_prop))).encode("utf-8")
+    suffix = b"}}}"
+
+    @server.before_request
+    def _prerendered_response():
+        if request.method != "POST" or not request.path.endswith("/_dash-update-component"):
+            return None
+        body = request.get_json(silent=True) or {}
+        if body.get("output") != target:
+            return None
+
+        data = resolver([item.get("value") for item in body.get("inputs", [])])
+        if data is None:
+            return None
+        return Response(prefix + data + suffix, mimetype="application/json")
+
+    return _prerendered_response
@@ -1,6 +1,8 @@
 import os
 import pandas as pd
 
+from columnar_store import load_columnar
+
 # Define dataset path
 DATA_PATH = "data/asthma_disease_data.csv"
 
@@ -9,7 +11,7 @@ def load_dataset(file_path=DATA_PATH):
     Load and display basic information about the dataset.
 
     Args:
-        file_path (str): Path to the dataset CSV file.
+        file_path (str): Path to the dataset CSV file, or to a columnar dataset directory.
 
     Returns:
         pd.DataFrame: Loaded dataset as a pandas DataFrame, or None if an error occurs.
@@ -21,7 +23,13 @@ def load_dataset(file_path=DATA_PATH):
 
     try:
         # Load the dataset
-        df = pd.read_csv(file_path)
+        if os.path.isdir(file_path):
+            df = load_columnar(file_path)
+            if df is None:
+                print(f" Error: '{file_path}' is not a columnar dataset.")
+                return None
+        else:
+            df = pd.read_csv(file_path)
 
         # Display dataset shape and first rows
         print(f" Dataset successfully loaded! Shape: {df.shape}")
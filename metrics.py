@@ -0,0 +1,312 @@
+"""
+Latency instrumentation for the dashboard.
+
+- phases (data load, figure builds, scraping) and Dash callbacks record latency
+  histograms, decorated with @profiled(...) or wrapped by instrument_callbacks(app)
+- every request records its latency and response size per endpoint / callback output
+- GET /metrics exposes them in the Prometheus text format (per gunicorn worker)
+- responses carry a Server-Timing header with the phases that ran during the request
+- with ASTHMA_PROFILE_SLOW_MS set, requests are sampled by a stack profiler and the
+  collapsed stacks of the slow ones are written to cache/profiles/
+"""
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from file_utils import CACHE_DIR, atomic_write_bytes
+
+# Latency buckets (seconds) and response size buckets (bytes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Requests slower than this (ms) get their sampled stacks dumped; unset disables profiling
+PROFILE_SLOW_MS = os.environ.get("ASTHMA_PROFILE_SLOW_MS")
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")
+
+
+class Histogram:
+    """
+    Cumulative histogram with labels, in the Prometheus sense (counts per upper bound).
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values["buckets"]):
+                lines.append(f"{self.name}_bucket{_labels(key, le=bound)} {count}")
+            lines.append(f"{self.name}_bucket{_labels(key, le='+Inf')} {values['count']}")
+            lines.append(f"{self.name}_sum{_labels(key)} {values['sum']:.6f}")
+            lines.append(f"{self.name}_count{_labels(key)} {values['count']}")
+        return lines
+
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+# === REGISTRY ===
+phase_seconds = Histogram("asthma_phase_duration_seconds",
+                          "Duration of instrumented phases (data load, figure builds, callbacks).",
+                          LATENCY_BUCKETS)
+request_seconds = Histogram("asthma_request_duration_seconds",
+                            "Server-side duration of HTTP requests, by endpoint and callback output.",
+                            LATENCY_BUCKETS)
+response_bytes = Histogram("asthma_response_size_bytes",
+                           "Size of the response bodies as sent (after compression).",
+                           SIZE_BUCKETS)
+
+# Extra gauges collected at scrape time: name -> function returning {labels tuple: value}
+_collectors = {}
+
+# Phase timings of the request running in each thread, for the Server-Timing header
+_request_timings = threading.local()
+
+
+def _record(phase, seconds):
+    phase_seconds.observe(seconds, phase=phase)
+    timings = getattr(_request_timings, "timings", None)
+    if timings is not None:
+        timings.append((phase, seconds))
+
+
+def profiled(phase):
+    """
+    Decorator recording the duration of every call of a function as `phase`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(phase, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class timed:
+    """
+    Context manager recording the duration of a block as `phase`.
+    """
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.phase, time.perf_counter() - self.start)
+        return False
+
+
+def register_collector(name, help_text, collect):
+    """
+    Expose a gauge computed at scrape time (e.g. cache counters).
+
+    Args:
+        name (str): Metric name.
+        help_text (str): Metric description.
+        collect (callable): Returns {tuple of (label, value) pairs: number}.
+    """
+    _collectors[name] = (help_text, collect)
+
+
+def expose():
+    """
+    Returns:
+        str: Every metric of this worker in the Prometheus text format.
+    """
+    lines = []
+    for histogram in (phase_seconds, request_seconds, response_bytes):
+        lines.extend(histogram.expose())
+    for name, (help_text, collect) in sorted(_collectors.items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for key, value in sorted(collect().items()):
+            lines.append(f"{name}{_labels(key)} {value}")
+    lines.append("# HELP asthma_worker_pid Process id of the worker that answered the scrape.")
+    lines.append("# TYPE asthma_worker_pid gauge")
+    lines.append(f"asthma_worker_pid {os.getpid()}")
+    return "\n".join(lines) + "\n"
+
+
+# === SAMPLING PROFILER ===
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads serving requests every `interval` seconds.
+
+    A single daemon thread walks sys._current_frames() while requests are being
+    profiled; the samples of one request are returned as collapsed stacks
+    ("frame;frame;frame count", the input format of flamegraph tools).
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._samples[thread_id] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._samples.pop(thread_id, Counter())
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = list(self._samples)
+            if not active:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for thread_id in active:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                with self._lock:
+                    if thread_id in self._samples:
+                        self._samples[thread_id][";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+
+def _dump_profile(samples, label, seconds):
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms-{label}.txt"
+    name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)[:150]
+    lines = [f"{stack} {count}" for stack, count in samples.most_common()]
+    atomic_write_bytes(os.path.join(PROFILE_DIR, name), ("\n".join(lines) + "\n").encode("utf-8"))
+    print(f" Slow request ({seconds * 1000:.0f} ms, {label}): profile written to {name}")
+
+
+# === FLASK / DASH WIRING ===
+def instrument_callbacks(app):
+    """
+    Wrap every server-side Dash callback registered so far to record its duration
+    (figure build and serialization) as the phase "callback:<output>".
+    """
+    for output, entry in app.callback_map.items():
+        callback = entry.get("callback")
+        if callback is None or getattr(callback, "_instrumented", False):
+            continue
+        entry["callback"] = profiled(f"callback:{output}")(callback)
+        entry["callback"]._instrumented = True
+
+
+def _endpoint():
+    from flask import request
+
+    if request.path.endswith("/_dash-update-component"):
+        body = request.get_json(silent=True) or {}
+        return "callback", body.get("output", "")
+    return "path", request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def instrument_server(server, slow_ms=PROFILE_SLOW_MS):
+    """
+    Record request latencies and sizes, add Server-Timing headers and serve /metrics.
+
+    Register it before the other request hooks so its measurements include them
+    (after_request hooks run in reverse registration order).
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        slow_ms (str or int): Dump a sampled profile of requests slower than this
+                              (default: ASTHMA_PROFILE_SLOW_MS, unset disables it).
+    """
+    from flask import Response, g
+
+    slow_seconds = float(slow_ms) / 1000 if slow_ms not in (None, "") else None
+    profiler = SamplingProfiler() if slow_seconds is not None else None
+
+    @server.route("/metrics")
+    def metrics():
+        return Response(expose(), mimetype="text/plain; version=0.0.4")
+
+    @server.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        _request_timings.timings = []
+        if profiler is not None:
+            profiler.start(threading.get_ident())
+
+    @server.after_request
+    def _record_request(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        seconds = time.perf_counter() - start
+        timings = _request_timings.timings or []
+        _request_timings.timings = None
+
+        label, value = _endpoint()
+        if value != "/metrics":
+            request_seconds.observe(seconds, **{label: value})
+            if not response.is_streamed:
+                response_bytes.observe(len(response.get_data()), **{label: value})
+
+        entries = []
+        for phase, phase_s in timings:
+            name, desc = phase.split(":", 1)[0], phase.replace('"', "")
+            entries.append(f'{name};desc="{desc}";dur={phase_s * 1000:.1f}')
+        entries.append(f"total;dur={seconds * 1000:.1f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+
+        if profiler is not None:
+            samples = profiler.stop(threading.get_ident())
+            if seconds >= slow_seconds and samples:
+                _dump_profile(samples, value, seconds)
+        return response
+
+    @server.teardown_request
+    def _reset(_exc):
+        # after_request does not run when a view raises
+        _request_timings.timings = None
+        if profiler is not None:
+            profiler.stop(threading.get_ident())
+
+    return metrics
@@ -0,0 +1,184 @@
+"""
+Near-duplicate patient detection.
+
+The same patient can reappear with a new id and float values that differ in their
+last digits. Rows are near duplicates when every integer / text column is equal and
+every float column is equal once quantized (within one quantum).
+
+Instead of comparing all pairs, rows are blocked on a hash of AGE, GENDER, ETHNICITY,
+binned BMI and the other exact columns, sorted by their first quantized float inside each
+block, and only neighbours are compared: the cost is one sort of the dataset.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# Float columns are compared after rounding to this many decimals
+DECIMALS = 6
+
+# Width of the BMI bins used for blocking
+BMI_BIN = 1.0
+
+# Columns every block key starts with (the other exact columns are added to it)
+BLOCK_COLUMNS = ["AGE", "GENDER", "ETHNICITY"]
+
+# Columns that identify a record rather than a patient
+IGNORED_COLUMNS = ["PATIENTID"]
+
+# Stand-in for missing values in quantized floats (equal to itself, far from any value)
+_MISSING = np.iinfo(np.int64).min // 2
+
+
+def _columns(df):
+    """
+    Split the columns of df (raw or uppercase names) into exact and float columns.
+    """
+    exact, floats = [], []
+    for name in df.columns:
+        if name.upper() in IGNORED_COLUMNS:
+            continue
+        if pd.api.types.is_float_dtype(df[name]):
+            # Integer columns read as float because of missing values are still exact
+            values = df[name].dropna()
+            if len(values) and np.all(values == np.round(values)):
+                exact.append(name)
+                continue
+            floats.append(name)
+        else:
+            exact.append(name)
+    return exact, floats
+
+
+def _quantize(series, decimals):
+    scaled = np.round(series.to_numpy(dtype=np.float64) * 10 ** decimals)
+    return np.where(np.isnan(scaled), _MISSING, scaled).astype(np.int64)
+
+
+def _find_column(df, name):
+    return next((c for c in df.columns if c.upper() == name), None)
+
+
+def _label_components(n_rows, left, right):
+    """
+    Connected components of the pair graph, labelled by their smallest row position.
+    """
+    labels = np.arange(n_rows)
+    while len(left):
+        smallest = np.minimum(labels[left], labels[right])
+        before = labels.copy()
+        np.minimum.at(labels, left, smallest)
+        np.minimum.at(labels, right, smallest)
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+
+def _block_pairs(keys, quantized):
+    """
+    Pairs of row positions with the same block key and quantized floats within one
+    quantum of each other.
+    """
+    order = np.lexsort([quantized[:, 0], keys]) if quantized.shape[1] else np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = quantized[order]
+    pairs = []
+    # Rows are sorted by (key, first float): a row's candidates are the next few rows
+    for offset in range(1, len(order)):
+        same = keys[offset:] == keys[:-offset]
+        if values.shape[1]:
+            same &= np.abs(values[offset:, 0] - values[:-offset, 0]) <= 1
+        if not same.any():
+            break
+        close = same.copy()
+        for i in range(1, values.shape[1]):
+            close &= np.abs(values[offset:, i] - values[:-offset, i]) <= 1
+        positions = np.flatnonzero(close)
+        pairs.append((order[positions], order[positions + offset]))
+        if not values.shape[1]:
+            # Without floats, equal keys are chained by adjacent rows alone
+            break
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate([p[0] for p in pairs]), np.concatenate([p[1] for p in pairs])
+
+
+def near_duplicate_groups(df, decimals=DECIMALS, bmi_bin=BMI_BIN):
+    """
+    Label the near-duplicate groups of a dataset.
+
+    Args:
+        df (pd.DataFrame): Dataset (raw or cleaned column names).
+        decimals (int): Float columns are compared at this precision.
+        bmi_bin (float): Width of the BMI bins used for blocking.
+
+    Returns:
+        np.ndarray: For every row, the position of the first row of its group (a row
+                    that has no near duplicate is labelled with its own position).
+    """
+    exact, floats = _columns(df)
+    quantized = np.column_stack([_quantize(df[name], decimals) for name in floats]) \
+        if floats else np.empty((len(df), 0), dtype=np.int64)
+
+    block = [name for name in BLOCK_COLUMNS if _find_column(df, name)]
+    block = [_find_column(df, name) for name in block] + [c for c in exact if c.upper() not in BLOCK_COLUMNS]
+    exact_hash = pd.util.hash_pandas_object(df[block], index=False).to_numpy() if block \
+        else np.zeros(len(df), dtype=np.uint64)
+
+    bmi = _find_column(df, "BMI")
+    lefts, rights = [], []
+    # Two BMI grids shifted by half a bin, so near-equal values on a bin edge share a block
+    for shift in ([0.0, 0.5] if bmi is not None else [None]):
+        keys = exact_hash
+        if shift is not None:
+            bins = np.floor(df[bmi].to_numpy(dtype=np.float64) / bmi_bin + shift)
+            bins = pd.util.hash_array(np.nan_to_num(bins, nan=-1.0))
+            keys = pd.util.hash_pandas_object(pd.DataFrame({"k": keys, "b": bins}), index=False).to_numpy()
+        left, right = _block_pairs(keys, quantized)
+        lefts.append(left)
+        rights.append(right)
+
+    return _label_components(len(df), np.concatenate(lefts), np.concatenate(rights))
+
+
+def report_near_duplicates(df, decimals=DECIMALS, bmi_bin=BMI_BIN):
+    """
+    Rows that have at least one near duplicate, grouped.
+
+    Returns:
+        pd.DataFrame: The rows of every group with more than one row, with a GROUP
+                      column (position of the group's first row), sorted by group.
+    """
+    labels = near_duplicate_groups(df, decimals, bmi_bin)
+    sizes = np.bincount(labels, minlength=len(df))
+    in_group = sizes[labels] > 1
+    report = df[in_group].copy()
+    report.insert(0, "GROUP", labels[in_group])
+    return report.sort_values("GROUP", kind="stable")
+
+
+def merge_near_duplicates(df, decimals=DECIMALS, bmi_bin=BMI_BIN):
+    """
+    Keep the first row of every near-duplicate group.
+
+    Returns:
+        pd.DataFrame: df without the later occurrences of each patient.
+    """
+    labels = near_duplicate_groups(df, decimals, bmi_bin)
+    return df[labels == np.arange(len(df))]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find patients recorded several times with tiny differences.")
+    parser.add_argument("csv", nargs="?", default="cleaned_asthma_data.csv")
+    parser.add_argument("--decimals", type=int, default=DECIMALS)
+    parser.add_argument("--bmi-bin", type=float, default=BMI_BIN)
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.csv)
+    report = report_near_duplicates(df, args.decimals, args.bmi_bin)
+    groups = report["GROUP"].nunique()
+    print(f" {len(report) - groups} near-duplicate rows in {groups} groups ({len(df)} rows checked).")
+    if len(report):
+        print(report.head(20).to_string(index=False))
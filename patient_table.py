@@ -0,0 +1,211 @@
+"""
+Pages of the patient records, sorted on any column, for the Patients tab.
+
+Sorting millions of rows on every page request is too slow, so each column gets a
+sort permutation (np.argsort) built once per dataset version and saved as a .npy file
+under SORT_INDEX_DIR. Workers memory-map these files, and a page is a slice of the
+permutation followed by a gather of page_size rows: its cost does not depend on the
+number of patients. With filters, the filtered permutation (the sort permutation
+restricted to the matching rows) is computed on the first page and kept for the next
+ones.
+
+    python patient_table.py build   # prebuild the sort indexes of the current dataset
+"""
+import argparse
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from bitmap_index import filter_mask, normalize_filters
+from file_utils import CACHE_DIR, atomic_write_bytes, remove_stale_versions, version_kept
+
+# Directory holding one sort permutation per column and dataset version
+SORT_INDEX_DIR = os.path.join(CACHE_DIR, "sort_index")
+
+PAGE_SIZE = 25
+
+# Filtered permutations kept per worker (the pages of recent filter + sort combinations)
+FILTERED_ORDERS = 32
+
+_orders = {}
+_filtered = OrderedDict()
+_lock = threading.Lock()
+
+
+def _order_path(version, column):
+    return os.path.join(SORT_INDEX_DIR, version, f"{column}.npy")
+
+
+def _argsort(df, column):
+    values = df[column].to_numpy()
+    order = np.argsort(values, kind="stable")
+    return order.astype(np.int32 if len(order) < 2 ** 31 else np.int64)
+
+
+def sort_order(df, column):
+    """
+    Permutation of the rows sorting `column` in ascending order (stable, missing
+    values last), loaded or built once per dataset version.
+
+    Returns:
+        np.ndarray: Read-only memory map of the permutation (an in-memory array for
+                    datasets without a "dataset_version" attribute).
+    """
+    version = df.attrs.get("dataset_version")
+    if version is None:
+        return _argsort(df, column)
+
+    key = (version, column)
+    with _lock:
+        order = _orders.get(key)
+    if order is not None:
+        return order
+
+    path = _order_path(version, column)
+    if not os.path.exists(path):
+        out = io.BytesIO()
+        np.save(out, _argsort(df, column), allow_pickle=False)
+        atomic_write_bytes(path, out.getvalue())
+    order = np.load(path, mmap_mode="r", allow_pickle=False)
+    if len(order) != len(df):
+        # Left over by another dataset of the same version (should not happen): rebuild in memory
+        order = _argsort(df, column)
+    with _lock:
+        _orders[key] = order
+    return order
+
+
+def build_sort_indexes(df):
+    """
+    Build the sort permutation of every column of a dataset.
+
+    Returns:
+        list: The columns indexed.
+    """
+    for column in df.columns:
+        sort_order(df, column)
+    return list(df.columns)
+
+
+def _missing_start(df, column, order):
+    # Position of the first missing value of `column` in an ascending permutation (they sort last)
+    import pandas as pd
+
+    values = df[column]
+    low, high = 0, len(order)
+    while low < high:
+        middle = (low + high) // 2
+        if pd.isna(values.iat[int(order[middle])]):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def _filtered_order(df, column, filters):
+    # Rows matching the filters, in the order of `column` (row order when column is None)
+    version = df.attrs.get("dataset_version")
+    key = (version, column, normalize_filters(filters))
+    with _lock:
+        order = _filtered.get(key)
+        if order is not None:
+            _filtered.move_to_end(key)
+            return order
+
+    mask = filter_mask(df, filters)
+    if column is None:
+        order = np.flatnonzero(mask)
+    else:
+        order = sort_order(df, column)
+        order = order[mask[order]]
+
+    if version is not None:
+        with _lock:
+            _filtered[key] = order
+            while len(_filtered) > FILTERED_ORDERS:
+                _filtered.popitem(last=False)
+    return order
+
+
+def patient_page(df, sort_by=None, ascending=True, filters=None, page=0, page_size=PAGE_SIZE):
+    """
+    One page of the patients matching the filters, sorted on a column.
+
+    Args:
+        df (pd.DataFrame or sql_backend.SqlDataset): Dataset.
+        sort_by (str): Column to sort on (None: file order).
+        ascending (bool): Sort direction (missing values last either way).
+        filters (dict): Row filters (see bitmap_index.normalize_filters).
+        page (int): Page number, from 0.
+        page_size (int): Rows per page.
+
+    Returns:
+        tuple: (list of row dicts, number of matching patients).
+    """
+    from sql_backend import SqlDataset
+
+    if isinstance(df, SqlDataset):
+        return df.page(sort_by, ascending, filters, page * page_size, page_size)
+
+    if filters:
+        order = _filtered_order(df, sort_by, filters)
+    elif sort_by is not None:
+        order = sort_order(df, sort_by)
+    else:
+        order = None
+
+    total = len(df) if order is None else len(order)
+    start = min(page * page_size, total)
+    stop = min(start + page_size, total)
+    if ascending:
+        rows = np.arange(start, stop) if order is None else order[start:stop]
+    else:
+        # Descending: the same slice counted from the end of the permutation, except that
+        # missing values stay last (in reverse row order), as in SqlDataset.page
+        positions = np.arange(start, stop)
+        if sort_by is not None:
+            present = _missing_start(df, sort_by, order)
+            rows = order[np.where(positions < present, present - 1 - positions, total + present - 1 - positions)]
+        else:
+            rows = total - 1 - positions
+            if order is not None:
+                rows = order[rows]
+    records = df.take(np.asarray(rows, dtype=np.int64)).to_dict("records")
+    return records, total
+
+
+def clear_cache():
+    """
+    Drop the permutations held by this worker (the files stay valid for their version).
+    """
+    with _lock:
+        _orders.clear()
+        _filtered.clear()
+
+
+def evict_versions(keep):
+    """
+    Drop the permutations of dataset versions not in `keep`, from memory and from
+    SORT_INDEX_DIR.
+    """
+    with _lock:
+        for cache in (_orders, _filtered):
+            for key in [k for k in cache if not version_kept(k[0], keep)]:
+                del cache[key]
+        remove_stale_versions(SORT_INDEX_DIR, keep)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sort indexes of the Patients tab.")
+    parser.add_argument("command", choices=["build"])
+    args = parser.parse_args()
+
+    from data_exploration import load_data
+
+    df = load_data()
+    columns = build_sort_indexes(df)
+    print(f" Sort indexes of {len(columns)} columns saved in "
+          f"'{os.path.join(SORT_INDEX_DIR, df.attrs['dataset_version'])}'.")
@@ -0,0 +1,382 @@
+"""
+Association of every binary exposure with the asthma diagnosis.
+
+risk_table() counts the distinct row patterns of the binary columns and DIAGNOSIS (a
+GROUP BY on the SQLite backend), derives every 2x2 table from them, then the odds
+ratio, relative risk and prevalence difference of all columns at once. Confidence
+intervals come from a percentile bootstrap: resampling patients with replacement only
+changes how many times each pattern is drawn, so a batch of replicates is a
+multinomial draw over the patterns followed by the same matrix products. Batches are spread over a process
+pool and seeded per batch, so the intervals do not depend on the number of workers.
+
+    python risk_measures.py [--samples 2000] [--workers 4]
+"""
+import argparse
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from file_utils import CACHE_DIR, atomic_write_json, read_json, remove_stale_versions, version_kept
+
+# Directory holding one JSON file of risk measures per dataset version
+RISK_MEASURES_DIR = os.path.join(CACHE_DIR, "risk_measures")
+
+OUTCOME = "DIAGNOSIS"
+
+# Bootstrap replicates, replicates drawn per batch, confidence level of the intervals
+BOOTSTRAP_SAMPLES = 2000
+BATCH_SIZE = 250
+CONFIDENCE = 0.95
+
+# Processes drawing the bootstrap batches (1 = in the calling process). The workers build
+# the table on their reload thread, and a pool forked from a threaded server inherits
+# the locks of its other threads as they were, so the default is 1; the command line
+# and `figure_artifacts.py build` use one process per CPU.
+BOOTSTRAP_WORKERS = int(os.environ.get("ASTHMA_BOOTSTRAP_WORKERS", 1))
+
+MEASURES = ["odds_ratio", "relative_risk", "prevalence_difference"]
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+# === 2x2 TABLES ===
+def binary_columns(df, outcome=OUTCOME):
+    """
+    Args:
+        df (pd.DataFrame or sql_backend.SqlDataset): Dataset.
+        outcome (str): Outcome column, left out.
+
+    Returns:
+        list: Columns holding only 0 and 1 (no missing values), except the outcome and ids.
+    """
+    from sql_backend import SqlDataset
+
+    if isinstance(df, SqlDataset):
+        return [col for col in df.binary_columns() if col != outcome and col.upper() != "PATIENTID"]
+
+    columns = []
+    for col in df.columns:
+        if col == outcome or col.upper() == "PATIENTID" or df[col].dtype.kind not in "iufb":
+            continue
+        values = df[col].to_numpy()
+        if len(values) and np.isin(values, (0, 1)).all():
+            columns.append(col)
+    return columns
+
+
+def _measures(a, exposed, cases, n):
+    """
+    Odds ratio, relative risk and prevalence difference from the cells of 2x2 tables.
+
+    Args:
+        a, exposed, cases (np.ndarray): Exposed cases, exposed patients and cases, in
+                                        arrays of any (matching) shape.
+        n (int): Number of patients.
+
+    Returns:
+        tuple: (odds ratio, relative risk, prevalence difference) arrays. Tables with an
+               empty cell get 0.5 added to every cell (Haldane correction) for the
+               ratios; the difference is NaN when a group is empty.
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = exposed - a
+    c = cases - a
+    d = n - exposed - c
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prevalence_difference = a / exposed - c / (n - exposed)
+        correction = np.where((a == 0) | (b == 0) | (c == 0) | (d == 0), 0.5, 0.0)
+        a, b, c, d = a + correction, b + correction, c + correction, d + correction
+        odds_ratio = (a * d) / (b * c)
+        relative_risk = (a / (a + b)) / (c / (c + d))
+    return odds_ratio, relative_risk, prevalence_difference
+
+
+# === ROW PATTERNS ===
+def _pattern_order(patterns):
+    # The order np.unique gives the rows (packed into one integer each when they fit, as
+    # a 1-D unique sorts much faster), so the bootstrap does not depend on the source
+    if patterns.shape[1] < 63:
+        return np.argsort(patterns.astype(np.int64) @ (1 << np.arange(patterns.shape[1], dtype=np.int64)))
+    return np.lexsort(patterns.T[::-1])
+
+
+def _unique_rows(rows):
+    if rows.shape[1] < 63:
+        bits = np.arange(rows.shape[1], dtype=np.int64)
+        codes, counts = np.unique(rows.astype(np.int64) @ (1 << bits), return_counts=True)
+        return ((codes[:, None] >> bits) & 1).astype(np.int8), counts
+    return np.unique(rows, axis=0, return_counts=True)
+
+
+def row_patterns(df, columns):
+    """
+    Distinct rows of some 0/1 columns and the number of patients having each. A
+    bootstrap replicate only changes these numbers, so it costs the same at any n.
+
+    Args:
+        df (pd.DataFrame or sql_backend.SqlDataset): Dataset (GROUP BY query on SQLite).
+        columns (list): 0/1 columns without missing values.
+
+    Returns:
+        tuple: ((patterns, columns) int8 array, (patterns,) int64 counts), in a fixed order.
+    """
+    from sql_backend import SqlDataset
+
+    if isinstance(df, SqlDataset):
+        patterns, counts = df.pattern_counts(columns)
+        order = _pattern_order(patterns)
+        return patterns[order], counts[order]
+    return _unique_rows(df[columns].to_numpy(dtype=np.int8))
+
+
+# === BOOTSTRAP ===
+# Worker state, set once per process by the pool initializer
+_worker = {}
+
+
+def _init_worker(exposures, outcome, probabilities, n, seed):
+    _worker.update(exposures=exposures, outcome=outcome, probabilities=probabilities, n=n, seed=seed)
+
+
+def _bootstrap_batch(batch):
+    index, size = batch
+    # One generator per batch: the replicates do not depend on the number of workers
+    rng = np.random.default_rng([_worker["seed"], index])
+    weights = rng.multinomial(_worker["n"], _worker["probabilities"], size=size).astype(np.float64)
+    exposures, outcome = _worker["exposures"], _worker["outcome"]
+    a = weights @ (exposures * outcome[:, None])
+    return np.stack(_measures(a, weights @ exposures, (weights @ outcome)[:, None], _worker["n"]))
+
+
+def _run(batches, exposures, outcome, probabilities, n, seed, workers):
+    # Yields the replicate blocks in batch order
+    initargs = (exposures, outcome, probabilities, n, seed)
+    if workers is None:
+        workers = BOOTSTRAP_WORKERS
+    if workers <= 1:
+        _init_worker(*initargs)
+        for batch in batches:
+            yield _bootstrap_batch(batch)
+        return
+    with multiprocessing.Pool(min(workers, len(batches)), initializer=_init_worker, initargs=initargs) as pool:
+        yield from pool.imap(_bootstrap_batch, batches)
+
+
+def bootstrap_intervals(exposures, outcome, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE, seed=0,
+                        workers=None, batch_size=BATCH_SIZE):
+    """
+    Percentile bootstrap intervals of the measures of every exposure column.
+
+    Args:
+        exposures (np.ndarray): (patients, columns) 0/1 matrix.
+        outcome (np.ndarray): 0/1 outcome of each patient.
+
+    Returns:
+        np.ndarray: See pattern_intervals().
+    """
+    patterns, counts = _unique_rows(np.column_stack([exposures, outcome]).astype(np.int8))
+    return pattern_intervals(patterns, counts, samples, confidence, seed, workers, batch_size)
+
+
+def pattern_intervals(patterns, counts, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE, seed=0,
+                      workers=None, batch_size=BATCH_SIZE):
+    """
+    Percentile bootstrap intervals of the measures of every exposure column, from the
+    row patterns of the patients (see row_patterns).
+
+    Args:
+        patterns (np.ndarray): (patterns, exposures + 1) 0/1 matrix, outcome last.
+        counts (np.ndarray): Patients having each pattern.
+        samples (int): Number of bootstrap replicates.
+        confidence (float): Coverage of the intervals.
+        seed (int): Random seed.
+        workers (int): Processes drawing the batches (None: BOOTSTRAP_WORKERS).
+        batch_size (int): Replicates drawn at once.
+
+    Returns:
+        np.ndarray: (3 measures, 2 bounds, columns) array; NaN where a measure is
+                    undefined in too many replicates.
+    """
+    n = int(counts.sum())
+    patterns = patterns.astype(np.float64)
+    batches = [(i, min(batch_size, samples - start)) for i, start in enumerate(range(0, samples, batch_size))]
+    replicates = np.concatenate(
+        list(_run(batches, patterns[:, :-1], patterns[:, -1], counts / n, n, seed, workers)), axis=1
+    )
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid="ignore"):
+        replicates[~np.isfinite(replicates)] = np.nan
+        bounds = np.nanpercentile(replicates, [100 * alpha, 100 * (1 - alpha)], axis=1)
+    return bounds.transpose(1, 0, 2)
+
+
+# === RISK TABLE ===
+def _table_key(samples, confidence, seed):
+    return f"{samples}|{confidence}|{seed}"
+
+
+def _table_path(version):
+    return os.path.join(RISK_MEASURES_DIR, f"{version}.json")
+
+
+def risk_table(df, outcome=OUTCOME, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE, seed=0,
+               workers=None):
+    """
+    Odds ratio, relative risk and prevalence difference of every binary column against
+    the outcome, with bootstrap confidence intervals.
+
+    When the DataFrame carries a "dataset_version" attribute the result is cached in
+    memory and in a per-version JSON file under RISK_MEASURES_DIR.
+
+    Returns:
+        list: One dict per column (column, a, b, c, d cell counts, and for each measure
+              its estimate plus "<measure>_low" / "<measure>_high" bounds), sorted by
+              decreasing odds ratio.
+    """
+    version = df.attrs.get("dataset_version")
+    key = _table_key(samples, confidence, seed)
+
+    if version is not None:
+        with _cache_lock:
+            stored = _cache.get(version)
+            if stored is None:
+                stored = read_json(_table_path(version)) or {}
+                _cache[version] = stored
+            if key in stored:
+                return stored[key]
+
+    columns = binary_columns(df, outcome)
+    patterns, counts = row_patterns(df, columns + [outcome])
+    exposures, y = patterns[:, :-1].astype(np.int64), patterns[:, -1].astype(np.int64)
+    n = int(counts.sum())
+
+    # Every 2x2 table at once: exposed cases, exposed patients and cases
+    a = (counts * y) @ exposures
+    exposed = counts @ exposures
+    cases = int(counts @ y)
+    estimates = _measures(a, exposed, cases, n)
+    bounds = pattern_intervals(patterns, counts, samples, confidence, seed, workers)
+
+    def _number(value):
+        return float(value) if np.isfinite(value) else None
+
+    result = []
+    for j, col in enumerate(columns):
+        row = {
+            "column": col,
+            "a": int(a[j]),
+            "b": int(exposed[j] - a[j]),
+            "c": int(cases - a[j]),
+            "d": int(n - exposed[j] - cases + a[j]),
+        }
+        for m, measure in enumerate(MEASURES):
+            row[measure] = _number(estimates[m][j])
+            row[f"{measure}_low"] = _number(bounds[m, 0, j])
+            row[f"{measure}_high"] = _number(bounds[m, 1, j])
+        result.append(row)
+    result.sort(key=lambda row: -(row["odds_ratio"] or 0))
+
+    if version is not None:
+        with _cache_lock:
+            stored = dict(_cache.get(version, {}))
+            stored[key] = result
+            _cache[version] = stored
+            atomic_write_json(_table_path(version), stored)
+    return result
+
+
+# === FOREST PLOT ===
+def forest_figure(table, title="Risk Factors of Asthma", confidence=CONFIDENCE):
+    """
+    Forest plot of a risk table: one row per exposure and one panel per measure (ratios
+    on log axes), with the estimate and its bootstrap interval.
+
+    Returns:
+        go.Figure: Three panels sharing the exposure axis, highest odds ratio on top.
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    panels = [
+        ("odds_ratio", "Odds ratio", 1, "log"),
+        ("relative_risk", "Relative risk", 1, "log"),
+        ("prevalence_difference", "Prevalence difference", 0, "linear"),
+    ]
+    rows = table[::-1]
+    labels = [row["column"] for row in rows]
+
+    fig = make_subplots(rows=1, cols=len(panels), shared_yaxes=True, horizontal_spacing=0.03,
+                        subplot_titles=[name for _, name, _, _ in panels])
+    for i, (measure, name, reference, axis_type) in enumerate(panels, start=1):
+        estimates = [row[measure] for row in rows]
+        low = [row[f"{measure}_low"] for row in rows]
+        high = [row[f"{measure}_high"] for row in rows]
+        fig.add_trace(go.Scatter(
+            x=estimates,
+            y=labels,
+            mode="markers",
+            marker=dict(color="red", size=8, symbol="square"),
+            error_x=dict(
+                type="data",
+                symmetric=False,
+                array=[h - e if h is not None and e is not None else 0 for e, h in zip(estimates, high)],
+                arrayminus=[e - l if l is not None and e is not None else 0 for e, l in zip(estimates, low)],
+                color="gray",
+            ),
+            customdata=list(zip(low, high)),
+            hovertemplate=f"%{{y}}<br>{name}: %{{x:.3f}} "
+                          f"[%{{customdata[0]:.3f}}, %{{customdata[1]:.3f}}]<extra></extra>",
+            showlegend=False,
+        ), row=1, col=i)
+        fig.add_vline(x=reference, line=dict(color="black", dash="dash", width=1), row=1, col=i)
+        fig.update_xaxes(type=axis_type, row=1, col=i)
+
+    fig.update_layout(
+        title=f"{title} ({confidence:.0%} bootstrap intervals)",
+        height=max(400, 30 * len(rows) + 150),
+        plot_bgcolor="white",
+    )
+    fig.update_xaxes(showgrid=True, gridcolor="lightgray")
+    return fig
+
+
+def clear_cache():
+    """
+    Drop the in-memory tables (the per-version files stay valid for their version).
+    """
+    with _cache_lock:
+        _cache.clear()
+
+
+def evict_versions(keep):
+    """
+    Drop the tables of dataset versions not in `keep`, from memory and from RISK_MEASURES_DIR.
+    """
+    with _cache_lock:
+        for version in [v for v in _cache if not version_kept(v, keep)]:
+            del _cache[version]
+        remove_stale_versions(RISK_MEASURES_DIR, keep, suffix=".json")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Risk measures of every binary column against the diagnosis.")
+    parser.add_argument("--samples", type=int, default=BOOTSTRAP_SAMPLES, help="Bootstrap replicates")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Bootstrap processes")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from data_exploration import load_data
+
+    def _interval(row, measure):
+        low, estimate, high = (row[f"{measure}{suffix}"] for suffix in ("_low", "", "_high"))
+        if estimate is None:
+            return "n/a"
+        return f"{estimate:.3f} [{low:.3f}, {high:.3f}]" if low is not None else f"{estimate:.3f}"
+
+    table = risk_table(load_data(), samples=args.samples, seed=args.seed, workers=args.workers)
+    print(f"  {'column':<24}" + "".join(f" {m:<26}" for m in MEASURES))
+    for row in table:
+        print(f"  {row['column']:<24}" + "".join(f" {_interval(row, m):<26}" for m in MEASURES))
@@ -0,0 +1,446 @@
+"""
+Logistic model of the asthma diagnosis and the batch scoring API.
+
+The model is trained offline on the cleaned dataset and saved as JSON. The feature
+standardization used during training is folded into the weights, so scoring a batch
+is one matrix product of its raw columns. Each worker loads the weights once, on its
+first scoring request.
+
+POST /api/score takes patient records in the cleaned_asthma_data.csv schema, as CSV
+(text/csv) or JSON (an array of records, or one record per line), and returns the
+diagnosis probability of every record, in the same order and format. The body is
+parsed in chunks as it arrives and the response is streamed chunk by chunk, so the
+memory used does not grow with the size of the upload.
+
+    python risk_model.py train
+    python risk_model.py score patients.csv
+"""
+import argparse
+import io
+import os
+import re
+import threading
+
+import numpy as np
+import orjson
+
+from file_utils import CACHE_DIR, atomic_write_json, file_digest, read_json
+
+DATA_PATH = "cleaned_asthma_data.csv"
+MODEL_PATH = os.path.join(CACHE_DIR, "risk_model.json")
+SCORE_PATH = "/api/score"
+
+TARGET = "DIAGNOSIS"
+ID_COLUMN = "PATIENTID"
+
+# Coded columns entered as one indicator per code (the first code is the reference)
+CATEGORICAL_COLUMNS = ["ETHNICITY", "EDUCATIONLEVEL"]
+
+# L2 penalty on the standardized weights (the intercept is not penalized)
+RIDGE = 1.0
+
+# Records parsed and scored at once, and bytes read at once from a JSON body
+CHUNK_ROWS = 100_000
+JSON_BLOCK_BYTES = 4 << 20
+
+_model = None
+_model_lock = threading.Lock()
+
+
+# === MODEL ===
+class LogisticModel:
+    """
+    Logistic regression on raw patient columns.
+
+    Args:
+        features (list): {"column": name} for a column used as is, or
+                         {"column": name, "value": code} for the indicator of a code.
+        weights (list): One weight per feature, on the raw column scale.
+        intercept (float): Intercept on the raw column scale.
+        meta (dict): Training details (dataset version, rows, log-loss, AUC).
+    """
+
+    def __init__(self, features, weights, intercept, meta=None):
+        self.features = features
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.meta = meta or {}
+
+    @property
+    def columns(self):
+        """
+        Returns:
+            list: Input columns the model reads, in first-use order.
+        """
+        return list(dict.fromkeys(feature["column"] for feature in self.features))
+
+    @property
+    def version(self):
+        return self.meta.get("version")
+
+    def design(self, frame):
+        """
+        Feature matrix of a batch.
+
+        Args:
+            frame (pd.DataFrame): Records with (at least) the model's columns.
+
+        Returns:
+            np.ndarray: (records, features) float64 matrix.
+
+        Raises:
+            ValueError: If a column is missing or not numeric.
+        """
+        missing = [column for column in self.columns if column not in frame.columns]
+        if missing:
+            raise ValueError(f"missing columns: {', '.join(missing)}")
+
+        values = {column: frame[column].to_numpy(dtype=np.float64) for column in self.columns}
+        X = np.empty((len(frame), len(self.features)), dtype=np.float64)
+        for j, feature in enumerate(self.features):
+            column = values[feature["column"]]
+            X[:, j] = column if "value" not in feature else column == feature["value"]
+        return X
+
+    def score(self, frame):
+        """
+        Returns:
+            np.ndarray: Diagnosis probability of every record (NaN where a value is missing).
+        """
+        z = self.design(frame) @ self.weights + self.intercept
+        # Logistic function without overflow warnings for large |z|
+        return 0.5 * (1.0 + np.tanh(0.5 * z))
+
+    def to_dict(self):
+        return {"features": self.features, "weights": self.weights.tolist(), "intercept": self.intercept,
+                "meta": self.meta}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["features"], data["weights"], data["intercept"], data.get("meta"))
+
+
+def _features(df):
+    features = []
+    for column in df.select_dtypes("number").columns:
+        if column in (TARGET, ID_COLUMN):
+            continue
+        if column in CATEGORICAL_COLUMNS:
+            codes = sorted(df[column].dropna().unique().tolist())
+            features.extend({"column": column, "value": code} for code in codes[1:])
+        else:
+            features.append({"column": column})
+    return features
+
+
+def _auc(scores, labels):
+    # Mann-Whitney statistic, ties counted as one half
+    from correlations import average_ranks
+
+    ranks = average_ranks(scores)
+    positives = labels == 1
+    n_pos, n_neg = int(positives.sum()), int((~positives).sum())
+    if n_pos == 0 or n_neg == 0:
+        return None
+    return float((ranks[positives].sum() - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg))
+
+
+def train(df, ridge=RIDGE, max_iter=50, tol=1e-10):
+    """
+    Fit the model by Newton's method (iteratively reweighted least squares) on
+    standardized features, then fold the standardization into the weights.
+
+    Args:
+        df (pd.DataFrame): Cleaned dataset with the DIAGNOSIS column.
+        ridge (float): L2 penalty on the standardized weights.
+        max_iter (int): Maximum Newton steps.
+        tol (float): Stop when the largest step is below this.
+
+    Returns:
+        LogisticModel: The fitted model.
+    """
+    df = df.dropna()
+    y = df[TARGET].to_numpy(dtype=np.float64)
+    features = _features(df)
+    raw = LogisticModel(features, np.zeros(len(features)), 0.0).design(df)
+
+    mean = raw.mean(axis=0)
+    scale = raw.std(axis=0)
+    scale[scale == 0] = 1.0
+    X = np.column_stack([np.ones(len(raw)), (raw - mean) / scale])
+    penalty = np.full(X.shape[1], ridge)
+    penalty[0] = 0.0
+
+    beta = np.zeros(X.shape[1])
+    for _ in range(max_iter):
+        p = 0.5 * (1.0 + np.tanh(0.5 * (X @ beta)))
+        gradient = X.T @ (y - p) - penalty * beta
+        hessian = (X.T * (p * (1 - p))) @ X + np.diag(penalty)
+        step = np.linalg.solve(hessian, gradient)
+        beta += step
+        if np.abs(step).max() < tol:
+            break
+
+    weights = beta[1:] / scale
+    intercept = beta[0] - float(weights @ mean)
+    model = LogisticModel(features, weights, intercept)
+    p = model.score(df)
+    eps = 1e-12
+    model.meta = {
+        "rows": len(df),
+        "prevalence": float(y.mean()),
+        "log_loss": float(-np.mean(y * np.log(p + eps) + (1 - y) * np.log(1 - p + eps))),
+        "auc": _auc(p, y),
+        "ridge": ridge,
+    }
+    return model
+
+
+def train_from_csv(csv_path=DATA_PATH, model_path=MODEL_PATH):
+    """
+    Train the model on a cleaned CSV and save it.
+
+    Returns:
+        LogisticModel: The saved model; its version is the digest of the CSV.
+    """
+    import pandas as pd
+
+    model = train(pd.read_csv(csv_path))
+    model.meta["version"] = file_digest(csv_path)[:16]
+    atomic_write_json(model_path, model.to_dict())
+    return model
+
+
+def load_model(model_path=MODEL_PATH):
+    """
+    Returns:
+        LogisticModel: The saved model, or None if there is none.
+    """
+    data = read_json(model_path)
+    return LogisticModel.from_dict(data) if isinstance(data, dict) else None
+
+
+def current_model():
+    """
+    The model of this worker, loaded on first use (and trained if it was never saved).
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            _model = load_model()
+            if _model is None:
+                print(f" No risk model at '{MODEL_PATH}', training it from '{DATA_PATH}'.")
+                _model = train_from_csv()
+        return _model
+
+
+# === STREAMING PARSERS ===
+def iter_csv_chunks(stream, columns=None, chunk_rows=CHUNK_ROWS):
+    """
+    Parse a CSV stream in chunks of records with pandas' C parser (no per-row objects).
+
+    Args:
+        stream: Binary file-like object.
+        columns (list): Columns to keep when present (all by default).
+        chunk_rows (int): Records per chunk.
+
+    Yields:
+        pd.DataFrame: Chunks of records.
+    """
+    import pandas as pd
+
+    usecols = None if columns is None else (lambda column: column in columns)
+    try:
+        yield from pd.read_csv(stream, usecols=usecols, chunksize=chunk_rows)
+    except pd.errors.EmptyDataError:
+        return
+
+
+# End of a record followed by the start of the next one (comma for arrays, newline for NDJSON)
+_RECORD_BOUNDARY = re.compile(rb"\}\s*,?\s*(?=\{)")
+
+# Escaped double quote (preceded by an odd number of backslashes)
+_ESCAPED_QUOTE = re.compile(rb'(?<!\\)(?:\\\\)*\\"')
+
+
+def _last_boundary(buffer):
+    # Last record boundary outside a string value: one preceded by an even number of
+    # unescaped quotes (usually the last boundary, so one count over the buffer)
+    for match in reversed(list(_RECORD_BOUNDARY.finditer(buffer))):
+        end = match.start()
+        quotes = buffer.count(b'"', 0, end)
+        if buffer.find(b"\\", 0, end) != -1:
+            quotes -= len(_ESCAPED_QUOTE.findall(buffer, 0, end))
+        if quotes % 2 == 0:
+            return match
+    return None
+
+
+def iter_json_chunks(stream, block_bytes=JSON_BLOCK_BYTES):
+    """
+    Parse a JSON array of flat records, or one record per line, block by block.
+
+    Only the records of one block are decoded at a time: each block is cut after the
+    last complete record outside a string value and decoded with a single orjson call.
+    At most two blocks are carried over when no record ends in a block. Unlike the CSV
+    parser, this builds one Python dict per record (orjson has no columnar output), so
+    the objects alive are bounded by the records of a block, not avoided.
+
+    Yields:
+        pd.DataFrame: Chunks of records.
+
+    Raises:
+        ValueError: If the body is not valid JSON records.
+    """
+    import pandas as pd
+
+    buffer = b""
+    array = None
+    while True:
+        block = stream.read(block_bytes)
+        buffer += block
+        if array is None:
+            buffer = buffer.lstrip()
+            if not buffer:
+                if not block:
+                    return
+                continue
+            array = buffer[:1] == b"["
+            if array:
+                buffer = buffer[1:]
+
+        if block:
+            last = _last_boundary(buffer)
+            if last is None:
+                if len(buffer) > 2 * block_bytes:
+                    raise ValueError("invalid JSON records")
+                continue
+            part, rest = buffer[:last.start() + 1], buffer[last.end():]
+        else:
+            part, rest = buffer.strip(), b""
+            if array:
+                if not part.endswith(b"]"):
+                    raise ValueError("unterminated JSON array")
+                part = part[:-1].rstrip()
+            if not part:
+                return
+
+        if not array:
+            part = re.sub(rb"\}\s*\{", b"},{", part.strip())
+        try:
+            records = orjson.loads(b"[" + part + b"]")
+        except orjson.JSONDecodeError:
+            # Cuts are never inside a string: the records themselves are invalid
+            raise ValueError("invalid JSON records")
+        # Valid JSON that is not made of records (e.g. [1, 2], 5 or null)
+        if not all(isinstance(record, dict) for record in records):
+            raise ValueError("invalid JSON records")
+        buffer = rest
+        yield pd.DataFrame.from_records(records)
+        if not block:
+            return
+
+
+# === SCORING API ===
+def _scored(first, first_scores, chunks, model):
+    # Yields (records, probabilities) for the first chunk, then for each chunk as it is parsed
+    if first is None:
+        return
+    yield first, first_scores
+    for chunk in chunks:
+        yield chunk, model.score(chunk)
+
+
+def _json_body(model, batches):
+    rows = 0
+    separator = b""
+    yield b'{"model":' + orjson.dumps(model.version) + b',"probabilities":['
+    for _, probabilities in batches:
+        if len(probabilities):
+            # NaN is written as null
+            yield separator + orjson.dumps(probabilities, option=orjson.OPT_SERIALIZE_NUMPY)[1:-1]
+            separator = b","
+        rows += len(probabilities)
+    yield b'],"rows":' + str(rows).encode() + b"}"
+
+
+def _csv_body(batches, with_ids):
+    import pandas as pd
+
+    yield (f"{ID_COLUMN},PROBABILITY\n" if with_ids else "PROBABILITY\n").encode()
+    for chunk, probabilities in batches:
+        columns = {"PROBABILITY": probabilities}
+        if with_ids:
+            columns = {ID_COLUMN: chunk[ID_COLUMN].to_numpy(), **columns}
+        out = io.StringIO()
+        pd.DataFrame(columns).to_csv(out, header=False, index=False, float_format="%.6f")
+        yield out.getvalue().encode()
+
+
+def install_scoring_api(server, path=SCORE_PATH, model=None):
+    """
+    Serve POST `path`: diagnosis probabilities of a batch of patient records.
+
+    A CSV body (Content-Type text/csv) gets a CSV response with a PROBABILITY column
+    (after PATIENTID when the records have one); a JSON body gets
+    {"model": version, "probabilities": [...], "rows": n}. Missing values give a null
+    (JSON) or empty (CSV) probability. Errors in the first chunk answer 400.
+
+    Args:
+        server (flask.Flask): The Dash app's server.
+        path (str): Route of the endpoint.
+        model (LogisticModel): Model to serve (default: current_model(), loaded on the
+                               first request).
+    """
+    from flask import Response, jsonify, request, stream_with_context
+
+    @server.route(path, methods=["POST"])
+    def score_patients():
+        scoring_model = model or current_model()
+        is_csv = request.mimetype in ("text/csv", "application/csv")
+        wanted = set(scoring_model.columns) | {ID_COLUMN}
+        chunks = iter_csv_chunks(request.stream, wanted) if is_csv else iter_json_chunks(request.stream)
+
+        # The first chunk is scored before answering, so bad input gets a 400 instead of a cut stream
+        try:
+            first = next(chunks, None)
+            first_scores = scoring_model.score(first) if first is not None else np.empty(0)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        batches = _scored(first, first_scores, chunks, scoring_model)
+        if is_csv:
+            with_ids = first is not None and ID_COLUMN in first.columns
+            return Response(stream_with_context(_csv_body(batches, with_ids)), mimetype="text/csv")
+        return Response(stream_with_context(_json_body(scoring_model, batches)), mimetype="application/json")
+
+    return score_patients
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or run the asthma diagnosis model.")
+    parser.add_argument("command", choices=["train", "status", "score"])
+    parser.add_argument("path", nargs="?", default=DATA_PATH, help="Cleaned CSV (train) or records to score")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        model = train_from_csv(args.path)
+        print(f" Risk model trained on '{args.path}' ({model.meta['rows']} rows, version {model.version}) "
+              f"saved as '{MODEL_PATH}'.")
+        print(f" Log-loss {model.meta['log_loss']:.4f}, AUC {model.meta['auc']:.3f}, "
+              f"{len(model.features)} features.")
+    elif args.command == "status":
+        model = load_model()
+        if model is None:
+            print(f" No risk model at '{MODEL_PATH}'. Run 'python risk_model.py train' first.")
+        else:
+            current = file_digest(DATA_PATH)[:16]
+            state = "up to date" if model.version == current else f"stale (dataset version {current})"
+            print(f" Risk model version {model.version}: {state}")
+            print(orjson.dumps(model.meta, option=orjson.OPT_INDENT_2).decode())
+    else:
+        model = current_model()
+        with open(args.path, "rb") as f:
+            for chunk in iter_csv_chunks(f, set(model.columns) | {ID_COLUMN}):
+                probabilities = model.score(chunk)
+                print(f" {len(chunk)} records, mean probability {np.nanmean(probabilities):.4f}")
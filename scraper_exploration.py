@@ -1,6 +1,8 @@
 import pandas as pd
 import plotly.express as px
 
+from metrics import profiled
+
 # Load data
 def load_data(file_path="table_1_asthma_final_two_columns.csv"):
     df = pd.read_csv(file_path)
@@ -24,6 +26,7 @@ def get_global_values(df):
     return {"deaths": number_of_deaths, "cases": number_of_cases}
 
 # Generate Treemap
+@profiled("generate_treemap")
 def generate_treemap(df, value_col, color_scale, title):
     fig = px.treemap(
         df,
@@ -1,38 +1,60 @@
 import requests
 from bs4 import BeautifulSoup
 
-def fetch_asthma_data():
+from metrics import profiled
+
+# WHO asthma fact sheet
+WHO_URL = "https://www.who.int/news-room/fact-sheets/detail/asthma"
+
+# Seconds to wait for who.int before giving up
+REQUEST_TIMEOUT = 10
+
+# Sections to extract
+SECTIONS = ["Overview", "Impact", "Symptoms", "Causes", "Treatment"]
+
+
+def fetch_asthma_page(url=WHO_URL, etag=None, last_modified=None, timeout=REQUEST_TIMEOUT):
     """
-    Scrapes the WHO asthma fact sheet and extracts relevant sections:
-    - Overview
-    - Impact
-    - Symptoms
-    - Causes
-    - Treatment
+    Download the WHO asthma fact sheet, optionally as a conditional GET.
+
+    Args:
+        url (str): Page URL.
+        etag (str): ETag of the cached copy, sent as If-None-Match.
+        last_modified (str): Last-Modified of the cached copy, sent as If-Modified-Since.
+        timeout (float): Request timeout in seconds.
 
     Returns:
-        dict: A dictionary where keys are section titles and values are cleaned content.
+        requests.Response: The response (status 304 when the cached copy is still current).
     """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
 
-    url = "https://www.who.int/news-room/fact-sheets/detail/asthma"
+    return requests.get(url, headers=headers, timeout=timeout)
 
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f" Failed to retrieve the page. HTTP Status Code: {response.status_code}")
-        return {}
 
+def parse_asthma_sections(html):
+    """
+    Extract the relevant sections from the WHO fact sheet HTML.
+
+    Args:
+        html (bytes or str): Page content.
+
+    Returns:
+        dict: A dictionary where keys are section titles and values are cleaned content.
+    """
     # Parse HTML content
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(html, 'html.parser')
 
-    # Define sections to extract
-    sections = ["Overview", "Impact", "Symptoms", "Causes", "Treatment"]
     extracted_data = {}
 
     # Iterate through <h2> tags to find sections
     for header in soup.find_all('h2'):
         section_title = header.get_text(strip=True)
 
-        if section_title in sections:
+        if section_title in SECTIONS:
             content = []
             sibling = header.find_next_sibling()
 
@@ -55,6 +77,32 @@ def fetch_asthma_data():
 
     return extracted_data
 
+
+@profiled("fetch_asthma_data")
+def fetch_asthma_data():
+    """
+    Scrapes the WHO asthma fact sheet and extracts relevant sections:
+    - Overview
+    - Impact
+    - Symptoms
+    - Causes
+    - Treatment
+
+    Returns:
+        dict: A dictionary where keys are section titles and values are cleaned content.
+    """
+    try:
+        response = fetch_asthma_page()
+    except requests.RequestException as e:
+        print(f" Failed to retrieve the page: {e}")
+        return {}
+
+    if response.status_code != 200:
+        print(f" Failed to retrieve the page. HTTP Status Code: {response.status_code}")
+        return {}
+
+    return parse_asthma_sections(response.content)
+
 if __name__ == "__main__":
     asthma_data = fetch_asthma_data()
 
@@ -0,0 +1,572 @@
+"""
+Optional SQLite backend for the patient dataset.
+
+With ASTHMA_BACKEND=sqlite the workers do not hold the patients in a DataFrame: the
+cleaned CSV is loaded once into an indexed SQLite database next to it, one file per
+dataset version, and the dashboard aggregations are pushed down as GROUP BY queries
+over pooled read-only connections. Worker memory then stays flat as the dataset grows (SQLite reads the
+pages it needs through its own bounded cache and the OS page cache).
+
+A SqlDataset is accepted in place of the DataFrame by count_values,
+explore_risk_factors, create_allergen_exposure_figure, histogram_counts /
+histogram_figure, grouped_box_stats / box_figure, patient_table.patient_page and
+risk_measures.risk_table, with the same results.
+
+    python sql_backend.py build
+"""
+import contextlib
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+import numpy as np
+
+from bitmap_index import normalize_filters
+from file_utils import file_digest, version_kept
+
+# Backend holding the patients in the workers: "pandas" (DataFrame) or "sqlite"
+PATIENT_BACKEND = os.environ.get("ASTHMA_BACKEND", "pandas").lower()
+
+DATA_PATH = "cleaned_asthma_data.csv"
+# Databases are saved as "cleaned_asthma_data.<dataset version>.sqlite" (see database_path)
+DATABASE_PATH = "cleaned_asthma_data.sqlite"
+TABLE = "patients"
+
+# Rows inserted per transaction while building the database
+CHUNK_ROWS = 100_000
+
+# Idle read-only connections kept per database in each worker
+POOL_SIZE = 4
+
+# Page cache of each connection, in KiB
+CACHE_KB = 16 * 1024
+
+# Databases (versions) whose connection pools stay open in a worker
+VERSIONS_KEPT = 2
+
+# Categorical columns indexed together with DIAGNOSIS, so the grouped counts of the
+# asthma patients are answered from the index alone
+INDEXED_COLUMNS = [
+    "GENDER", "ETHNICITY", "EDUCATIONLEVEL", "SMOKING", "FAMILYHISTORYASTHMA", "PETALLERGY",
+    "WHEEZING", "SHORTNESSOFBREATH", "CHESTTIGHTNESS", "COUGHING", "NIGHTTIMESYMPTOMS", "EXERCISEINDUCED",
+]
+
+# (group, value) columns of the box plots: their quartiles are read in index order
+BOX_INDEXES = [("GENDER", "AGE")]
+
+_pools = OrderedDict()
+_pools_lock = threading.Lock()
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _sql_type(series):
+    if series.dtype.kind in "iub":
+        return "INTEGER"
+    if series.dtype.kind == "f":
+        return "REAL"
+    return "TEXT"
+
+
+def _python_value(value):
+    # sqlite3 binds Python scalars only
+    return value.item() if isinstance(value, np.generic) else value
+
+
+# === BUILD ===
+def _source_state(csv_path):
+    stat = os.stat(csv_path)
+    return {"source_size": str(stat.st_size), "source_mtime": repr(stat.st_mtime)}
+
+
+def database_path(version, path=DATABASE_PATH):
+    """
+    Returns:
+        str: File of the database of a dataset version ("<root>.<version>.sqlite").
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{version}{extension}"
+
+
+def _database_versions(path=DATABASE_PATH):
+    # {version: file} of the databases saved next to `path`
+    directory = os.path.dirname(path) or "."
+    root, extension = os.path.splitext(os.path.basename(path))
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return {}
+    return {name[len(root) + 1:len(name) - len(extension)]: os.path.join(directory, name) for name in names
+            if name.startswith(root + ".") and name.endswith(extension) and len(name) > len(root + extension) + 1}
+
+
+def build_database(csv_path=DATA_PATH, path=DATABASE_PATH, chunk_rows=CHUNK_ROWS):
+    """
+    Load a cleaned CSV into a SQLite database, chunk by chunk, and index it.
+
+    The database is saved under the dataset version (see database_path), so a new
+    version never replaces the file that the connections of the previous one read:
+    requests still running on it get its rows until evict_versions() drops it. It is
+    assembled next to the target and moved into place at the end.
+
+    Args:
+        csv_path (str): Cleaned dataset.
+        path (str): Database path the versioned file name derives from.
+        chunk_rows (int): Rows read and inserted at a time (bounds the memory used).
+
+    Returns:
+        dict: The metadata stored in the database (version, rows, source state), plus
+              the file it was saved as ("path").
+    """
+    import pandas as pd
+
+    version = file_digest(csv_path)[:16]
+    source = _source_state(csv_path)
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=parent, prefix=".sqlite-", suffix=".tmp")
+    os.close(fd)
+
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            n_rows = 0
+            columns = None
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+                if columns is None:
+                    columns = list(chunk.columns)
+                    definitions = ", ".join(f"{_quote(c)} {_sql_type(chunk[c])}" for c in columns)
+                    conn.execute(f"CREATE TABLE {TABLE} ({definitions})")
+                    insert = f"INSERT INTO {TABLE} VALUES ({', '.join('?' * len(columns))})"
+                # NaN is stored as NULL, which the aggregates skip like pandas does
+                conn.executemany(insert, chunk.itertuples(index=False, name=None))
+                conn.commit()
+                n_rows += len(chunk)
+
+            for column in INDEXED_COLUMNS:
+                if column in columns:
+                    conn.execute(f"CREATE INDEX {_quote('idx_' + column)} ON {TABLE} (DIAGNOSIS, {_quote(column)})")
+            for group, value in BOX_INDEXES:
+                if group in columns and value in columns:
+                    conn.execute(f"CREATE INDEX {_quote(f'idx_{group}_{value}')} "
+                                 f"ON {TABLE} (DIAGNOSIS, {_quote(group)}, {_quote(value)})")
+            conn.execute(f"CREATE INDEX idx_DIAGNOSIS ON {TABLE} (DIAGNOSIS)")
+
+            meta = {"dataset_version": version, "rows": str(n_rows), **source}
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", meta.items())
+            conn.commit()
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, database_path(version, path))
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    return dict(meta, path=database_path(version, path))
+
+
+def read_meta(path):
+    """
+    Returns:
+        dict: The metadata of a database, or None if there is no valid database at `path`.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+        try:
+            return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+
+def is_fresh(path, csv_path=DATA_PATH):
+    """
+    Check that a database exists and was built from the current CSV (size and mtime).
+    """
+    meta = read_meta(path)
+    if meta is None:
+        return False
+    if not os.path.exists(csv_path):
+        return True
+    return all(meta.get(key) == value for key, value in _source_state(csv_path).items())
+
+
+def find_database(csv_path=DATA_PATH, path=DATABASE_PATH):
+    """
+    Returns:
+        str: The saved database built from the current CSV, or None if there is none.
+    """
+    for file in _database_versions(path).values():
+        if is_fresh(file, csv_path):
+            return file
+    return None
+
+
+# === CONNECTIONS ===
+class ConnectionPool:
+    """
+    Read-only connections to one database, shared by the threads of a worker.
+
+    Connections are opened on demand and up to `size` idle ones are kept. A pool
+    inherited through fork (e.g. gunicorn --preload) starts over in the child, so
+    processes never share a connection.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        conn = sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro", uri=True,
+                               check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA cache_size = -{CACHE_KB}")
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def pool_for(path, version):
+    """
+    Returns:
+        ConnectionPool: The pool of this worker for a database version (the pools of
+                        older versions beyond VERSIONS_KEPT are closed).
+    """
+    with _pools_lock:
+        key = (os.path.abspath(path), version)
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(path)
+            while len(_pools) > VERSIONS_KEPT:
+                _pools.popitem(last=False)[1].close()
+        _pools.move_to_end(key)
+        return pool
+
+
+# === QUERIES ===
+class SqlDataset:
+    """
+    The patient dataset in a SQLite database, answering the dashboard aggregations with
+    queries instead of holding the rows.
+
+    Attributes:
+        path (str): Database file.
+        attrs (dict): {"dataset_version": ...}, like the DataFrames from load_data().
+        columns (list): Column names.
+        types (dict): Column -> declared SQL type.
+    """
+
+    def __init__(self, path):
+        meta = read_meta(path)
+        if meta is None:
+            raise ValueError(f"No SQLite dataset at '{path}'. Run 'python sql_backend.py build' first.")
+        self.path = path
+        self.attrs = {"dataset_version": meta["dataset_version"]}
+        self._rows = int(meta["rows"])
+        self._pool = pool_for(path, meta["dataset_version"])
+        with self._pool.connection() as conn:
+            info = conn.execute(f"PRAGMA table_info({TABLE})").fetchall()
+        self.columns = [row[1] for row in info]
+        self.types = {row[1]: row[2] for row in info}
+
+    def __len__(self):
+        return self._rows
+
+    def _column(self, name):
+        if name not in self.types:
+            raise KeyError(name)
+        return _quote(name)
+
+    def _where(self, filters, *conditions):
+        """
+        Returns:
+            tuple: (WHERE clause or "", parameters) for the filters plus extra conditions.
+        """
+        clauses, params = list(conditions), []
+        for column, value in normalize_filters(filters):
+            name = self._column(column)
+            if isinstance(value, tuple) and value[:1] == ("between",):
+                if value[1] is not None:
+                    clauses.append(f"{name} >= ?")
+                    params.append(_python_value(value[1]))
+                if value[2] is not None:
+                    clauses.append(f"{name} <= ?")
+                    params.append(_python_value(value[2]))
+            elif isinstance(value, tuple):
+                clauses.append(f"{name} IN ({', '.join('?' * len(value))})")
+                params += [_python_value(v) for v in value]
+            else:
+                clauses.append(f"{name} = ?")
+                params.append(_python_value(value))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, sql, params=()):
+        """
+        Returns:
+            list: Rows of a query run on a pooled connection.
+        """
+        with self._pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def value_counts(self, column, filters=None):
+        """
+        Counterpart of df[column].value_counts() on the filtered patients.
+
+        Returns:
+            tuple: (values, counts) arrays, by decreasing count (ties by value).
+        """
+        name = self._column(column)
+        where, params = self._where(filters, f"{name} IS NOT NULL")
+        rows = self.query(f"SELECT {name}, COUNT(*) AS n FROM {TABLE}{where} GROUP BY {name} "
+                          f"ORDER BY n DESC, {name}", params)
+        return np.array([r[0] for r in rows]), np.array([r[1] for r in rows], dtype=np.int64)
+
+    def binary_columns(self):
+        """
+        Returns:
+            list: Numeric columns holding only 0 and 1 (no missing values), in one scan.
+        """
+        numeric = [c for c in self.columns if self.types[c] in ("INTEGER", "REAL")]
+        if not numeric or not self._rows:
+            return []
+        checks = ", ".join(f"SUM(CASE WHEN {self._column(c)} IN (0, 1) THEN 0 ELSE 1 END)" for c in numeric)
+        others = self.query(f"SELECT {checks} FROM {TABLE}")[0]
+        return [c for c, n in zip(numeric, others) if n == 0]
+
+    def pattern_counts(self, columns):
+        """
+        Distinct combinations of some columns and their patient counts (GROUP BY).
+
+        Returns:
+            tuple: ((combinations, columns) int8 array, (combinations,) int64 counts).
+        """
+        names = ", ".join(self._column(c) for c in columns)
+        rows = self.query(f"SELECT {names}, COUNT(*) FROM {TABLE} GROUP BY {names}")
+        patterns = np.array([row[:-1] for row in rows], dtype=np.int8).reshape(len(rows), len(columns))
+        return patterns, np.array([row[-1] for row in rows], dtype=np.int64)
+
+    def group_means(self, columns, group_by, filters=None):
+        """
+        Mean of each column per value of `group_by` (missing values skipped).
+
+        Returns:
+            dict: group value -> {column: mean}.
+        """
+        group = self._column(group_by)
+        averages = ", ".join(f"AVG({self._column(c)})" for c in columns)
+        where, params = self._where(filters)
+        rows = self.query(f"SELECT {group}, {averages} FROM {TABLE}{where} GROUP BY {group}", params)
+        return {row[0]: dict(zip(columns, row[1:])) for row in rows}
+
+    def histogram_counts(self, column, nbins=20, filters=None):
+        """
+        Counterpart of histograms.histogram_counts: the same bins, counted with a
+        GROUP BY on the bin number.
+
+        Returns:
+            tuple: (np.ndarray edges, np.ndarray counts)
+        """
+        from histograms import range_bin_edges
+
+        name = self._column(column)
+        where, params = self._where(filters, f"{name} IS NOT NULL")
+        lo, hi = self.query(f"SELECT MIN({name}), MAX({name}) FROM {TABLE}{where}", params)[0]
+        if lo is None:
+            return np.array([0.0, 1.0]), np.zeros(1, dtype=np.int64)
+
+        edges = range_bin_edges(float(lo), float(hi), self.types[column] == "INTEGER", nbins)
+        start, size, last = float(edges[0]), float(edges[1] - edges[0]), len(edges) - 2
+        rows = self.query(f"SELECT MIN(CAST(({name} - ?) / ? AS INTEGER), ?) AS b, COUNT(*) "
+                          f"FROM {TABLE}{where} GROUP BY b", [start, size, last] + params)
+        counts = np.zeros(last + 1, dtype=np.int64)
+        for b, n in rows:
+            counts[b] = n
+        return edges, counts
+
+    def density_counts(self, x_col, y_col, by, x_range=None, y_range=None, filters=None, width=300, height=200):
+        """
+        Counterpart of density.density_counts, counted with a GROUP BY on the pixel.
+
+        Returns:
+            tuple: (x_range, y_range, np.ndarray groups, np.ndarray counts)
+        """
+        from density import data_range
+
+        x, y, group = self._column(x_col), self._column(y_col), self._column(by)
+        where, params = self._where(filters, f"{x} IS NOT NULL", f"{y} IS NOT NULL")
+        if x_range is None or y_range is None:
+            x_lo, x_hi, y_lo, y_hi = self.query(f"SELECT MIN({x}), MAX({x}), MIN({y}), MAX({y}) "
+                                                f"FROM {TABLE}{where}", params)[0]
+            x_range = x_range if x_range is not None else data_range(x_lo, x_hi)
+            y_range = y_range if y_range is not None else data_range(y_lo, y_hi)
+        x_range, y_range = tuple(x_range), tuple(y_range)
+
+        where, params = self._where(filters, f"{x} BETWEEN ? AND ?", f"{y} BETWEEN ? AND ?")
+        rows = self.query(
+            f"SELECT {group}, MIN(CAST(({x} - ?) * ? AS INTEGER), ?) AS c, MIN(CAST(({y} - ?) * ? AS INTEGER), ?) AS r, "
+            f"COUNT(*) FROM {TABLE}{where} GROUP BY {group}, c, r",
+            [x_range[0], width / (x_range[1] - x_range[0]), width - 1,
+             y_range[0], height / (y_range[1] - y_range[0]), height - 1,
+             *x_range, *y_range] + params)
+        groups = np.array(sorted({row[0] for row in rows}))
+        counts = np.zeros((len(groups), height, width), dtype=np.int64)
+        for g, c, r, n in rows:
+            counts[np.searchsorted(groups, g), r, c] = n
+        return x_range, y_range, groups, counts
+
+    def _value_at(self, name, where, params, position):
+        # Value at a position of the sorted column (read in index order when indexed)
+        return self.query(f"SELECT {name} FROM {TABLE}{where} ORDER BY {name} LIMIT 1 OFFSET ?",
+                          params + [position])[0][0]
+
+    def _percentile(self, name, where, params, n, q):
+        # Linear interpolation, like np.percentile
+        position = q * (n - 1)
+        below = int(np.floor(position))
+        lo = self._value_at(name, where, params, below)
+        if below == position:
+            return float(lo)
+        hi = self._value_at(name, where, params, below + 1)
+        return float(lo + (hi - lo) * (position - below))
+
+    def grouped_box_stats(self, value_col, group_col, filters=None, max_outliers=50):
+        """
+        Counterpart of box_stats.grouped_box_stats: quartiles are read at their
+        positions in the sorted values, the other statistics are aggregates.
+
+        Returns:
+            dict: {group label (str): stats dict}, in sorted group order.
+        """
+        value, group = self._column(value_col), self._column(group_col)
+        where, params = self._where(filters, f"{value} IS NOT NULL")
+        groups = [row[0] for row in self.query(f"SELECT DISTINCT {group} FROM {TABLE}{where}", params)]
+
+        result = {}
+        for g in sorted(groups, key=str):
+            g_where, g_params = self._where(dict(filters or {}, **{group_col: g}), f"{value} IS NOT NULL")
+            n, mean = self.query(f"SELECT COUNT(*), AVG({value}) FROM {TABLE}{g_where}", g_params)[0]
+            squares = self.query(f"SELECT SUM(({value} - ?) * ({value} - ?)) FROM {TABLE}{g_where}",
+                                 [mean, mean] + g_params)[0][0]
+            q1, median, q3 = (self._percentile(value, g_where, g_params, n, q) for q in (0.25, 0.5, 0.75))
+            low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+            lowerfence, upperfence = self.query(
+                f"SELECT MIN(CASE WHEN {value} >= ? THEN {value} END), MAX(CASE WHEN {value} <= ? THEN {value} END) "
+                f"FROM {TABLE}{g_where}", [low, high] + g_params)[0]
+            outliers = np.array([row[0] for row in self.query(
+                f"SELECT {value} FROM {TABLE}{g_where} AND ({value} < ? OR {value} > ?) ORDER BY {value}",
+                g_params + [low, high])], dtype=np.float64)
+            if len(outliers) > max_outliers:
+                outliers = np.random.default_rng(0).choice(outliers, size=max_outliers, replace=False)
+            result[str(g)] = {
+                "n": int(n),
+                "mean": float(mean),
+                "sd": float(np.sqrt(squares / (n - 1))) if n > 1 else 0.0,
+                "q1": q1,
+                "median": median,
+                "q3": q3,
+                "lowerfence": float(lowerfence),
+                "upperfence": float(upperfence),
+                "outliers": sorted(float(v) for v in outliers),
+            }
+        return result
+
+    def page(self, sort_by, ascending, filters, offset, limit):
+        """
+        Counterpart of patient_table.patient_page: ORDER BY ... LIMIT ... OFFSET on the
+        filtered patients (rowid order when sort_by is None), NULLs last in both directions.
+
+        Returns:
+            tuple: (list of row dicts, number of matching patients).
+        """
+        where, params = self._where(filters)
+        total = self.query(f"SELECT COUNT(*) FROM {TABLE}{where}", params)[0][0]
+        direction = "ASC" if ascending else "DESC"
+        order = f"rowid {direction}"
+        if sort_by:
+            order = f"{self._column(sort_by)} {direction} NULLS LAST, {order}"
+        rows = self.query(f"SELECT * FROM {TABLE}{where} ORDER BY {order} LIMIT ? OFFSET ?",
+                          params + [int(limit), int(offset)])
+        return [dict(zip(self.columns, row)) for row in rows], total
+
+
+def open_database(csv_path=DATA_PATH, path=DATABASE_PATH):
+    """
+    Open the SQLite copy of the dataset, building it first when none was built from
+    the current CSV. Call it with dataset_store.BUILD_LOCK held.
+
+    Returns:
+        SqlDataset
+    """
+    file = find_database(csv_path, path)
+    if file is None:
+        meta = build_database(csv_path, path)
+        file = meta["path"]
+        print(f" SQLite copy of '{csv_path}' saved as '{file}' ({meta['rows']} rows).")
+    return SqlDataset(file)
+
+
+def evict_versions(keep, path=DATABASE_PATH):
+    """
+    Close this worker's connections to the databases of dataset versions not in
+    `keep`, and delete their files. Call it with dataset_store.BUILD_LOCK held.
+    """
+    with _pools_lock:
+        for key in [k for k in _pools if not version_kept(k[1], keep)]:
+            _pools.pop(key).close()
+    for version, file in _database_versions(path).items():
+        if not version_kept(version, keep):
+            with contextlib.suppress(OSError):
+                os.remove(file)
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[2] if len(sys.argv) > 2 else DATA_PATH
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        meta = build_database(csv_path)
+        print(f" SQLite copy of '{csv_path}' saved as '{meta['path']}' ({meta['rows']} rows).")
+
+    file = find_database(csv_path)
+    if file is None:
+        print(f" No SQLite dataset built from '{csv_path}'. Run 'python sql_backend.py build' first.")
+    else:
+        meta = read_meta(file)
+        print(f" SQLite dataset '{file}': {meta['rows']} rows, version {meta['dataset_version']}")
@@ -0,0 +1,347 @@
+"""
+Synthetic patient data in the Kaggle schema, at any size.
+
+A PatientModel is fitted on the real file: every column keeps its own distribution
+(category frequencies for flags and codes, such as the DIAGNOSIS rate; a quantile
+function for AGE, BMI, FEV1, FVC...) and the columns are tied together by a Gaussian
+copula, i.e. the correlation matrix of their normal scores. Rows are generated by
+chunks of independent draws, so any number of rows can be streamed to CSV or to the
+columnar format with bounded memory, optionally by several processes.
+
+    python synthetic_data.py --rows 10000000 --out patients_10m.csv
+    python synthetic_data.py --rows 10000000 --template cleaned_asthma_data.csv \\
+        --format columnar --out patients_10m.columnar --workers 4
+"""
+import argparse
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import ColumnarWriter, column_schema, write_rows
+
+RAW_CSV = "data/asthma_disease_data.csv"
+CLEANED_CSV = "cleaned_asthma_data.csv"
+
+# Rows generated per chunk (bounds the memory of each writer process)
+CHUNK_ROWS = 250_000
+
+# Numeric columns with at most this many distinct values are sampled as categories
+MAX_DISCRETE_VALUES = 16
+
+# Resolution of the quantile function of continuous columns
+QUANTILES = 1001
+
+# Synthetic floats are written with 6 decimals (full precision makes to_csv ~1.5x slower)
+FLOAT_FORMAT = "%.6f"
+
+
+# === NORMAL DISTRIBUTION (numpy only) ===
+def _norm_cdf(x):
+    # Abramowitz & Stegun 7.1.26 approximation of erf, absolute error < 1.5e-7
+    z = np.abs(x) / math.sqrt(2)
+    t = 1.0 / (1.0 + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-z * z)
+    return 0.5 * (1.0 + np.sign(x) * erf)
+
+
+def _norm_ppf(p):
+    # Acklam's rational approximation of the inverse normal CDF, relative error < 1.2e-9
+    a = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+         1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+    b = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+         6.680131188771972e+01, -1.328068155288572e+01]
+    c = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+         -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+    d = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00, 3.754408661907416e+00]
+
+    p = np.clip(np.asarray(p, dtype=np.float64), 1e-12, 1 - 1e-12)
+    x = np.empty_like(p)
+    low, high = p < 0.02425, p > 1 - 0.02425
+    mid = ~(low | high)
+
+    q = np.sqrt(-2 * np.log(p[low]))
+    x[low] = (((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+             ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    q = np.sqrt(-2 * np.log(1 - p[high]))
+    x[high] = -(((((c[0] * q + c[1]) * q + c[2]) * q + c[3]) * q + c[4]) * q + c[5]) / \
+              ((((d[0] * q + d[1]) * q + d[2]) * q + d[3]) * q + 1)
+    q = p[mid] - 0.5
+    r = q * q
+    x[mid] = (((((a[0] * r + a[1]) * r + a[2]) * r + a[3]) * r + a[4]) * r + a[5]) * q / \
+             (((((b[0] * r + b[1]) * r + b[2]) * r + b[3]) * r + b[4]) * r + 1)
+    return x
+
+
+# === MODEL ===
+class PatientModel:
+    """
+    Gaussian copula over the patient columns.
+
+    Attributes:
+        columns (list): One dict per column, in schema order, with "name", "kind"
+                        ("id", "constant", "discrete" or "continuous") and its parameters.
+        correlation (np.ndarray): Correlation of the normal scores of the copula columns.
+    """
+
+    def __init__(self, columns, correlation):
+        self.columns = columns
+        self.correlation = correlation
+        self._copula = [c["name"] for c in columns if c["kind"] in ("discrete", "continuous")]
+        self._cholesky = np.linalg.cholesky(correlation) if self._copula else None
+
+    @classmethod
+    def fit(cls, df):
+        """
+        Learn the marginals and the normal-score correlations of a dataset.
+
+        Returns:
+            PatientModel
+        """
+        columns = []
+        scores = []
+        for name in df.columns:
+            series = df[name]
+            present = series.dropna()
+            column = {"name": name, "missing": float(series.isna().mean())}
+
+            if name.upper() == "PATIENTID":
+                column.update(kind="id", start=int(present.min()))
+            elif present.nunique() <= 1:
+                column.update(kind="constant", value=present.iloc[0] if len(present) else None)
+            elif not pd.api.types.is_numeric_dtype(series) or present.nunique() <= MAX_DISCRETE_VALUES:
+                counts = present.value_counts(sort=False).sort_index()
+                column.update(kind="discrete", values=counts.index.tolist(),
+                              cumulative=(counts.cumsum() / counts.sum()).to_numpy().tolist())
+            else:
+                column.update(kind="continuous", integer=bool(pd.api.types.is_integer_dtype(series)),
+                              quantiles=np.quantile(present.to_numpy(dtype=np.float64),
+                                                    np.linspace(0, 1, QUANTILES)).tolist())
+            columns.append(column)
+
+            if column["kind"] in ("discrete", "continuous"):
+                # Normal scores of the mid-ranks (ties share their average rank)
+                ranks = series.rank(method="average").fillna(len(series) / 2).to_numpy()
+                scores.append(_norm_ppf(ranks / (len(series) + 1)))
+
+        correlation = np.corrcoef(np.vstack(scores)) if scores else np.zeros((0, 0))
+        return cls(columns, _nearest_correlation(correlation))
+
+    def sample(self, n_rows, seed=0, first_id=None, columns=None):
+        """
+        Draw n_rows patients.
+
+        Args:
+            n_rows (int): Number of rows.
+            seed: Seed (int or sequence) of the random generator.
+            first_id (int): Id of the first patient (default: the template's first id).
+            columns (list): Return only these columns (the draws stay the same).
+
+        Returns:
+            pd.DataFrame: Rows in the template's schema and column order.
+        """
+        rng = np.random.default_rng(seed)
+        uniforms = {}
+        if self._copula:
+            normals = rng.standard_normal((n_rows, len(self._copula))) @ self._cholesky.T
+            for i, name in enumerate(self._copula):
+                uniforms[name] = np.clip(_norm_cdf(normals[:, i]), 0.0, 1.0 - 1e-12)
+
+        data = {}
+        for column in self.columns:
+            name, kind = column["name"], column["kind"]
+            if columns is not None and name not in columns and kind != "id":
+                if column["missing"] > 0:
+                    rng.random(n_rows)
+                continue
+            if kind == "id":
+                start = column["start"] if first_id is None else first_id
+                data[name] = np.arange(start, start + n_rows, dtype=np.int64)
+            elif kind == "constant":
+                data[name] = np.full(n_rows, column["value"], dtype=object if isinstance(column["value"], str)
+                                     else None)
+            elif kind == "discrete":
+                picks = np.searchsorted(column["cumulative"], uniforms[name], side="right")
+                values = np.asarray(column["values"])
+                data[name] = values[np.minimum(picks, len(values) - 1)]
+            else:
+                values = np.interp(uniforms[name], np.linspace(0, 1, QUANTILES), column["quantiles"])
+                data[name] = np.rint(values).astype(np.int64) if column["integer"] else values
+
+            if column["missing"] > 0 and kind != "id":
+                missing = rng.random(n_rows) < column["missing"]
+                data[name] = pd.Series(data[name]).mask(missing).to_numpy()
+
+        return pd.DataFrame(data)
+
+    def to_dict(self):
+        return {"columns": self.columns, "correlation": self.correlation.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["columns"], np.asarray(data["correlation"], dtype=np.float64))
+
+
+def _nearest_correlation(matrix):
+    # Clip negative eigenvalues (from ties or collinear columns) so Cholesky succeeds
+    if matrix.size == 0:
+        return matrix
+    matrix = np.nan_to_num(matrix)
+    np.fill_diagonal(matrix, 1.0)
+    eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+    fixed = eigenvectors @ np.diag(np.maximum(eigenvalues, 1e-6)) @ eigenvectors.T
+    scale = np.sqrt(np.diag(fixed))
+    return fixed / np.outer(scale, scale)
+
+
+_models = {}
+
+
+def fit_template(template_path=RAW_CSV):
+    """
+    Returns:
+        tuple: (PatientModel fitted on a CSV, a few template rows for the column layout);
+               cached per path.
+    """
+    if template_path not in _models:
+        template = pd.read_csv(template_path)
+        _models[template_path] = (PatientModel.fit(template), template.head(QUANTILES))
+    return _models[template_path]
+
+
+# === STREAMING OUTPUT ===
+def _chunks(n_rows, chunk_rows):
+    return [(i, start, min(chunk_rows, n_rows - start)) for i, start in enumerate(range(0, n_rows, chunk_rows))]
+
+
+def _chunk_frame(model, seed, first_id, chunk):
+    index, start, size = chunk
+    # One generator per chunk: the output does not depend on the number of workers
+    return model.sample(size, seed=[seed, index], first_id=first_id + start)
+
+
+# Worker state, set once per process by the pool initializer
+_worker = {}
+
+
+def _init_worker(model_dict, seed, first_id, target):
+    _worker.update(model=PatientModel.from_dict(model_dict), seed=seed, first_id=first_id, target=target)
+
+
+def _csv_part(chunk):
+    df = _chunk_frame(_worker["model"], _worker["seed"], _worker["first_id"], chunk)
+    path = f"{_worker['target']}.part{chunk[0]:06d}"
+    df.to_csv(path, header=chunk[0] == 0, index=False, float_format=FLOAT_FORMAT)
+    return path
+
+
+def _columnar_part(chunk):
+    directory, schema = _worker["target"]
+    df = _chunk_frame(_worker["model"], _worker["seed"], _worker["first_id"], chunk)
+    write_rows(directory, schema, chunk[1], df)
+    return chunk[2]
+
+
+def generate(out_path, n_rows, template_path=RAW_CSV, fmt="csv", chunk_rows=CHUNK_ROWS, workers=1, seed=0,
+             first_id=None):
+    """
+    Stream n_rows synthetic patients to a CSV file or a columnar dataset.
+
+    The output is assembled next to the target and moved into place at the end. Its
+    content only depends on the seed and chunk size, not on the number of workers.
+
+    Args:
+        out_path (str): Target CSV file or columnar directory.
+        n_rows (int): Number of rows.
+        template_path (str): Real CSV the model is fitted on (raw or cleaned schema).
+        fmt (str): "csv" or "columnar".
+        chunk_rows (int): Rows generated at once by each process.
+        workers (int): Number of generating processes.
+        seed (int): Random seed.
+        first_id (int): Id of the first patient (default: the template's first id).
+
+    Returns:
+        str: out_path
+    """
+    model, template = fit_template(template_path)
+    if first_id is None:
+        first_id = next((c["start"] for c in model.columns if c["kind"] == "id"), 0)
+    chunks = _chunks(n_rows, chunk_rows)
+
+    if fmt == "columnar":
+        schema = column_schema(template)
+        for meta in schema:
+            if meta["name"].upper() == "PATIENTID":
+                meta["dtype"] = np.dtype(np.int32 if first_id + n_rows < 2 ** 31 else np.int64).str
+        writer = ColumnarWriter(out_path, n_rows, schema)
+        try:
+            for _ in _run(chunks, _columnar_part, workers, model, seed, first_id, (writer.directory, schema)):
+                pass
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return out_path
+
+    parent = os.path.dirname(os.path.abspath(out_path))
+    os.makedirs(parent, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=parent, prefix=".synthetic-", suffix=".csv")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            for part in _run(chunks, _csv_part, workers, model, seed, first_id, tmp_path):
+                with open(part, "rb") as f:
+                    shutil.copyfileobj(f, out, length=1 << 20)
+                os.remove(part)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        for leftover in [tmp_path] + [f"{tmp_path}.part{i:06d}" for i, _, _ in chunks]:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    return out_path
+
+
+def _run(chunks, task, workers, model, seed, first_id, target):
+    # Yields the task results in chunk order
+    initargs = (model.to_dict(), seed, first_id, target)
+    if workers <= 1:
+        _init_worker(*initargs)
+        for chunk in chunks:
+            yield task(chunk)
+        return
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=initargs) as pool:
+        yield from pool.imap(task, chunks)
+
+
+def describe(df):
+    """
+    Summary used to compare a synthetic dataset with its template.
+
+    Returns:
+        pd.DataFrame: Mean and standard deviation of every numeric column.
+    """
+    numeric = df.select_dtypes("number")
+    return pd.DataFrame({"mean": numeric.mean(), "std": numeric.std()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--template", default=RAW_CSV, help="CSV to learn from (raw or cleaned schema)")
+    parser.add_argument("--format", choices=["csv", "columnar"], default="csv")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generate(args.out, args.rows, template_path=args.template, fmt=args.format, chunk_rows=args.chunk_rows,
+             workers=args.workers, seed=args.seed)
+    print(f" {args.rows} synthetic rows written to '{args.out}' in {time.perf_counter() - start:.1f} s.")
@@ -0,0 +1,42 @@
+import glob
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILES = ["cleaned_asthma_data.csv", "table_1_asthma_final_two_columns.csv"]
+
+# The modules live at the top of the repository
+sys.path.insert(0, REPO)
+
+
+class AppCopy:
+    """
+    A copy of the app in a temporary directory (the artifacts are keyed on the code and
+    data files by relative path), with its own cache directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        for file in glob.glob(os.path.join(REPO, "*.py")) + [os.path.join(REPO, name) for name in DATA_FILES]:
+            shutil.copy(file, path)
+        shutil.copytree(os.path.join(REPO, "assets"), os.path.join(path, "assets"))
+
+    def run(self, code, timeout=600, **env):
+        """
+        Run Python code in a fresh interpreter in the copy and return its output.
+        """
+        env = dict(os.environ, ASTHMA_CACHE_DIR=os.path.join(self.path, "cache"), ASTHMA_RELOAD_INTERVAL="0", **env)
+        env.setdefault("ASTHMA_BACKEND", "pandas")
+        result = subprocess.run([sys.executable, "-c", code], cwd=self.path, env=env, capture_output=True,
+                                text=True, timeout=timeout)
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+
+@pytest.fixture
+def app_copy(tmp_path):
+    return AppCopy(str(tmp_path))
@@ -0,0 +1,45 @@
+"""
+Box statistics of the slices the figures show are saved in BOX_STATS_DIR and reused by
+the other workers.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+import box_stats
+from box_stats import clear_cache, grouped_box_stats
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cleaned_asthma_data.csv")
+
+
+@pytest.fixture
+def stats_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(box_stats, "BOX_STATS_DIR", str(tmp_path))
+    monkeypatch.setattr(box_stats, "STATS_LOCK", str(tmp_path / ".lock"))
+    clear_cache()
+    yield tmp_path
+    clear_cache()
+
+
+@pytest.fixture
+def df():
+    df = pd.read_csv(DATA_PATH)
+    df.attrs["dataset_version"] = "test-version"
+    return df
+
+
+def test_slice_stats_reused_from_disk(stats_dir, df, monkeypatch):
+    # The demographic box plot of the asthma patients
+    computed = grouped_box_stats(df, "AGE", "GENDER", {"DIAGNOSIS": 1})
+    assert (stats_dir / "test-version.json").exists()
+
+    # Another worker: nothing in memory, and computing again would fail
+    clear_cache()
+    monkeypatch.setattr(box_stats, "box_stats", None)
+    assert grouped_box_stats(df, "AGE", "GENDER", {"DIAGNOSIS": 1}) == computed
+
+
+def test_other_filters_stay_in_memory(stats_dir, df):
+    grouped_box_stats(df, "AGE", "GENDER", {"DIAGNOSIS": 1, "SMOKING": 1})
+    assert not (stats_dir / "test-version.json").exists()
@@ -0,0 +1,35 @@
+"""
+The columnar copy must give back the values of the CSV it was built from.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from columnar_store import append_columnar, load_columnar, write_columnar
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cleaned_asthma_data.csv")
+
+
+def test_round_trip_matches_csv(tmp_path):
+    df = pd.read_csv(DATA_PATH)
+    write_columnar(df, str(tmp_path / "columnar"))
+    loaded = load_columnar(str(tmp_path / "columnar"), mmap=False)
+    for column in df.select_dtypes("number").columns:
+        assert np.array_equal(loaded[column].to_numpy(dtype=np.float64), df[column].to_numpy(dtype=np.float64),
+                              equal_nan=True), column
+    for column in df.select_dtypes(exclude="number").columns:
+        assert loaded[column].astype(str).tolist() == df[column].astype(str).tolist(), column
+
+
+def test_float32_only_when_exact(tmp_path):
+    df = pd.DataFrame({"HALVES": [0.5, 1.25, np.nan], "DIGITS": [15.848744398517509, 1.0, 2.0]})
+    path = str(tmp_path / "columnar")
+    write_columnar(df, path)
+    loaded = load_columnar(path, mmap=False)
+    assert loaded["HALVES"].dtype == np.float32
+    assert loaded["DIGITS"].dtype == np.float64
+
+    # A batch that float32 cannot hold exactly does not fit the layout
+    assert append_columnar(pd.DataFrame({"HALVES": [0.1], "DIGITS": [3.0]}), path) is None
+    assert append_columnar(pd.DataFrame({"HALVES": [0.75], "DIGITS": [0.1]}), path) is not None
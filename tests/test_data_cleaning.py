@@ -0,0 +1,54 @@
+"""
+The streaming cleaning writes the same CSV and counts the same missing values as the
+in-memory one, including duplicates split across chunk boundaries.
+"""
+import numpy as np
+import pandas as pd
+
+from data_cleaning import _add_run, _seen_before, clean_data, clean_data_streaming
+
+
+def _raw_frame():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "PatientID": np.arange(40),
+        "Age": rng.integers(5, 80, 40),
+        "BMI": rng.normal(25, 4, 40),
+        "Doctor": ["Dr_Confid"] * 40,
+    })
+    df.loc[[3, 17, 30], "BMI"] = np.nan
+    df.loc[[8, 25], "Age"] = np.nan
+    # Duplicates inside a chunk, across the boundary at row 7, and of rows with missing values
+    extra = df.iloc[[0, 1, 6, 3, 8, 39, 0]]
+    df = pd.concat([df.iloc[:5], extra.iloc[:2], df.iloc[5:]], ignore_index=True)
+    return pd.concat([df, extra.iloc[2:]], ignore_index=True)
+
+
+def test_streaming_matches_in_memory(tmp_path):
+    raw_path = str(tmp_path / "raw.csv")
+    out_path = str(tmp_path / "cleaned.csv")
+    _raw_frame().to_csv(raw_path, index=False)
+
+    expected = clean_data(pd.read_csv(raw_path))
+    result = clean_data_streaming(raw_path, out_path=out_path, chunk_rows=7)
+
+    assert result["rows_written"] == len(expected)
+    assert result["duplicates"] == result["rows_read"] - len(expected) == 7
+    pd.testing.assert_frame_equal(pd.read_csv(out_path), expected.reset_index(drop=True))
+    pd.testing.assert_series_equal(result["missing"], expected.isnull().sum(), check_names=False)
+
+
+def test_sorted_runs_find_every_hash():
+    rng = np.random.default_rng(1)
+    hashes = rng.choice(2 ** 40, size=5000, replace=False).astype(np.uint64)
+    runs = []
+    for start in range(0, 4000, 250):
+        chunk = hashes[start:start + 250]
+        assert not _seen_before(runs, chunk).any()
+        _add_run(runs, np.sort(chunk))
+
+    assert sum(len(run) for run in runs) == 4000
+    assert all(np.all(np.diff(run.astype(np.int64)) > 0) for run in runs)
+    assert all(len(a) > len(b) for a, b in zip(runs, runs[1:]))
+    assert _seen_before(runs, hashes[:4000]).all()
+    assert not _seen_before(runs, hashes[4000:]).any()
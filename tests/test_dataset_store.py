@@ -0,0 +1,26 @@
+"""
+Reloads of the datasets in a worker.
+"""
+
+RELOAD_GBD_ONLY = """
+import os, threading, time
+from dataset_store import DatasetStore
+
+store = DatasetStore()
+store.load()
+store.on_reload(lambda: store.current().patients())
+gbd = "table_1_asthma_final_two_columns.csv"
+os.utime(gbd, (time.time() + 5, time.time() + 5))
+thread = threading.Thread(target=lambda: print("reloaded:", store.reload()), daemon=True)
+thread.start()
+thread.join(30)
+print("deadlocked:", thread.is_alive())
+"""
+
+
+def test_sqlite_reload_warmers_query_patients(app_copy):
+    # Only the GBD file changed and no patient query ran: the warmers of the new
+    # state read the patients while the reload holds BUILD_LOCK
+    out = app_copy.run(RELOAD_GBD_ONLY, ASTHMA_BACKEND="sqlite").splitlines()
+    assert "deadlocked: False" in out
+    assert "reloaded: True" in out
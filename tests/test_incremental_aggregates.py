@@ -0,0 +1,95 @@
+"""
+The aggregates maintained for appended batches must match a rebuild from the full
+dataset: cube merge, grid histograms and slice versions.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_cube import DataCube
+from histograms import bin_edges
+from incremental_aggregates import HISTOGRAM_COLUMNS, SLICE_COLUMN, MaintainedAggregates
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cleaned_asthma_data.csv")
+
+
+@pytest.fixture(scope="module")
+def df():
+    return pd.read_csv(DATA_PATH)
+
+
+def assert_same_cube(merged, built):
+    assert merged.dims == built.dims
+    for dim in built.dims:
+        np.testing.assert_array_equal(merged.values[dim], built.values[dim])
+    np.testing.assert_array_equal(merged.counts, built.counts)
+    assert set(merged.means) == set(built.means)
+    for measure in built.means:
+        np.testing.assert_allclose(merged.means[measure], built.means[measure], rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(merged.m2[measure], built.m2[measure], rtol=1e-9, atol=1e-6)
+
+
+def test_cube_merge_matches_build(df):
+    # Both parts share cells, and the second brings an ETHNICITY value the first lacks
+    in_head = (df["ETHNICITY"] < 3) & (np.arange(len(df)) % 2 == 0)
+    head, tail = df[in_head], df[~in_head]
+    merged = DataCube.build(head).merge(DataCube.build(tail))
+    built = DataCube.build(df)
+    assert_same_cube(merged, built)
+
+    filters = {"GENDER": 1, "SMOKING": 0}
+    for measure in ["BMI", "LUNGFUNCTIONFEV1"]:
+        assert merged.mean(measure, ["DIAGNOSIS"], filters) == pytest.approx(built.mean(measure, ["DIAGNOSIS"], filters))
+        assert merged.variance(measure, ["DIAGNOSIS"], filters) == pytest.approx(
+            built.variance(measure, ["DIAGNOSIS"], filters))
+
+
+def test_append_matches_rebuild(df):
+    split = len(df) * 3 // 4
+    aggregates = MaintainedAggregates.build(df.iloc[:split])
+    assert aggregates.append(df.iloc[split:].reset_index(drop=True), "appended") is not None
+    rebuilt = MaintainedAggregates.build(df)
+
+    assert aggregates.rows == len(df)
+    assert_same_cube(aggregates.cube, rebuilt.cube)
+    assert set(aggregates.histograms) == set(rebuilt.histograms)
+    for column, histogram in rebuilt.histograms.items():
+        for nbins in (10, 20, 30):
+            for slices in (None, [0], [1]):
+                expected = histogram.histogram(nbins, slices)
+                edges, counts = aggregates.histograms[column].histogram(nbins, slices)
+                np.testing.assert_allclose(edges, expected[0])
+                np.testing.assert_array_equal(counts, expected[1])
+
+
+@pytest.mark.parametrize("column", HISTOGRAM_COLUMNS)
+def test_grid_histogram_matches_scan(df, column):
+    histogram = MaintainedAggregates.build(df).histograms[column]
+    for nbins in (10, 20, 30):
+        for slices in (None, [1]):
+            values = df[column].to_numpy() if slices is None else df.loc[df[SLICE_COLUMN].isin(slices), column].to_numpy()
+            values = values[np.isfinite(values)]
+            edges = bin_edges(values, nbins)
+            result = histogram.histogram(nbins, slices)
+            assert result is not None
+            np.testing.assert_allclose(result[0], edges)
+            np.testing.assert_array_equal(result[1], np.histogram(values, bins=edges)[0])
+
+
+def test_append_changes_only_touched_slice(df):
+    df = df.copy()
+    df.attrs["dataset_version"] = "base"
+    aggregates = MaintainedAggregates.build(df)
+    before = dict(aggregates.slice_versions)
+
+    batch = df[df[SLICE_COLUMN] == 0].head(10).reset_index(drop=True)
+    assert aggregates.append(batch, "next") == ["0"]
+    assert aggregates.slice_versions["1"] == before["1"]
+    assert aggregates.slice_versions["0"] != before["0"]
+
+    # The same rows appended to the same version give the same slice version
+    again = MaintainedAggregates.build(df)
+    again.append(batch, "next")
+    assert again.slice_versions == aggregates.slice_versions
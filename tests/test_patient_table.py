@@ -0,0 +1,46 @@
+"""
+Pages of the Patients tab must come out in the same order from the DataFrame and the
+SQLite backends, missing values included.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from patient_table import patient_page
+from sql_backend import SqlDataset, build_database
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cleaned_asthma_data.csv")
+
+
+@pytest.fixture(scope="module")
+def datasets(tmp_path_factory):
+    df = pd.read_csv(DATA_PATH, nrows=300)
+    # Missing values spread over the rows, and ties among the others
+    df.loc[np.arange(len(df)) % 7 == 3, "BMI"] = np.nan
+    df["BMI"] = df["BMI"].round(0)
+    directory = tmp_path_factory.mktemp("patients")
+    csv_path = str(directory / "patients.csv")
+    df.to_csv(csv_path, index=False)
+    meta = build_database(csv_path, str(directory / "patients.sqlite"))
+    return pd.read_csv(csv_path), SqlDataset(meta["path"])
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+@pytest.mark.parametrize("filters", [None, {"DIAGNOSIS": 0}])
+def test_pages_match_sqlite(datasets, ascending, filters):
+    df, database = datasets
+    for page in range(0, 14):
+        rows, total = patient_page(df, "BMI", ascending, filters, page, page_size=25)
+        sql_rows, sql_total = patient_page(database, "BMI", ascending, filters, page, page_size=25)
+        assert total == sql_total
+        assert [row["PATIENTID"] for row in rows] == [row["PATIENTID"] for row in sql_rows]
+
+
+def test_descending_keeps_missing_values_last(datasets):
+    df, _ = datasets
+    rows, total = patient_page(df, "BMI", False, None, 0, page_size=len(df))
+    present = df["BMI"].notna().sum()
+    assert all(not pd.isna(row["BMI"]) for row in rows[:present])
+    assert all(pd.isna(row["BMI"]) for row in rows[present:])
@@ -0,0 +1,48 @@
+"""
+Parsing and scoring of the record batches posted to the scoring API.
+"""
+import io
+import os
+
+import flask
+import orjson
+import pandas as pd
+import pytest
+
+from risk_model import SCORE_PATH, install_scoring_api, iter_json_chunks, train
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cleaned_asthma_data.csv")
+
+
+@pytest.fixture(scope="module")
+def df():
+    return pd.read_csv(DATA_PATH)
+
+
+@pytest.fixture(scope="module")
+def client(df):
+    server = flask.Flask(__name__)
+    install_scoring_api(server, model=train(df))
+    return server.test_client()
+
+
+def test_json_chunks_match_records(df):
+    records = df.head(500).to_dict("records")
+    body = orjson.dumps(records, option=orjson.OPT_SERIALIZE_NUMPY)
+    chunks = list(iter_json_chunks(io.BytesIO(body), block_bytes=4096))
+    assert len(chunks) > 1
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), df.head(500), check_dtype=False)
+
+
+@pytest.mark.parametrize("body", [b"[1, 2]", b"5", b"null", b'["a"]', b'[{"AGE": 30}, 7]', b'{"AGE": 30'])
+def test_invalid_json_answers_400(client, body):
+    response = client.post(SCORE_PATH, data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert response.get_json()["error"]
+
+
+def test_json_scores(client, df):
+    body = orjson.dumps(df.head(10).to_dict("records"), option=orjson.OPT_SERIALIZE_NUMPY)
+    response = client.post(SCORE_PATH, data=body, content_type="application/json")
+    assert response.status_code == 200
+    assert response.get_json()["rows"] == 10
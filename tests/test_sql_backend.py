@@ -0,0 +1,120 @@
+"""
+The SQLite backend: versioned database files, and the same answers as the pandas
+functions.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sql_backend
+from bitmap_index import filter_mask
+from box_stats import MAX_OUTLIERS, grouped_box_stats
+from density import density_counts
+from histograms import histogram_counts
+from sql_backend import TABLE, SqlDataset, build_database, open_database
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cleaned_asthma_data.csv")
+
+
+def test_reload_keeps_previous_version_file(tmp_path):
+    csv_path = str(tmp_path / "patients.csv")
+    path = str(tmp_path / "patients.sqlite")
+    df = pd.read_csv(DATA_PATH, nrows=100)
+    df.to_csv(csv_path, index=False)
+    old = open_database(csv_path, path)
+
+    df.iloc[:60].to_csv(csv_path, index=False)
+    new = open_database(csv_path, path)
+    assert new.path != old.path
+    assert len(new) == 60
+
+    # A connection opened by the previous version after the reload reads its own rows
+    old._pool.close()
+    assert old.query(f"SELECT COUNT(*) FROM {TABLE}")[0][0] == 100
+
+    sql_backend.evict_versions({new.attrs["dataset_version"]}, path)
+    assert not os.path.exists(old.path)
+    assert new.query(f"SELECT COUNT(*) FROM {TABLE}")[0][0] == 60
+    assert open_database(csv_path, path).path == new.path
+
+
+# No filter, an equality, and a membership with ranges on an integer and a float column
+FILTERS = [None, {"DIAGNOSIS": 1}, {"GENDER": [0], "AGE": {"min": 20, "max": 60}, "BMI": {"max": 30.5}}]
+
+
+@pytest.fixture(scope="module")
+def datasets(tmp_path_factory):
+    # The pandas side has no dataset_version, so nothing is answered from a cache
+    df = pd.read_csv(DATA_PATH)
+    meta = build_database(DATA_PATH, str(tmp_path_factory.mktemp("sql") / "patients.sqlite"))
+    return df, SqlDataset(meta["path"])
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_value_counts(datasets, filters):
+    df, sql = datasets
+    values, counts = sql.value_counts("ETHNICITY", filters)
+    expected = df.loc[filter_mask(df, filters), "ETHNICITY"].value_counts()
+    assert dict(zip(values.tolist(), counts.tolist())) == expected.to_dict()
+    assert list(counts) == sorted(counts, reverse=True)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_group_means(datasets, filters):
+    df, sql = datasets
+    columns = ["PETALLERGY", "POLLENEXPOSURE", "DUSTEXPOSURE"]
+    means = sql.group_means(columns, "DIAGNOSIS", filters)
+    expected = df[filter_mask(df, filters)].groupby("DIAGNOSIS")[columns].mean()
+    assert sorted(means) == expected.index.tolist()
+    for group, row in expected.iterrows():
+        np.testing.assert_allclose([means[group][c] for c in columns], row.to_numpy(), rtol=1e-12)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("column", ["AGE", "BMI"])
+def test_histogram_counts(datasets, column, filters):
+    df, sql = datasets
+    edges, counts = sql.histogram_counts(column, 30, filters)
+    expected_edges, expected_counts = histogram_counts(df, column, 30, filters)
+    np.testing.assert_allclose(edges, expected_edges)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("window", [(None, None), ((20.0, 60.0), (18.0, 30.0))])
+def test_density_counts(datasets, window, filters):
+    df, sql = datasets
+    x_range, y_range, groups, counts = sql.density_counts("AGE", "BMI", "DIAGNOSIS", *window, filters)
+    expected = density_counts(df, "AGE", "BMI", "DIAGNOSIS", *window, filters)
+    np.testing.assert_allclose(x_range + y_range, expected[0] + expected[1])
+    np.testing.assert_array_equal(groups, expected[2])
+    np.testing.assert_array_equal(counts, expected[3])
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_grouped_box_stats(datasets, filters):
+    df, sql = datasets
+    stats = sql.grouped_box_stats("BMI", "GENDER", filters)
+    expected = grouped_box_stats(df, "BMI", "GENDER", filters)
+    assert list(stats) == list(expected)
+    for group, group_stats in expected.items():
+        for name, value in group_stats.items():
+            np.testing.assert_allclose(stats[group][name], value, rtol=1e-12, err_msg=f"{group} {name}")
+
+
+def test_grouped_box_stats_outlier_sample(tmp_path):
+    # More outliers than MAX_OUTLIERS, in row order: both backends keep the same sample
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"DIAGNOSIS": rng.integers(0, 2, 3000), "SPREAD": rng.standard_cauchy(3000)})
+    csv_path = str(tmp_path / "patients.csv")
+    df.to_csv(csv_path, index=False)
+    df = pd.read_csv(csv_path)
+    sql = SqlDataset(build_database(csv_path, str(tmp_path / "patients.sqlite"))["path"])
+
+    stats = sql.grouped_box_stats("SPREAD", "DIAGNOSIS")
+    expected = grouped_box_stats(df, "SPREAD", "DIAGNOSIS")
+    for group, group_stats in expected.items():
+        assert len(group_stats["outliers"]) == MAX_OUTLIERS
+        assert stats[group]["outliers"] == group_stats["outliers"]
@@ -0,0 +1,14 @@
+"""
+A worker started with prebuilt artifacts and warm caches must not import pandas: the
+figures come from the artifacts and the caches, and the patients are only loaded by the
+callbacks that need them.
+"""
+
+
+def test_import_app_without_pandas(app_copy):
+    app_copy.run("from figure_artifacts import build_artifacts; build_artifacts()")
+    # The first start warms the figure and page caches from the patients
+    app_copy.run("import app")
+
+    out = app_copy.run("import sys, app; print('pandas imported:', 'pandas' in sys.modules)")
+    assert "pandas imported: False" in out.splitlines()